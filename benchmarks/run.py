@@ -0,0 +1,230 @@
+"""offline benchmarks of diffbotpy against local stub server
+
+    python -m benchmarks.run --save baseline.json
+    python -m benchmarks.run --compare baseline.json
+
+Each benchmark reports throughput (calls or objects per second), latency percentiles and
+peak traced memory. --compare fails if a metric is worse than the baseline by more than --tolerance.
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from unittest import mock
+
+import diffbot
+from diffbot import const
+from diffbot.meta import _with_token
+from diffbot.urlstream import FormBody
+from tests.stub_server import StubServer
+
+BENCHMARKS = {}
+
+# metrics where smaller is better, others (throughput) are larger is better
+LOWER_IS_BETTER = ("p50", "p95", "p99", "peak_memory_mb", "seconds", "wire_ratio", "compose_us", "template_us",
+                   "plain_p50", "plain_p95", "plain_p99", "hedged_p50", "hedged_p95", "hedged_p99")
+# differences below these are noise, whatever the ratio
+ABSOLUTE_NOISE = {"peak_memory_mb": 1.0}
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__[len("bench_"):]] = func
+    return func
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    return {
+        "p50": samples[int(len(samples) * 0.50)],
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+    }
+
+
+def _measure(func):
+    """run func under tracemalloc, return (result, seconds, peak MB)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func()
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak / 2 ** 20
+
+
+@benchmark
+def bench_single_fetch(server, scale):
+    n = 200 * scale
+    latencies = []
+    with diffbot.SingleFetcher("token") as fetcher:
+
+        def run():
+            for i in range(n):
+                start = time.perf_counter()
+                fetcher.fetch_article_extractors("http://example.com/{}".format(i))
+                latencies.append(time.perf_counter() - start)
+
+        _, seconds, peak = _measure(run)
+    return {"calls_per_second": n / seconds, "seconds": seconds, "peak_memory_mb": peak, **_percentiles(latencies)}
+
+
+@benchmark
+def bench_hedged_fetch(server, scale):
+    """single fetches against a stub answering 3% of calls 0.3s late, with and without HedgePolicy"""
+    n = 200 * scale
+    results = {}
+    for name, policy in (("plain", None), ("hedged", diffbot.HedgePolicy(budget=0.1, initial_delay=0.05))):
+        rand = random.Random(0)
+        server.latency = lambda: 0.3 if rand.random() < 0.03 else 0.002
+        latencies = []
+        with diffbot.SingleFetcher("token", hedge_policy=policy) as fetcher:
+            for i in range(n):
+                start = time.perf_counter()
+                fetcher.fetch_article_extractors("http://example.com/{}".format(i))
+                latencies.append(time.perf_counter() - start)
+        results.update({"{}_{}".format(name, key): value for key, value in _percentiles(latencies).items()})
+    results.update({key: value for key, value in policy.stats().items() if key in ("hedged", "won")})
+    policy.close()
+    return results
+
+
+@benchmark
+def bench_fan_out(server, scale):
+    n = 1000 * scale
+    urls = ("http://example.com/{}".format(i) for i in range(n))
+    with diffbot.SingleFetcher("token", pool_size=16) as fetcher:
+        results, seconds, peak = _measure(lambda: sum(1 for _ in fetcher.fetch_many("article", urls, max_workers=16)))
+    assert results == n
+    return {"calls_per_second": n / seconds, "seconds": seconds, "peak_memory_mb": peak}
+
+
+@benchmark
+def bench_bulk_data(server, scale):
+    n = 5000 * scale
+    server.add_generated_job("bench", n)
+    with diffbot.BulkJobOperator("token", "bench") as operator:
+        count, seconds, peak = _measure(lambda: sum(1 for _ in operator.lazy_fetch_extractors()))
+        transfer = operator.transfer_stats()
+    assert count == n
+    return {"objects_per_second": n / seconds, "seconds": seconds, "peak_memory_mb": peak, "wire_ratio": transfer["ratio"]}
+
+
+@benchmark
+def bench_search_paging(server, scale):
+    server.search_hits = 2000 * scale
+    with diffbot.Searcher("token", "bench") as searcher:
+        count, seconds, peak = _measure(lambda: sum(1 for _ in searcher.iter_search("type:article", 100, prefetch=2)))
+    assert count == server.search_hits
+    return {"objects_per_second": count / seconds, "seconds": seconds, "peak_memory_mb": peak}
+
+
+@benchmark
+def bench_bulk_submit(server, scale):
+    """encode form body of bulk job of URLs from a generator, as requests sends it, deduplicated by BloomFilter"""
+    n = 50000 * scale
+    urls = ("http://example.com/{}/{}".format(i % 1000, i) for i in range(n))
+    body = FormBody({"name": "bench", "apiUrl": "http://api", "token": "token"}, "urls", urls,
+                    normalize=True, dedupe=diffbot.BloomFilter(n))
+    size, seconds, peak = _measure(lambda: sum(len(chunk) for chunk in body))
+    assert body.count > n * 0.999    # a few false positives of BloomFilter are skipped
+    return {"urls_per_second": n / seconds, "seconds": seconds, "peak_memory_mb": peak, "body_mb": size / 2 ** 20}
+
+
+@benchmark
+def bench_query_building(server, scale):
+    """CPU microseconds per call to build the query string, composed from dicts vs by RequestTemplate"""
+    n = 20000 * scale
+    urls = ["http://example.com/{}?page={}".format(i, i % 7) for i in range(n)]
+    args = diffbot.SingleFetcher.generate_article_args(fields="title,text,links", paging=False, timeout=30000)
+    with diffbot.SingleFetcher("token") as fetcher:
+        template = fetcher.prepare("article", args=args)
+
+        def compose():
+            for target_url in urls:
+                _with_token(fetcher._compose_query(target_url, args=args), fetcher.token)
+
+        def prepared():
+            for target_url in urls:
+                _with_token(template.encode_query(target_url), fetcher.token)
+
+        compose_seconds = min(_cpu_seconds(compose) for _ in range(3))
+        template_seconds = min(_cpu_seconds(prepared) for _ in range(3))
+    return {
+        "compose_us": compose_seconds / n * 1e6,
+        "template_us": template_seconds / n * 1e6,
+        "saved_us": (compose_seconds - template_seconds) / n * 1e6,
+    }
+
+
+def _cpu_seconds(func):
+    start = time.process_time()
+    func()
+    return time.process_time() - start
+
+
+def run(names, *, latency=0.0, payload_size=2000, scale=1, compress=False):
+    results = {}
+    for name in names:
+        with StubServer(latency=latency, payload_size=payload_size, record_requests=False) as server:
+            server.compress = compress
+            with mock.patch.object(const, "diffbot_url", server.url):
+                results[name] = BENCHMARKS[name](server, scale)
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"latency": latency, "payload_size": payload_size, "scale": scale, "compress": compress},
+        "results": results,
+    }
+
+
+def compare(current, baseline, tolerance):
+    """return list of regressions of current against baseline"""
+    regressions = []
+    for name, metrics in current["results"].items():
+        for metric, value in metrics.items():
+            base = baseline["results"].get(name, {}).get(metric)
+            if not base or abs(value - base) < ABSOLUTE_NOISE.get(metric, 0):
+                continue
+            change = value / base - 1
+            worse = change > tolerance if metric in LOWER_IS_BETTER else change < -tolerance
+            if worse:
+                regressions.append("{}.{}: {:.4g} -> {:.4g} ({:+.1%})".format(name, metric, base, value, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("names", nargs="*", default=sorted(BENCHMARKS), help="benchmarks to run: " + ", ".join(sorted(BENCHMARKS)))
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds of stub server latency")
+    parser.add_argument("--payload-size", type=int, default=2000, help="length of html/text of each object")
+    parser.add_argument("--scale", type=int, default=1, help="multiplier of number of calls and objects")
+    parser.add_argument("--compress", action="store_true", help="gzip responses of stub server")
+    parser.add_argument("--save", help="write results as JSON to this path")
+    parser.add_argument("--compare", help="baseline JSON to compare results with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args(argv)
+
+    current = run(args.names, latency=args.latency, payload_size=args.payload_size, scale=args.scale,
+                  compress=args.compress)
+    for name, metrics in current["results"].items():
+        print("{:16} {}".format(name, "  ".join("{}={:.4g}".format(key, value) for key, value in sorted(metrics.items()))))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(current, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,2 +1,18 @@
 __all__ = ["diffbot", "settings"]
 from .diffbot import *
+from .template import RequestTemplate
+from .urlstream import BloomFilter, normalize_url
+from .aio import AsyncClient, AsyncSingleFetcher, AsyncSearcher
+from .ratelimit import RateLimiter, TokenBucket
+from .retry import RetryPolicy
+from .hedge import HedgePolicy
+from .cache import MemoryCache, SqliteCache
+from .singleflight import SingleFlight, AsyncSingleFlight
+from .jobs import JobStatusCache, wait_for_jobs
+from .shard import ShardedBulkJob
+from .delta import DeltaIndex
+from .localindex import LocalIndex
+from .pipeline import Pipeline
+from .webhook import WebhookReceiver, JobNotification
+from .tokenpool import TokenPool
+from .metrics import CallEvent, HistogramCollector, to_prometheus
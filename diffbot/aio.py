@@ -0,0 +1,156 @@
+import asyncio
+import urllib.parse
+from .meta import Client
+from .diffbot import SingleFetcher, Searcher, select_extractor
+from .cache import make_cache_key
+from .error import DiffbotUnexpectedBodyError
+from .jsonlib import get_json_decoder
+
+try:
+    import aiohttp
+except ImportError:    # aiohttp is optional, see extras_require["async"] in setup.py
+    aiohttp = None
+
+"""this file contains asyncio version of SingleFetcher and Searcher.
+Queries are composed by the same code as the synchronous clients, only transport differs.
+"""
+
+
+class AsyncClient():
+    """base class of asyncio diffbot API wrapper.
+    At most max_concurrency requests are in flight at once, the others wait on a semaphore.
+    """
+
+    def __init__(self, token, *, max_concurrency=100, connect_timeout=None, read_timeout=None, session=None, json_decoder=None):
+        if aiohttp is None:
+            raise ImportError("aiohttp is required for asyncio clients, install diffbotpy[async]")
+        self.token = token
+        self.json_loads = get_json_decoder(json_decoder)
+        self.max_concurrency = max_concurrency
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self._own_session = session is None
+        self.session = session
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """close pooled connections, unless the session was given by caller"""
+        if self._own_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _get_session(self):
+        # aiohttp session must be created inside running event loop
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self.session
+
+    async def _fetch_raw_data(self, api_type, *, query=None, headers=None):
+        query = {**(query or {}), "token": self.token}
+        url = "{}?{}".format(Client._get_end_point(api_type), urllib.parse.urlencode(query))
+
+        session = self._get_session()
+        async with self._semaphore:
+            async with session.get(url, headers=headers or {}) as response:
+                body = await response.read()
+        try:
+            response_data = self.json_loads(body)
+        except ValueError as e:
+            raise DiffbotUnexpectedBodyError(body.decode("utf-8", "replace"), raw=e)
+        return Client._check_response(response_data)
+
+
+class AsyncSingleFetcher(AsyncClient):
+    """asyncio version of SingleFetcher
+    To share one request among concurrent identical calls, pass diffbot.AsyncSingleFlight as single_flight.
+    """
+
+    _compose_query = SingleFetcher._compose_query
+
+    generate_analyze_args = staticmethod(SingleFetcher.generate_analyze_args)
+    generate_article_args = staticmethod(SingleFetcher.generate_article_args)
+    generate_discussion_args = staticmethod(SingleFetcher.generate_discussion_args)
+    generate_image_args = staticmethod(SingleFetcher.generate_image_args)
+    generate_product_args = staticmethod(SingleFetcher.generate_product_args)
+    generate_video_args = staticmethod(SingleFetcher.generate_video_args)
+
+    def __init__(self, token, *, single_flight=None, **kwargs):
+        super().__init__(token, **kwargs)
+        self.single_flight = single_flight
+
+    async def _fetch_extractors(self, api_type, target_url, args=None, headers=None):
+        data = await self.fetch_raw_data(
+            api_type=api_type,
+            target_url=target_url,
+            args=args,
+            headers=headers,
+        )
+        Extractor = select_extractor(api_type)
+        return [Extractor(datum) for datum in data["objects"]]
+
+    async def fetch_article_extractors(self, target_url, *, args=None, headers=None):
+        return await self._fetch_extractors("article", target_url, args=args, headers=headers)
+
+    async def fetch_analyze_extractors(self, target_url, *, args=None, headers=None):
+        data = await self.fetch_raw_data("analyze", target_url, args=args, headers=headers)
+        Extractor = select_extractor("analyze")
+        return [Extractor(data)]
+
+    async def fetch_discussion_extractors(self, target_url, *, args=None, headers=None):
+        return await self._fetch_extractors("discussion", target_url, args=args, headers=headers)
+
+    async def fetch_image_extractors(self, target_url, *, args=None, headers=None):
+        return await self._fetch_extractors("image", target_url, args=args, headers=headers)
+
+    async def fetch_product_extractors(self, target_url, *, args=None, headers=None):
+        return await self._fetch_extractors("product", target_url, args=args, headers=headers)
+
+    async def fetch_video_extractors(self, target_url, *, args=None, headers=None):
+        return await self._fetch_extractors("video", target_url, args=args, headers=headers)
+
+    async def fetch_raw_data(self, api_type, target_url, *, args=None, headers=None):
+        """fetch raw data in ${api_type} API"""
+        args = args or {}
+        headers = headers or {}
+        query = self._compose_query(target_url, args=args)
+
+        def fetch():
+            return self._fetch_raw_data(api_type=api_type, query=query, headers=headers)
+
+        if self.single_flight is None:
+            return await fetch()
+        return await self.single_flight.do(make_cache_key(api_type, query, headers), fetch)
+
+
+class AsyncSearcher(AsyncClient):
+    """asyncio version of Searcher"""
+
+    _compose_query = Searcher._compose_query
+    generate_args = staticmethod(Searcher.generate_args)
+
+    def __init__(self, token, job_name, **kwargs):
+        super().__init__(token, **kwargs)
+        self.job_name = job_name
+
+    async def fetch_search_extractors(self, *, query, args=None):
+        data = await self.fetch_raw_data(query, args=args)
+        return [select_extractor(datum["type"])(datum) for datum in data["objects"]]
+
+    async def fetch_raw_data(self, query, *, args=None):
+        """using search API, search data with query"""
+        args = args or {}
+        return await self._fetch_raw_data(
+            api_type="search",
+            query=self._compose_query(
+                query=query,
+                args=args
+            )
+        )
@@ -0,0 +1,156 @@
+import collections
+from abc import ABCMeta, abstractmethod
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from .sqlitedb import ThreadConnections
+
+"""this file contains response caches of SingleFetcher.
+Both caches map key made by make_cache_key to decoded response data.
+"""
+
+
+def make_cache_key(api_type, query, headers=None):
+    """canonical key of request, independent from token and order of query and headers.
+    headers (e.g. X-Forward-*) change the response, so they are part of the key.
+    """
+    params = sorted((str(key), str(value)) for key, value in query.items() if key != "token")
+    request = [api_type, params]
+    if headers:
+        # header names are case-insensitive. Without headers, keys stay those of earlier caches
+        request.append(sorted((str(key).lower(), str(value)) for key, value in headers.items()))
+    canonical = json.dumps(request, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class Cache(metaclass=ABCMeta):
+    """base class of response cache"""
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @abstractmethod
+    def get(self, key):
+        """return cached data or None"""
+        pass
+
+    @abstractmethod
+    def set(self, key, data):
+        pass
+
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class MemoryCache(Cache):
+    """in-process LRU cache, whose entries expire ttl seconds after set.
+    Data is kept as JSON and decoded on each hit, so a caller mutating it does not change the cache.
+    """
+
+    def __init__(self, maxsize=1024, *, ttl=None, clock=time.monotonic):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is not None and entry[0] <= self._clock():
+                del self._entries[key]
+                self._count("evictions")
+                entry = None
+            if entry is None:
+                self._count("misses")
+                return None
+            self._entries.move_to_end(key)
+        self._count("hits")
+        return json.loads(entry[1])
+
+    def set(self, key, data):
+        expires = self._clock() + self.ttl if self.ttl is not None else None
+        body = json.dumps(data, separators=(",", ":"))
+        with self._lock:
+            self._entries[key] = (expires, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._count("evictions")
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteCache(Cache):
+    """on-disk cache in sqlite database, whose entries expire ttl seconds after set.
+    Data is stored as zlib compressed JSON. The database is opened in WAL mode,
+    so several threads and worker processes can share one file.
+    Statistics are counted per process.
+    """
+
+    def __init__(self, path, *, ttl=None, timeout=30.0, clock=time.time):
+        super().__init__()
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        self.timeout = timeout
+        self._clock = clock
+        self._connections = ThreadConnections(self.path, timeout=timeout)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, expires REAL, data BLOB)")
+
+    def _connect(self):
+        return self._connections.get()
+
+    def close(self):
+        """close connections of every thread"""
+        self._connections.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute("SELECT expires, data FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None and row[0] is not None and row[0] <= self._clock():
+            with conn:
+                conn.execute("DELETE FROM responses WHERE key = ? AND expires <= ?", (key, self._clock()))
+            self._count("evictions")
+            row = None
+        if row is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return json.loads(zlib.decompress(row[1]))
+
+    def set(self, key, data):
+        expires = self._clock() + self.ttl if self.ttl is not None else None
+        blob = zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO responses (key, expires, data) VALUES (?, ?, ?)", (key, expires, blob))
+
+    def purge_expired(self):
+        """delete every expired entry, return number of deleted entries"""
+        with self._connect() as conn:
+            deleted = conn.execute("DELETE FROM responses WHERE expires <= ?", (self._clock(),)).rowcount
+        self._count("evictions", deleted)
+        return deleted
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import time
+from . import jsonlib
+from .sqlitedb import ThreadConnections
+
+"""this file contains watermark index of incremental retrieval of repeating crawl/bulk jobs.
+Each seen object is stored as 64-bit hash of its pageUrl and 64-bit hash of its content,
+so the index stays small and lookups stay fast with millions of pages.
+"""
+
+NEW = "new"
+CHANGED = "changed"
+
+
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big", signed=True)
+
+
+class DeltaIndex():
+    """on-disk index of objects seen in data of jobs, in sqlite database opened in WAL mode.
+    key_field : field identifying a page
+    hash_fields : fields whose values make content hash, every field by default.
+                  Exclude fields changing every round (e.g. timestamps) by listing the others.
+    """
+
+    def __init__(self, path, *, key_field="pageUrl", hash_fields=None, batch_size=500, timeout=30.0):
+        self.path = os.path.expanduser(path)
+        self.key_field = key_field
+        self.hash_fields = tuple(sorted(hash_fields)) if hash_fields is not None else None
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self._connections = ThreadConnections(self.path, timeout=timeout)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS seen ("
+                         "job TEXT, url INTEGER, content INTEGER, round INTEGER, PRIMARY KEY (job, url)) WITHOUT ROWID")
+            conn.execute("CREATE TABLE IF NOT EXISTS rounds ("
+                         "job TEXT PRIMARY KEY, round INTEGER, remote_round INTEGER, finished REAL)")
+
+    def _connect(self):
+        return self._connections.get()
+
+    def close(self):
+        """close connections of every thread"""
+        self._connections.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def fingerprint(self, raw):
+        """return (key hash, content hash) of raw JSON bytes of an object.
+        Without hash_fields, content hash is the hash of raw bytes, which relies on the server
+        serializing unchanged objects identically.
+        """
+        obj = jsonlib.loads(raw)
+        key = obj.get(self.key_field)
+        # without a key, an object is identified by its whole content
+        key_hash = _hash64(key.encode("utf-8") if isinstance(key, str) else raw)
+        if self.hash_fields is None:
+            return key_hash, _hash64(raw)
+        content = json.dumps([obj.get(field) for field in self.hash_fields], sort_keys=True, separators=(",", ":"))
+        return key_hash, _hash64(content.encode("utf-8"))
+
+    def last_round(self, job):
+        """number of rounds of job finished so far"""
+        row = self._connect().execute("SELECT round FROM rounds WHERE job = ?", (job,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def last_remote_round(self, job):
+        """remote_round given to the last finished round of job, None if none"""
+        row = self._connect().execute("SELECT remote_round FROM rounds WHERE job = ?", (job,)).fetchone()
+        return row[0] if row is not None else None
+
+    def __len__(self):
+        return self._connect().execute("SELECT count(*) FROM seen").fetchone()[0]
+
+    def count(self, job):
+        return self._connect().execute("SELECT count(*) FROM seen WHERE job = ?", (job,)).fetchone()[0]
+
+    def changes(self, job, raws, *, remote_round=None):
+        """yield (raw, NEW or CHANGED) of each object in raws not seen unchanged in previous rounds of job.
+        remote_round is stored as the round of the job on the server, e.g. roundsCompleted of crawl job.
+        Yielded objects are recorded in the index in batches. If the generator is closed early,
+        objects already yielded are recorded and the round is not counted as finished,
+        so the next round yields the rest.
+        """
+        round = self.last_round(job) + 1
+        conn = self._connect()
+        batch = []
+        updates = []
+        try:
+            for raw in raws:
+                batch.append((raw,) + self.fingerprint(raw))
+                if len(batch) >= self.batch_size:
+                    yield from self._changes_of_batch(conn, job, round, batch, updates)
+                    self._record(conn, job, round, updates)
+                    batch = []
+            yield from self._changes_of_batch(conn, job, round, batch, updates)
+            self._record(conn, job, round, updates)
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO rounds (job, round, remote_round, finished) VALUES (?, ?, ?, ?)",
+                             (job, round, remote_round, time.time()))
+        finally:
+            self._record(conn, job, round, updates)
+
+    def _changes_of_batch(self, conn, job, round, batch, updates):
+        if not batch:
+            return
+        keys = list({key for _, key, _ in batch})
+        seen = dict(conn.execute(
+            "SELECT url, content FROM seen WHERE job = ? AND url IN ({})".format(",".join("?" * len(keys))),
+            [job] + keys,
+        ))
+        for raw, key, content in batch:
+            previous = seen.get(key)
+            if previous == content:
+                continue
+            # duplicates in one batch are compared with the first of them
+            seen[key] = content
+            updates.append((job, key, content, round))
+            yield raw, NEW if previous is None else CHANGED
+
+    @staticmethod
+    def _record(conn, job, round, updates):
+        if not updates:
+            return
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO seen (job, url, content, round) VALUES (?, ?, ?, ?)", updates)
+        del updates[:]
+
+    def forget(self, job):
+        """delete every record of job"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM seen WHERE job = ?", (job,))
+            conn.execute("DELETE FROM rounds WHERE job = ?", (job,))
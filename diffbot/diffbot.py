@@ -1,10 +1,33 @@
-from .meta import Client, JobOperator, drop_none_value, Extractor
+import collections
+from concurrent import futures
+import requests
+from . import jsonlib
+from .meta import Client, JobOperator, drop_none_value, Extractor, CompactExtractor
+from .error import DiffbotResponseError, DiffbotTokenError, DiffbotUnexpectedBodyError
+from .cache import make_cache_key
+from .stream import scan_object, iter_json_array_raw
+from .template import RequestTemplate
+from .urlstream import FormBody
 
 
 class SingleFetcher(Client):
-    """wrapper of analyze/article/discussion/image/product/video API"""
-    def __init__(self, token):
-        super().__init__(token)
+    """wrapper of analyze/article/discussion/image/product/video API
+    To reuse responses of same requests, pass diffbot.MemoryCache or diffbot.SqliteCache as cache.
+    To share one request among concurrent identical calls, pass diffbot.SingleFlight as single_flight.
+    To cut tail latency by duplicating slow calls, pass diffbot.HedgePolicy as hedge_policy.
+    """
+    def __init__(self, token, *, cache=None, single_flight=None, hedge_policy=None, **kwargs):
+        super().__init__(token, **kwargs)
+        self.cache = cache
+        self.single_flight = single_flight
+        self.hedge_policy = hedge_policy
+
+    def _fetch_raw_data(self, api_type, **kwargs):
+        fetch = super()._fetch_raw_data
+        if self.hedge_policy is None:
+            return fetch(api_type, **kwargs)
+        # extraction is idempotent, so a slow call can be sent twice
+        return self.hedge_policy.call(lambda: fetch(api_type, **kwargs))
 
     def _fetch_extractors(self, api_type, target_url, args=None, headers=None):
         data = self.fetch_raw_data(
@@ -93,17 +116,83 @@ class SingleFetcher(Client):
             headers=headers
         )
 
-    def fetch_raw_data(self, api_type, target_url, *, args=None, headers=None):
+    def prepare(self, api_type, *, args=None, headers=None):
+        """return diffbot.RequestTemplate of api_type, args and headers, whose calls only encode their url.
+        Use it to fetch many urls with same args.
+        """
+        return RequestTemplate(self, api_type, select_extractor(api_type), args=args, headers=headers)
+
+    def fetch_many(self, api_type, target_urls, *, args=None, headers=None, max_workers=10, ordered=False):
+        """fetch extractors of many urls in ${api_type} API on a thread pool.
+        yield (url, extractors) as each request completes, or in input order if ordered is True.
+        Failure of one url is yielded as (url, exception) instead of aborting the batch.
+        target_urls is consumed lazily: at most 2 * max_workers urls are pending at once.
+        """
+        fetch = self.prepare(api_type, args=args, headers=headers).fetch_extractors
+
+        def fetch_one(target_url):
+            try:
+                return target_url, fetch(target_url)
+            # DiffbotTokenError: every token of TokenPool is cooling down
+            except (DiffbotResponseError, DiffbotUnexpectedBodyError, DiffbotTokenError, requests.RequestException) as e:
+                return target_url, e
+
+        executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+        pending = []
+        try:
+            for target_url in target_urls:
+                if len(pending) >= 2 * max_workers:
+                    yield from self._pop_completed(pending, ordered)
+                pending.append(executor.submit(fetch_one, target_url))
+            while pending:
+                yield from self._pop_completed(pending, ordered)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    @staticmethod
+    def _pop_completed(pending, ordered):
+        """remove finished futures from pending and return their results"""
+        if ordered:
+            return [pending.pop(0).result()]
+        done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+        pending[:] = [future for future in pending if future not in done]
+        return [future.result() for future in done]
+
+    def fetch_raw_data(self, api_type, target_url, *, args=None, headers=None, retry_policy=None,
+                       bypass_cache=False, refresh_cache=False, raw=False):
         """fetch raw data in ${api_type} API
         To fetch raw data, use this method.
+        retry_policy overrides RetryPolicy of this client in this call.
+        bypass_cache: neither read nor write cache
+        refresh_cache: fetch from API even if cached, then overwrite cache
+        raw: return body bytes without decoding. Cache is not used.
         """
         args = args or {}
         headers = headers or {}
-        return self._fetch_raw_data(
-            api_type=api_type,
-            query=self._compose_query(target_url, args=args),
-            headers=headers,
-        )
+        query = self._compose_query(target_url, args=args)
+
+        key = make_cache_key(api_type, query, headers)
+        use_cache = self.cache is not None and not bypass_cache and not raw
+        if use_cache and not refresh_cache:
+            data = self.cache.get(key)
+            if data is not None:
+                return data
+
+        def fetch():
+            data = self._fetch_raw_data(
+                api_type=api_type,
+                query=query,
+                headers=headers,
+                retry_policy=retry_policy,
+                raw=raw,
+            )
+            if use_cache:
+                self.cache.set(key, data)
+            return data
+
+        if self.single_flight is None:
+            return fetch()
+        return self.single_flight.do((key, raw), fetch)
 
     @staticmethod
     def generate_analyze_args(*, mode=None, fallback=None, fields=None, discussion=None, timeout=None, callback=None):
@@ -198,22 +287,33 @@ class BulkJobOperator(JobOperator):
     # Set your Content-Type header to application/x-www-form-urlencoded
     """
 
-    def __init__(self, token, job_name):
-        super().__init__(token, job_name, "bulk")
+    def __init__(self, token, job_name, **kwargs):
+        super().__init__(token, job_name, "bulk", **kwargs)
 
-    def start_job(self, target_url_list, apiurl, *, args=None, headers=None):
+    def start_job(self, target_url_list, apiurl, *, args=None, headers=None, normalize=False, dedupe=None):
+        """start bulk job of target_url_list, an iterable of URLs (e.g. generator) or a path of file of URLs.
+        URLs are encoded into the request body while it is sent, so the list is never held in memory.
+        normalize : normalize each URL with diffbot.normalize_url
+        dedupe : True to skip repeated URLs, or set-like to remember them in, e.g. diffbot.BloomFilter
+        to bound memory at the cost of rare false duplicates. URLs already in it are skipped too,
+        and URLs sent are added to it once the job is accepted, see FormBody.
+        """
         args = args or {}
         headers = headers or {}
 
         content_type = {"Content-Type": "application/x-www-form-urlencoded"}
+        body = FormBody({"name": self.job_name, "apiUrl": apiurl, **args}, "urls", target_url_list,
+                        normalize=normalize, dedupe=dedupe)
 
-        return self._post_raw_data(
+        self.status_cache.invalidate(self.token, self.api_type, self.job_name)
+        response_data = self._post_raw_data(
             api_type=self.api_type,
-            payload=self._compose_query(target_url_list, apiurl,
-                                        args=args
-                                        ),
+            payload=body,
             headers={**headers, **content_type},
         )
+        # URLs of a failed submit are not remembered, so submitting them again sends them
+        body.remember()
+        return response_data
 
     # abstruct API
     def _compose_query(self, target_url_list, apiurl, *, args=None):
@@ -246,17 +346,19 @@ class CrawlJobOperator(JobOperator):
     """use crawling API
     see also crawling API document, https://www.diffbot.com/dev/docs/crawl/.
     """
-    def __init__(self, token, job_name):
+    def __init__(self, token, job_name, **kwargs):
         super().__init__(
             token=token,
             job_name=job_name,
             api_type="crawl",
+            **kwargs
         )
 
     def start_job(self, target_url_list, apiurl, *, args=None, headers=None):
         args = args or {}
         headers = headers or {}
 
+        self.status_cache.invalidate(self.token, self.api_type, self.job_name)
         return self._fetch_raw_data(
             api_type=self.api_type,
             query=self._compose_query(target_url_list, apiurl, args=args),
@@ -310,8 +412,8 @@ class CrawlJobOperator(JobOperator):
 
 class Searcher(Client):
     """using search API"""
-    def __init__(self, token, job_name):
-        super().__init__(token)
+    def __init__(self, token, job_name, **kwargs):
+        super().__init__(token, **kwargs)
         self.job_name = job_name
 
     def fetch_search_extractors(self, *, query, args=None):
@@ -327,10 +429,64 @@ class Searcher(Client):
             exts.append(Extractor(data["objects"][i]))
         return exts
 
-    def fetch_raw_data(self, query, *, args=None):
+    def iter_search(self, query, page_size=50, *, prefetch=2, args=None, compact=False, fields=None):
+        """yield Extractor of every search result, walking pages of page_size by start.
+        Once hits is known from the first page, next prefetch pages are fetched in background
+        while caller works on current page, so at most prefetch + 1 pages are held in memory.
+        If compact is True, yield CompactExtractor (of only fields, if given) made from raw bytes of each result.
+        """
+        args = args or {}
+
+        def fetch_page(start):
+            page_args = {**args, **self.generate_args(num=page_size, start=start)}
+            if compact:
+                return self._fetch_raw_page(query, args=page_args)
+            data = self.fetch_raw_data(query, args=page_args)
+            return data.get("objects", []), data.get("hits")
+
+        executor = futures.ThreadPoolExecutor(max_workers=max(1, prefetch))
+        pending = collections.deque()
+        next_start = 0
+        hits = None
+        try:
+            while True:
+                # until hits is known, a page is fetched alone, so no page past the results is paid for
+                while len(pending) <= prefetch and (next_start < hits if hits is not None else not pending):
+                    pending.append(executor.submit(fetch_page, next_start))
+                    next_start += page_size
+                if not pending:
+                    return
+
+                objects, page_hits = pending.popleft().result()
+                hits = page_hits if page_hits is not None else hits
+                for datum in objects:
+                    if compact:
+                        yield make_compact_extractor(datum, fields=fields)
+                    else:
+                        yield select_extractor(datum["type"])(datum)
+                if len(objects) < page_size:
+                    return
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _fetch_raw_page(self, query, *, args=None):
+        """fetch a page of search API, return raw bytes of each result and hits without decoding whole page"""
+        response = self._stream_raw_data("search", query=self._compose_query(query=query, args=args or {}))
+        with response:
+            body, _ = self.transfer.read(response)
+        index = scan_object(body)
+        if "error" in index:
+            self._check_response(self.json_loads(body))
+        hits = self.json_loads(body[slice(*index["hits"])]) if "hits" in index else None
+        objects = list(iter_json_array_raw([body[slice(*index["objects"])]])) if "objects" in index else []
+        return objects, hits
+
+    def fetch_raw_data(self, query, *, args=None, retry_policy=None, raw=False):
         """using search API, search data with query
         For more information about kwargs,
         see also search API document, https://www.diffbot.com/dev/docs/search/
+        retry_policy overrides RetryPolicy of this client in this call.
+        If raw is True, return body bytes without decoding.
         """
         args = args or {}
         return self._fetch_raw_data(
@@ -338,7 +494,9 @@ class Searcher(Client):
             query=self._compose_query(
                 query=query,
                 args=args
-            )
+            ),
+            retry_policy=retry_policy,
+            raw=raw,
         )
 
     @staticmethod
@@ -373,6 +531,8 @@ def select_extractor(api_type):
 
 class DiscussionExtractor(Extractor):
     """support Discussion API"""
+    __slots__ = ()
+
     def __init__(self, data):
         super().__init__(data)
 
@@ -382,12 +542,16 @@ class DiscussionExtractor(Extractor):
 
 class AnalyzeExtractor(Extractor):
     """support Analyze API"""
+    __slots__ = ()
+
     def __init__(self, data):
         super().__init__(data)
 
 
 class ArticleExtractor(Extractor):
     """support Article API"""
+    __slots__ = ()
+
     def __init__(self, data):
         super().__init__(data)
 
@@ -406,17 +570,71 @@ class ArticleExtractor(Extractor):
 
 class ImageExtractor(Extractor):
     """support Image API"""
+    __slots__ = ()
+
     def __init__(self, data):
         super().__init__(data)
 
 
 class ProductExtractor(Extractor):
     """support Product API"""
+    __slots__ = ()
+
     def __init__(self, data):
         super().__init__(data)
 
 
 class VideoExtractor(Extractor):
     """support Video API"""
+    __slots__ = ()
+
     def __init__(self, data):
         super().__init__(data)
+
+
+class CompactDiscussionExtractor(CompactExtractor, DiscussionExtractor):
+    __slots__ = ()
+
+
+class CompactAnalyzeExtractor(CompactExtractor, AnalyzeExtractor):
+    __slots__ = ()
+
+
+class CompactArticleExtractor(CompactExtractor, ArticleExtractor):
+    __slots__ = ()
+
+
+class CompactImageExtractor(CompactExtractor, ImageExtractor):
+    __slots__ = ()
+
+
+class CompactProductExtractor(CompactExtractor, ProductExtractor):
+    __slots__ = ()
+
+
+class CompactVideoExtractor(CompactExtractor, VideoExtractor):
+    __slots__ = ()
+
+
+def select_compact_extractor(api_type):
+    """select CompactExtractor class corresponding api_type"""
+    dic = {
+        "article": CompactArticleExtractor,
+        "analyze": CompactAnalyzeExtractor,
+        "discussion": CompactDiscussionExtractor,
+        "video": CompactVideoExtractor,
+        "image": CompactImageExtractor,
+        "product": CompactProductExtractor,
+    }
+    return dic[api_type]
+
+
+def make_compact_extractor(raw, fields=None):
+    """make CompactExtractor of raw JSON bytes of an object, whose class is selected by its type.
+    If fields is given, only these fields (and type) are kept.
+    """
+    index = scan_object(raw)
+    Extractor = select_compact_extractor(jsonlib.loads(raw[slice(*index["type"])]))
+    if fields is not None and "type" not in fields:
+        fields = [*fields, "type"]
+    return Extractor(raw, fields=fields)
@@ -7,9 +7,10 @@ class DiffbotTokenError(KeyError):
 
 
 class DiffbotResponseError(IOError):
-    def __init__(self, code, msg):
+    def __init__(self, code, msg, retry_after=None):
         self.code = code
         self.msg = msg
+        self.retry_after = retry_after
 
     def __str__(self):
         return "DiffbotResponseError #{} :  {}".format(self.code, self.msg)
@@ -18,6 +19,7 @@ class DiffbotResponseError(IOError):
 class DiffbotUnexpectedBodyError(Exception):
     def __init__(self, *args, **kwargs):
         self.raw = kwargs.pop("raw", None)
+        self.retry_after = kwargs.pop("retry_after", None)
         super().__init__(*args, **kwargs)
 
     def __str__(self):
@@ -0,0 +1,145 @@
+import gzip
+import io
+import json
+import os
+import shutil
+from .stream import iter_json_array
+
+try:
+    import zstandard
+except ImportError:    # zstandard is optional, needed only for compression="zstd"
+    zstandard = None
+
+"""this file contains export of bulk/crawl job data to local files.
+Job data is first downloaded to a spool file next to the output. An interrupted download is resumed
+with HTTP Range request where the server supports it, then the spool is converted to the output format.
+"""
+
+DEFAULT_COLUMNS = ("pageUrl", "title", "text", "type")
+
+_SUFFIXES = {
+    None: "",
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+
+
+def export_job_data(operator, path, *, format="jsonl", compression=None, fields=None, job_index=0, chunk_size=1 << 20,
+                    resumable=True):
+    """export data of job of operator to path, return number of exported objects.
+    format : "jsonl" writes one JSON object per line to path.
+             "columnar" writes directory path with one file of JSON values per field, and _schema.json.
+    compression : None, "gzip" or "zstd"
+    fields : keys of each object to export. All keys for jsonl and DEFAULT_COLUMNS for columnar by default.
+    resumable : see download_job_data
+    """
+    if format not in ("jsonl", "columnar"):
+        raise ValueError("unknown export format: {}".format(format))
+    if compression not in _SUFFIXES:
+        raise ValueError("unknown compression: {}".format(compression))
+
+    spool_path = download_job_data(operator, path + ".download", job_index=job_index, chunk_size=chunk_size,
+                                   resumable=resumable)
+    with open(spool_path, "rb") as f:
+        objects = iter_json_array(iter(lambda: f.read(chunk_size), b""))
+        if format == "jsonl":
+            count = _write_jsonl(objects, path, compression=compression, fields=fields)
+        else:
+            count = _write_columns(objects, path, compression=compression, fields=fields or DEFAULT_COLUMNS)
+    os.remove(spool_path)
+    return count
+
+
+def download_job_data(operator, spool_path, *, job_index=0, chunk_size=1 << 20, resumable=True):
+    """download raw JSON of job data to spool_path, resuming from spool_path.part if exists.
+    If resumable is False, the data is transferred compressed and decompressed while streaming,
+    but an interrupted download starts over.
+    """
+    if os.path.exists(spool_path):
+        return spool_path
+    part_path = spool_path + ".part"
+    checkpoint_path = part_path + ".json"
+
+    operator._check_job_completed(job_index)
+    # byte offsets of partial download are meaningful only without content encoding
+    headers = {"Accept-Encoding": "identity"} if resumable else {}
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if resumable and offset and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            validator = json.load(f).get("validator")
+        headers["Range"] = "bytes={}-".format(offset)
+        if validator:
+            headers["If-Range"] = validator
+
+    response = operator._stream_raw_data(
+        api_type="{}/data".format(operator.api_type),
+        query=operator._compose_bot_data_query(format="json"),
+        headers=headers,
+    )
+    with response:
+        # 200 means the server ignored Range or the data has changed, so start over
+        mode = "ab" if response.status_code == 206 else "wb"
+        with open(checkpoint_path, "w") as f:
+            json.dump({"validator": response.headers.get("ETag") or response.headers.get("Last-Modified")}, f)
+        with open(part_path, mode) as f:
+            for chunk in operator.transfer.iter_content(response, chunk_size):
+                f.write(chunk)
+
+    os.replace(part_path, spool_path)
+    os.remove(checkpoint_path)
+    return spool_path
+
+
+def _open_text(path, compression):
+    if compression == "gzip":
+        return gzip.open(path, "wt", encoding="utf-8", newline="\n")
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError("zstandard is required for compression='zstd'")
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(open(path, "wb")), encoding="utf-8", newline="\n")
+    return open(path, "w", encoding="utf-8", newline="\n")
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _write_jsonl(objects, path, *, compression=None, fields=None):
+    tmp_path = path + ".tmp"
+    count = 0
+    with _open_text(tmp_path, compression) as f:
+        for obj in objects:
+            if fields is not None:
+                obj = {field: obj.get(field) for field in fields}
+            f.write(_dumps(obj))
+            f.write("\n")
+            count += 1
+    os.replace(tmp_path, path)
+    return count
+
+
+def _write_columns(objects, path, *, compression=None, fields=DEFAULT_COLUMNS):
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    suffix = ".jsonl" + _SUFFIXES[compression]
+    files = [_open_text(os.path.join(tmp_path, field + suffix), compression) for field in fields]
+    count = 0
+    try:
+        for obj in objects:
+            for field, f in zip(fields, files):
+                f.write(_dumps(obj.get(field)))
+                f.write("\n")
+            count += 1
+    finally:
+        for f in files:
+            f.close()
+
+    with open(os.path.join(tmp_path, "_schema.json"), "w") as f:
+        json.dump({"fields": list(fields), "files": [field + suffix for field in fields], "rows": count}, f)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    return count
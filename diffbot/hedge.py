@@ -0,0 +1,136 @@
+import collections
+import threading
+import time
+from concurrent import futures
+
+"""this file contains HedgePolicy, cutting tail latency of SingleFetcher calls with duplicate requests.
+A call not answered within a percentile of recent latencies is sent once more, and the first answer wins.
+"""
+
+
+class HedgePolicy():
+    """send one duplicate of a call still unanswered after delay, and return whichever answer arrives first.
+    delay is the percentile of the latencies of the last window calls, within [min_delay, max_delay],
+    or initial_delay until min_samples calls are seen.
+    budget caps hedges to this fraction of calls: each call earns budget hedges, up to max_burst saved.
+    The slower request of a hedged call can not be interrupted, so it finishes in the background and is discarded.
+    Calls run on a pool of max_workers threads, shared by every client using this policy.
+    A call waits for a free thread before its delay starts, and is not hedged if no other thread is free,
+    so time queued in the pool never counts as latency.
+    """
+
+    def __init__(self, percentile=0.95, *, budget=0.05, max_burst=10.0, min_delay=0.05, max_delay=None,
+                 initial_delay=1.0, window=1000, min_samples=20, max_workers=32, clock=time.monotonic):
+        if not 0 < percentile < 1:
+            raise ValueError("percentile must be between 0 and 1")
+        self.percentile = percentile
+        self.budget = budget
+        self.max_burst = max_burst
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=window)
+        self._delay = initial_delay
+        self._tokens = 0.0
+        self._observed = 0
+        self._executor = futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="diffbot-hedge")
+        # threads not running nor reserved by a request, held until the request ends even if it is discarded
+        self._free_workers = threading.BoundedSemaphore(max_workers)
+        self.calls = 0
+        self.hedged = 0
+        self.won = 0
+        self.over_budget = 0
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def delay(self):
+        """seconds to wait for an answer before hedging"""
+        with self._lock:
+            return self._delay
+
+    def observe(self, seconds):
+        """record latency of an answered call"""
+        with self._lock:
+            self._latencies.append(seconds)
+            self._observed += 1
+            # sorting the window on every call is too costly, so delay follows every 16 samples
+            if self._observed >= self.min_samples and (self._observed - self.min_samples) % 16 == 0:
+                samples = sorted(self._latencies)
+                delay = max(self.min_delay, samples[min(len(samples) - 1, int(len(samples) * self.percentile))])
+                self._delay = delay if self.max_delay is None else min(self.max_delay, delay)
+
+    def _submit(self, func):
+        """run func on a worker reserved from _free_workers"""
+        try:
+            future = self._executor.submit(func)
+        except BaseException:
+            self._free_workers.release()
+            raise
+        future.add_done_callback(lambda future: self._free_workers.release())
+        return future
+
+    def _take_hedge(self):
+        if not self._free_workers.acquire(blocking=False):
+            return False
+        with self._lock:
+            if self._tokens < 1.0:
+                self.over_budget += 1
+                self._free_workers.release()
+                return False
+            self._tokens -= 1.0
+            self.hedged += 1
+            return True
+
+    def call(self, func):
+        """call func, calling it once more if it does not return within delay. return first result.
+        If the first answer is an exception, the other answer is awaited, and the first exception is raised if both fail.
+        """
+        with self._lock:
+            self.calls += 1
+            self._tokens = min(self.max_burst, self._tokens + self.budget)
+            delay = self._delay
+        self._free_workers.acquire()
+        start = self._clock()
+        primary = self._submit(func)
+        done, _ = futures.wait([primary], timeout=delay)
+        if done or not self._take_hedge():
+            result = primary.result()
+            self.observe(self._clock() - start)
+            return result
+
+        hedge = self._submit(func)
+        pending = [primary, hedge]
+        error = None
+        while pending:
+            done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            # primary first if both are done, so a hedge wins only when it is strictly faster
+            for future in sorted(done, key=lambda future: future is hedge):
+                pending.remove(future)
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                for other in pending:
+                    other.cancel()
+                if future is hedge:
+                    with self._lock:
+                        self.won += 1
+                self.observe(self._clock() - start)
+                return future.result()
+        raise error
+
+    def stats(self):
+        """return {"calls", "hedged", "won", "over_budget", "delay"}: hedged is hedges fired, won is hedges answering
+        first, over_budget is hedges not fired for lack of budget
+        """
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "hedged": self.hedged,
+                "won": self.won,
+                "over_budget": self.over_budget,
+                "delay": self._delay,
+            }
@@ -0,0 +1,96 @@
+import threading
+import time
+from .error import DiffbotJobStatusError
+
+"""this file contains job status cache and polling of many bulk/crawl jobs at once"""
+
+MAX_ROUNDS = 1        # Job has reached maxRounds limit
+MAX_TO_CRAWL = 2      # Job has reached maxToCrawl limit
+MAX_TO_PROCESS = 3    # Job has reached maxToProcess limit
+NEXT_ROUND = 4        # Next round to start in _ seconds
+NO_URLS = 5           # No URLs were added to the crawl
+IN_PROGRESS = 7       # Job is in progress
+COMPLETED = 9         # Job has completed and no repeat is scheduled
+FAILED = 10           # Failed to crawl any seed
+
+# statuses in which the last round of a job is finished, though a repeating job may start another
+ROUND_FINISHED = (MAX_ROUNDS, MAX_TO_CRAWL, MAX_TO_PROCESS, NEXT_ROUND, COMPLETED)
+
+
+class JobStatusCache():
+    """short-TTL cache of job listings of bulk/crawl API, shared by JobOperators.
+    A listing of every job of a token also serves status of each job in it.
+    """
+
+    def __init__(self, ttl=2.0, *, clock=time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, token, api_type, job_name=None):
+        """return cached listing {"jobs": [...]} or None"""
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get((token, api_type, job_name))
+            if entry is not None and entry[0] > now:
+                return entry[1]
+            entry = self._entries.get((token, api_type, None))
+            if job_name is not None and entry is not None and entry[0] > now:
+                return {"jobs": [job for job in entry[1]["jobs"] if job.get("name") == job_name]}
+        return None
+
+    def set(self, token, api_type, job_name, data):
+        with self._lock:
+            self._entries[(token, api_type, job_name)] = (self._clock() + self.ttl, data)
+
+    def invalidate(self, token, api_type, job_name=None):
+        """forget listings which may contain job_name"""
+        with self._lock:
+            self._entries.pop((token, api_type, job_name), None)
+            self._entries.pop((token, api_type, None), None)
+
+
+def wait_for_jobs(operators, *, timeout=None, poll_interval=5.0, max_poll_interval=60.0, backoff=1.5,
+                  clock=time.monotonic, sleep=time.sleep):
+    """yield job name of each operator as its job completes.
+    Jobs of same token and api type are polled together by one listing call.
+    Polling interval grows by backoff up to max_poll_interval.
+    Raise DiffbotJobStatusError if some jobs have not completed in timeout seconds.
+    """
+    for job_name, _ in poll_jobs(operators, timeout=timeout, poll_interval=poll_interval,
+                                 max_poll_interval=max_poll_interval, backoff=backoff, clock=clock, sleep=sleep):
+        yield job_name
+
+
+def poll_jobs(operators, *, final_statuses=(COMPLETED,), timeout=None, poll_interval=5.0, max_poll_interval=60.0,
+              backoff=1.5, clock=time.monotonic, sleep=time.sleep):
+    """yield (job name, jobStatus) of each operator as its job reaches one of final_statuses.
+    see also wait_for_jobs
+    """
+    pending = {}
+    for operator in operators:
+        pending.setdefault((operator.token, operator.api_type), {})[operator.job_name] = operator
+
+    deadline = clock() + timeout if timeout is not None else None
+    interval = poll_interval
+    while pending:
+        for key, group in list(pending.items()):
+            data = next(iter(group.values()))._fetch_all_jobs()
+            statuses = {job.get("name"): job["jobStatus"] for job in data.get("jobs", [])}
+            for job_name in list(group):
+                status = statuses.get(job_name)
+                if status is not None and status["status"] in final_statuses:
+                    del group[job_name]
+                    yield job_name, status
+            if not group:
+                del pending[key]
+        if not pending:
+            return
+
+        remaining = deadline - clock() if deadline is not None else interval
+        if remaining <= 0:
+            names = sorted(name for group in pending.values() for name in group)
+            raise DiffbotJobStatusError(None, "jobs not completed in {} seconds: {}".format(timeout, ", ".join(names)))
+        sleep(min(interval, remaining))
+        interval = min(max_poll_interval, interval * backoff)
@@ -0,0 +1,41 @@
+import json
+
+try:
+    import orjson
+except ImportError:    # orjson is optional, see extras_require["fast"] in setup.py
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+"""this file contains pluggable JSON decoder.
+The fastest installed one of orjson, ujson and json is used by default. Every decoder accepts bytes.
+"""
+
+DECODERS = {"json": json.loads}
+if ujson is not None:
+    DECODERS["ujson"] = ujson.loads
+if orjson is not None:
+    DECODERS["orjson"] = orjson.loads
+
+
+def get_json_decoder(decoder=None):
+    """return loads function of decoder.
+    decoder : None for the fastest installed one, name in DECODERS, or callable taking bytes.
+    The function must raise ValueError for invalid JSON.
+    """
+    if decoder is None:
+        for name in ("orjson", "ujson", "json"):
+            if name in DECODERS:
+                return DECODERS[name]
+    if callable(decoder):
+        return decoder
+    try:
+        return DECODERS[decoder]
+    except KeyError:
+        raise ValueError("JSON decoder {} is not installed".format(decoder))
+
+
+loads = get_json_decoder()
@@ -0,0 +1,162 @@
+import json
+import os
+import sqlite3
+import zlib
+from . import jsonlib
+from .diffbot import select_extractor
+from .sqlitedb import ThreadConnections
+
+"""this file contains local index of job data, to query a finished crawl without calling search API.
+Objects are stored in an sqlite database: zlib compressed JSON of each object, an FTS5 full-text index
+over title and text, and exact-match indexes on pageUrl, type and siteName.
+The database is read through mmap, so repeated queries are served from the page cache.
+"""
+
+
+class LocalIndex():
+    """on-disk index of objects of job data, queried by full-text and exact-match fields.
+    An object replaces the stored one of the same pageUrl.
+    mmap_size : bytes of the database file mapped in memory
+    tokenize : FTS5 tokenizer, e.g. "trigram" for languages without spaces between words
+    """
+
+    def __init__(self, path, *, mmap_size=1 << 30, tokenize="unicode61 remove_diacritics 2", timeout=30.0):
+        self.path = os.path.expanduser(path)
+        self.mmap_size = mmap_size
+        self.timeout = timeout
+        self._connections = ThreadConnections(self.path, timeout=timeout, pragmas=["mmap_size={:d}".format(mmap_size)])
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS objects ("
+                         "id INTEGER PRIMARY KEY, page_url TEXT, type TEXT, site_name TEXT, job TEXT, data BLOB)")
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS objects_page_url ON objects (page_url)")
+            conn.execute("CREATE INDEX IF NOT EXISTS objects_type ON objects (type)")
+            conn.execute("CREATE INDEX IF NOT EXISTS objects_site_name ON objects (site_name)")
+            try:
+                # contentless: the text is kept once, compressed in objects
+                conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS objects_fts USING fts5("
+                             "title, text, content='', tokenize='{}')".format(tokenize.replace("'", "''")))
+            except sqlite3.OperationalError as e:
+                raise RuntimeError("sqlite3 of this python is built without FTS5: {}".format(e))
+
+    def _connect(self):
+        return self._connections.get()
+
+    def close(self):
+        """close connections of every thread"""
+        self._connections.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._connect().execute("SELECT count(*) FROM objects").fetchone()[0]
+
+    def add_job(self, operator, job_index=0, *, batch_size=1000):
+        """index data of job of operator (BulkJobOperator or CrawlJobOperator), streaming it.
+        return number of indexed objects
+        """
+        job = "{}/{}".format(operator.api_type, operator.job_name)
+        return self.add(operator.iter_raw_objects(job_index), job=job, batch_size=batch_size)
+
+    def add(self, objects, *, job=None, batch_size=1000):
+        """index objects, each a dict or raw JSON bytes, committing every batch_size objects.
+        return number of indexed objects
+        """
+        conn = self._connect()
+        count = 0
+        batch = []
+        for obj in objects:
+            if isinstance(obj, (bytes, bytearray)):
+                raw, obj = bytes(obj), jsonlib.loads(obj)
+            else:
+                raw = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+            batch.append((raw, obj))
+            if len(batch) >= batch_size:
+                count += self._add_batch(conn, batch, job)
+                batch = []
+        return count + self._add_batch(conn, batch, job)
+
+    def _add_batch(self, conn, batch, job):
+        with conn:
+            for raw, obj in batch:
+                page_url = obj.get("pageUrl")
+                if page_url is not None:
+                    self._delete(conn, page_url)
+                cursor = conn.execute(
+                    "INSERT INTO objects (page_url, type, site_name, job, data) VALUES (?, ?, ?, ?, ?)",
+                    (page_url, obj.get("type"), obj.get("siteName"), job, zlib.compress(raw)))
+                conn.execute("INSERT INTO objects_fts (rowid, title, text) VALUES (?, ?, ?)",
+                             (cursor.lastrowid, _text(obj.get("title")), _text(obj.get("text"))))
+        return len(batch)
+
+    @staticmethod
+    def _delete(conn, page_url):
+        row = conn.execute("SELECT id, data FROM objects WHERE page_url = ?", (page_url,)).fetchone()
+        if row is None:
+            return
+        old = jsonlib.loads(zlib.decompress(row[1]))
+        # contentless FTS5 table is told the indexed values to delete
+        conn.execute("INSERT INTO objects_fts (objects_fts, rowid, title, text) VALUES ('delete', ?, ?, ?)",
+                     (row[0], _text(old.get("title")), _text(old.get("text"))))
+        conn.execute("DELETE FROM objects WHERE id = ?", (row[0],))
+
+    def search(self, query=None, *, page_url=None, type=None, site_name=None, limit=20, offset=0, raw=False):
+        """return Extractors of objects matching every given condition, best matches of query first.
+        query : FTS5 query over title and text, e.g. 'python AND title:asyncio', '"exact phrase"', 'pyth*'
+        page_url, type, site_name : exact values
+        If raw is True, return dicts instead of Extractors.
+        """
+        sql, params = self._query("o.data", query, page_url, type, site_name)
+        if query is not None:
+            sql += " ORDER BY bm25(objects_fts)"
+        else:
+            sql += " ORDER BY o.id"
+        sql += " LIMIT ? OFFSET ?"
+        params += [limit, offset]
+
+        data = [jsonlib.loads(zlib.decompress(row[0])) for row in self._connect().execute(sql, params)]
+        if raw:
+            return data
+        return [select_extractor(datum["type"])(datum) for datum in data]
+
+    def get(self, page_url):
+        """return Extractor of object of page_url, or None"""
+        result = self.search(page_url=page_url, limit=1)
+        return result[0] if result else None
+
+    def count(self, query=None, *, page_url=None, type=None, site_name=None):
+        """number of objects search would find without limit"""
+        sql, params = self._query("count(*)", query, page_url, type, site_name)
+        return self._connect().execute(sql, params).fetchone()[0]
+
+    @staticmethod
+    def _query(columns, query, page_url, type, site_name):
+        conditions = []
+        params = []
+        if query is not None:
+            conditions.append("objects_fts MATCH ?")
+            params.append(query)
+        for column, value in (("o.page_url", page_url), ("o.type", type), ("o.site_name", site_name)):
+            if value is not None:
+                conditions.append("{} = ?".format(column))
+                params.append(value)
+        sql = "SELECT {} FROM objects o".format(columns)
+        if query is not None:
+            sql += " JOIN objects_fts ON objects_fts.rowid = o.id"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        return sql, params
+
+    def optimize(self):
+        """merge FTS5 index segments, worth running after adding a whole job"""
+        with self._connect() as conn:
+            conn.execute("INSERT INTO objects_fts (objects_fts) VALUES ('optimize')")
+
+
+def _text(value):
+    if value is None:
+        return ""
+    return value if isinstance(value, str) else str(value)
@@ -1,10 +1,23 @@
-import json
+import collections.abc
+import contextlib
+import functools
+import time
 import requests
 import urllib.parse
 from abc import ABCMeta, abstractmethod
 import diffbot
 from . import const
-from .error import DiffbotJobStatusError, DiffbotResponseError, DiffbotUnexpectedBodyError
+from .error import DiffbotJobStatusError, DiffbotResponseError, DiffbotTokenError, DiffbotUnexpectedBodyError
+from .retry import parse_retry_after
+from .stream import iter_json_array, iter_json_array_raw, iter_csv_rows, scan_object
+from .export import export_job_data
+from .jobs import JobStatusCache, COMPLETED, ROUND_FINISHED
+from .jsonlib import get_json_decoder
+from . import jsonlib
+from .metrics import CallEvent, TimedHTTPAdapter, get_connect_time, reset_connect_time
+from .tokenpool import TokenPool
+from .transfer import ACCEPT_ENCODING, TransferCounter
+from .urlstream import FormBody
 
 """this file contains Client, JobOperator and Extractor class
 Generalized web_data fetcher using Diffbot.
@@ -12,43 +25,244 @@ Generalized web_data fetcher using Diffbot.
 
 
 class Client():
+    """base class of every diffbot API wrapper.
+    HTTP connections are kept alive in a pooled requests.Session shared by every call of this client.
+    To share one pool between several clients, pass the same session to each of them.
+    Client can be used as a context manager, which closes its own session on exit.
+    To keep call rate under the limit of the token, pass diffbot.RateLimiter as rate_limiter.
+    To retry transient failures, pass diffbot.RetryPolicy as retry_policy.
+    json_decoder selects JSON decoder, "orjson", "ujson", "json" or a callable (see diffbot.jsonlib).
+    Each hook in hooks is called with diffbot.CallEvent after every call. Without hooks nothing is measured.
+    token may be diffbot.TokenPool, whose tokens are failed over on quota errors.
+    Responses are requested compressed unless compress is False, see transfer_stats for the savings.
+    """
 
-    def __init__(self, token):
+    def __init__(self, token, *, session=None, pool_size=10, keep_alive=True, compress=True, connect_timeout=None,
+                 read_timeout=None, rate_limiter=None, retry_policy=None, json_decoder=None, hooks=None):
         self.token = token
+        self.token_pool = token if isinstance(token, TokenPool) else None
+        self.hooks = hooks if hooks is not None else []
+        self.json_loads = get_json_decoder(json_decoder)
+        self.timeout = (connect_timeout, read_timeout)
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.transfer = TransferCounter()
+        self._own_session = session is None
+        self.session = session or self.create_session(pool_size=pool_size, keep_alive=keep_alive, compress=compress)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """close pooled connections, unless the session was given by caller"""
+        if self._own_session:
+            self.session.close()
+
+    @staticmethod
+    def create_session(*, pool_size=10, keep_alive=True, compress=True):
+        """pooled session accepting every content encoding urllib3 can decode, or only identity if compress is False"""
+        session = requests.Session()
+        session.headers["Accept-Encoding"] = ACCEPT_ENCODING if compress else "identity"
+        adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        if not keep_alive:
+            session.headers["Connection"] = "close"
+        return session
+
+    def _shared_options(self):
+        """keyword arguments for clients derived from this client (e.g. Searcher of a finished job)"""
+        return {
+            "session": self.session,
+            "connect_timeout": self.timeout[0],
+            "read_timeout": self.timeout[1],
+            "rate_limiter": self.rate_limiter,
+            "retry_policy": self.retry_policy,
+            "json_decoder": self.json_loads,
+            "hooks": self.hooks,
+        }
+
+    def transfer_stats(self):
+        """return {"responses", "wire_bytes", "decoded_bytes", "ratio"} of bodies read by this client.
+        Streamed bodies are counted when read to the end.
+        """
+        return self.transfer.stats()
+
+    def add_hook(self, hook):
+        """call hook with diffbot.CallEvent after every call"""
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
 
     """base GET method for raw_data
     _fetch_raw_data(self, api_type: str, *, query: dict, headers: dict)
+    If raw is True, return body bytes without decoding, after checking that it is not an error.
     """
-    def _fetch_raw_data(self, api_type, *, query={}, headers={}):
-        query.update({"token": self.token})
-
-        # GET body content should be in querystring format (key/value pairs) in diffbot
-        response = requests.get(self._get_end_point(api_type),
-                                params=urllib.parse.urlencode(query),
-                                headers=headers)
-        try:
-            response_data = response.json()
-        except json.JSONDecodeError as e:
-            raise DiffbotUnexpectedBodyError(response.text, raw=e)
-        return self._check_response(response_data)
-
-    def _post_raw_data(self, api_type, *, payload=None, headers=None):
+    def _fetch_raw_data(self, api_type, *, query=None, headers=None, retry_policy=None, raw=False, endpoint=None):
+        return self._request("GET", api_type,
+                             params=query or {},
+                             headers=headers or {},
+                             retry_policy=retry_policy,
+                             raw=raw,
+                             endpoint=endpoint)
+
+    def _post_raw_data(self, api_type, *, payload=None, headers=None, retry_policy=None):
         """base POST method for raw data
         base GET method for raw_data
         _fetch_raw_data(self, api_type: str, *, query: dict, headers: dict)
         """
         payload = payload or {}
         headers = headers or {}
-        payload["token"] = self.token
-        # POST body content should be in querystring format (key/value pairs) in diffbot
-        response = requests.post(self._get_end_point(api_type),
-                                 data=urllib.parse.urlencode(payload),
-                                 headers=headers)
+        return self._request("POST", api_type,
+                             data=payload,
+                             headers=headers,
+                             retry_policy=retry_policy)
+
+    def _stream_raw_data(self, api_type, *, query=None, headers=None, retry_policy=None):
+        """base GET method for streaming raw data
+        return response whose body is not read yet. Caller must close it.
+        """
+        return self._request("GET", api_type,
+                             params=query or {},
+                             headers=headers or {},
+                             retry_policy=retry_policy,
+                             stream=True)
+
+    def _request(self, method, api_type, *, params=None, data=None, headers=None, retry_policy=None, stream=False, raw=False,
+                 endpoint=None):
+        """send request, retrying with retry_policy (or policy of this client) if any
+        params and data are dicts or urlencoded strings, to which token is added. data may be FormBody too.
+        endpoint overrides the url of api_type, e.g. precomputed by diffbot.RequestTemplate.
+        """
+        retry_policy = retry_policy or self.retry_policy
+        if isinstance(data, FormBody) and not data.resendable:
+            # URLs of an iterator are consumed by the first attempt
+            retry_policy = None
+        trace = {"attempts": 0} if self.hooks else None
+
+        def send():
+            return self._send_with_token(method, api_type, params=params, data=data, headers=headers,
+                                         stream=stream, raw=raw, trace=trace, endpoint=endpoint)
+
+        if trace is None:
+            return send() if retry_policy is None else retry_policy.call(send)
+
+        start = time.perf_counter()
+        try:
+            result = send() if retry_policy is None else retry_policy.call(send)
+        except Exception as e:
+            self._emit(method, api_type, trace, time.perf_counter() - start, error=e)
+            raise
+        self._emit(method, api_type, trace, time.perf_counter() - start)
+        return result
+
+    def _send_with_token(self, method, api_type, *, params=None, data=None, **kwargs):
+        """send request with token of this client, or with tokens of token pool failing over on quota errors"""
+        if self.token_pool is None:
+            return self._send(method, api_type, params=_with_token(params, self.token), data=_with_token(data, self.token),
+                              **kwargs)
+
+        tried = []
+        while True:
+            try:
+                token = self.token_pool.acquire(exclude=tried)
+            except DiffbotTokenError:
+                if tried:
+                    raise error
+                raise
+            try:
+                result = self._send(method, api_type, params=_with_token(params, token), data=_with_token(data, token),
+                                    **kwargs)
+            except BaseException as e:
+                self.token_pool.release(token, e)
+                if not self.token_pool.is_quota_error(e):
+                    raise
+                error = e
+                tried.append(token)
+                continue
+            self.token_pool.release(token)
+            return result
+
+    def _send(self, method, api_type, *, params=None, data=None, headers=None, stream=False, raw=False, trace=None,
+              endpoint=None):
+        """send request through pooled session, then decode and check response
+        If stream is True, return successful response without reading body.
+        If trace is given, timings of this attempt are recorded in it.
+        """
+        # in-flight slot of rate limiter is held until the body is read, or the streamed response is closed
+        slot = contextlib.ExitStack()
+        if self.rate_limiter is not None:
+            slot.enter_context(self.rate_limiter.limit(api_type))
+        with slot:
+            if trace is not None:
+                trace.update(attempts=trace["attempts"] + 1, connect=None, ttfb=None, download=None, bytes=None,
+                             wire_bytes=None, status=None)
+                reset_connect_time()
+                start = time.perf_counter()
+            # body is always streamed, to be decoded and counted by self.transfer
+            response = self.session.request(method, endpoint or self._get_end_point(api_type),
+                                            params=params,
+                                            data=data,
+                                            headers=headers,
+                                            timeout=self.timeout,
+                                            stream=True)
+            if trace is not None:
+                connect = get_connect_time()
+                trace.update(connect=connect, ttfb=time.perf_counter() - start - connect, status=response.status_code)
+
+            if not stream:
+                start = time.perf_counter()
+                body, wire_bytes = self.transfer.read(response)
+                if trace is not None:
+                    trace.update(bytes=len(body), wire_bytes=wire_bytes, download=time.perf_counter() - start)
+            elif response.status_code < 400:
+                response.close = _closing_also(response.close, slot.pop_all())
+                return response
+            else:
+                with response:
+                    body, _ = self.transfer.read(response)
+
+        if not stream:
+            return self._decode_response(response, body, raw=raw)
+        self._decode_response(response, body)
+        raise DiffbotUnexpectedBodyError(body.decode("utf-8", "replace"))
+
+    def _emit(self, method, api_type, trace, elapsed, error=None):
+        event = CallEvent(
+            api_type=api_type,
+            method=method,
+            endpoint=self._get_end_point(api_type),
+            elapsed=elapsed,
+            connect=trace.get("connect"),
+            ttfb=trace.get("ttfb"),
+            download=trace.get("download"),
+            response_bytes=trace.get("bytes"),
+            wire_bytes=trace.get("wire_bytes"),
+            status=trace.get("status"),
+            error_code=getattr(error, "code", None) if isinstance(error, DiffbotResponseError) else None,
+            retries=max(0, trace["attempts"] - 1),
+            error=error,
+        )
+        for hook in self.hooks:
+            hook(event)
+
+    def _decode_response(self, response, body, raw=False):
+        """decode JSON straight from body bytes, or return the bytes if raw is True"""
+        # error body of diffbot is small JSON object starting with "error" or "errorCode"
+        if raw and response.status_code < 400 and b'"error' not in body[:100]:
+            return body
+
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
         try:
-            response_data = response.json()
-        except json.JSONDecodeError as e:
-            raise DiffbotUnexpectedBodyError(response.text, raw=e)
-        return self._check_response(response_data)
+            response_data = self.json_loads(body)
+        except ValueError as e:
+            raise DiffbotUnexpectedBodyError(body.decode("utf-8", "replace"), raw=e, retry_after=retry_after)
+        response_data = self._check_response(response_data, retry_after=retry_after)
+        return body if raw else response_data
 
     # private API
     @classmethod
@@ -57,20 +271,26 @@ class Client():
         return "{}/v{}/{}".format(const.diffbot_url, const.diffbot_version, api_type)
 
     @staticmethod
-    def _check_response(response_data):
+    def _check_response(response_data, retry_after=None):
         """raise exception if response_data contains error"""
         if isinstance(response_data, dict) and response_data.get("error") is not None:
-            raise DiffbotResponseError(response_data["errorCode"], response_data["error"])
+            raise DiffbotResponseError(response_data["errorCode"], response_data["error"], retry_after=retry_after)
         return response_data
 
 
 class JobOperator(Client, metaclass=ABCMeta):
-    """wrapper of both bulk API and Crawlbot API"""
+    """wrapper of both bulk API and Crawlbot API
+    Job listings are cached shortly in status_cache, which several operators can share.
+    """
 
-    def __init__(self, token, job_name, api_type):
-        super().__init__(token)
+    def __init__(self, token, job_name, api_type, *, status_cache=None, **kwargs):
+        # a job belongs to the token which created it
+        if isinstance(token, TokenPool):
+            token = token.pin()
+        super().__init__(token, **kwargs)
         self.job_name = job_name
         self.api_type = api_type
+        self.status_cache = status_cache or JobStatusCache()
 
     @classmethod
     def generate_apiurl(cls, apiurl_type, *, args=None):
@@ -91,33 +311,142 @@ class JobOperator(Client, metaclass=ABCMeta):
             "pageProcessPattern": page_process_pattern,
         })
 
-    def lazy_fetch_extractors(self, job_index=0):
-        """"""
-        data = self.fetch_raw_data()
-        if len(data) == 0:
-            return []
-        else:
-            for datum in data:
+    def lazy_fetch_extractors(self, job_index=0, *, compact=False, fields=None):
+        """yield Extractor of each object of job data, streaming the response
+        If compact is True, yield CompactExtractor keeping raw bytes of each object
+        (or only fields, if given) instead of decoded dict.
+        """
+        if not compact:
+            for datum in self.iter_raw_data(job_index=job_index):
                 Extractor = diffbot.select_extractor(datum['type'])
                 yield Extractor(datum)
+            return
 
-    def fetch_raw_data(self, format=None, job_index=0):
-        """format : json or csv"""
-        status = self._fetch_job_status(job_index)
-        # check whether "Job has completed and no repeat is scheduled" or not
-        if status["status"] == 9:
-            return self._fetch_raw_data(
-                api_type="{}/data".format(self.api_type),
-                query=self._compose_bot_data_query(format=format)
-            )
-        else:
-            raise DiffbotJobStatusError(status["status"], status["message"])
+        for raw in self.iter_raw_objects(job_index):
+            yield diffbot.make_compact_extractor(raw, fields=fields)
+
+    def iter_raw_objects(self, job_index=0, chunk_size=64 * 1024):
+        """stream job data and yield raw JSON bytes of each object, without decoding it"""
+        self._check_job_completed(job_index)
+        return self._iter_raw_objects(chunk_size)
+
+    def _iter_raw_objects(self, chunk_size=64 * 1024):
+        response = self._stream_raw_data(
+            api_type="{}/data".format(self.api_type),
+            query=self._compose_bot_data_query(format="json")
+        )
+        with response:
+            yield from iter_json_array_raw(self.transfer.iter_content(response, chunk_size))
+
+    def iter_changed_data(self, delta_index, job_index=0, *, compact=False, fields=None):
+        """yield objects of job data which are new or changed since previous rounds, as recorded in delta_index.
+        delta_index is diffbot.DeltaIndex. Objects are hashed from raw bytes, unchanged ones are never yielded.
+        If the job reports the same roundsCompleted as the last finished round, its data is not downloaded at all.
+        A repeating job is read between its rounds (e.g. "next round to start"), or while a round is in progress
+        if roundsCompleted has grown since the last read. Otherwise raise DiffbotJobStatusError.
+        If compact is True, yield CompactExtractor instead of dict, see lazy_fetch_extractors.
+        """
+        job = self._fetch_job(job_index)
+        key = "{}/{}".format(self.api_type, self.job_name)
+        remote_round = job.get("roundsCompleted")
+        last_remote_round = delta_index.last_remote_round(key)
+        if remote_round is not None and remote_round == last_remote_round:
+            return
+        round_finished = job["jobStatus"]["status"] in ROUND_FINISHED
+        if not round_finished and (remote_round is None or remote_round <= (last_remote_round or 0)):
+            raise DiffbotJobStatusError(job["jobStatus"]["status"], job["jobStatus"]["message"])
+
+        for raw, _ in delta_index.changes(key, self._iter_raw_objects(), remote_round=remote_round):
+            yield diffbot.make_compact_extractor(raw, fields=fields) if compact else self.json_loads(raw)
+
+    def fetch_raw_data(self, format=None, job_index=0, *, raw=False):
+        """format : json or csv
+        If raw is True, return body bytes without decoding.
+        """
+        self._check_job_completed(job_index)
+        return self._fetch_raw_data(
+            api_type="{}/data".format(self.api_type),
+            query=self._compose_bot_data_query(format=format),
+            raw=raw,
+        )
+
+    def iter_raw_data(self, format=None, job_index=0, chunk_size=64 * 1024):
+        """stream job data and yield one object at a time, with constant memory.
+        format : json or csv. Each row of csv is yielded as dict keyed by header.
+        """
+        self._check_job_completed(job_index)
+        response = self._stream_raw_data(
+            api_type="{}/data".format(self.api_type),
+            query=self._compose_bot_data_query(format=format)
+        )
+        with response:
+            chunks = self.transfer.iter_content(response, chunk_size)
+            if format == "csv":
+                yield from iter_csv_rows(self._check_csv_body(chunks))
+            else:
+                yield from iter_json_array(chunks, loads=self.json_loads)
+
+    def _check_csv_body(self, chunks):
+        """yield chunks of CSV body, raising the error of JSON object sent instead of it with 2xx status"""
+        chunks = iter(chunks)
+        head = b""
+        for chunk in chunks:
+            head += chunk
+            if head.lstrip():
+                break
+        if head.lstrip().startswith(b"{"):
+            body = head + b"".join(chunks)
+            try:
+                response_data = self.json_loads(body)
+            except ValueError as e:
+                raise DiffbotUnexpectedBodyError(body.decode("utf-8", "replace"), raw=e)
+            self._check_response(response_data)
+            raise DiffbotUnexpectedBodyError(body.decode("utf-8", "replace"))
+        if head:
+            yield head
+        yield from chunks
+
+    def export_data(self, path, *, format="jsonl", compression=None, fields=None, job_index=0, resumable=True):
+        """export job data to local file(s) at path, return number of exported objects.
+        format : jsonl or columnar, compression : None, gzip or zstd.
+        An interrupted export resumes its download on the next call with the same path.
+        If resumable is False, the download is transferred compressed instead, but is not resumed.
+        see also diffbot.export.export_job_data
+        """
+        return export_job_data(self, path, format=format, compression=compression, fields=fields, job_index=job_index,
+                               resumable=resumable)
 
     def job_completed(self, job_index=0):
         """get searcher object"""
         status = self._fetch_job_status(job_index)
         # check whether "Job has completed and no repeat is scheduled" or not
-        return status["status"] == 9
+        return status["status"] == COMPLETED
+
+    def _check_job_completed(self, job_index):
+        """raise DiffbotJobStatusError unless job has completed"""
+        status = self._fetch_job_status(job_index)
+        # check whether "Job has completed and no repeat is scheduled" or not
+        if status["status"] != COMPLETED:
+            raise DiffbotJobStatusError(status["status"], status["message"])
+
+    def wait_until_complete(self, timeout=None, poll_interval=5.0, *, max_poll_interval=60.0, backoff=1.5, job_index=0,
+                            clock=time.monotonic, sleep=time.sleep):
+        """poll job status until the job completes, and return the status.
+        Polling interval grows by backoff up to max_poll_interval.
+        Raise DiffbotJobStatusError if the job has not completed in timeout seconds.
+        To wait for many jobs, use diffbot.wait_for_jobs.
+        """
+        deadline = clock() + timeout if timeout is not None else None
+        interval = poll_interval
+        while True:
+            status = self._fetch_job_status(job_index)
+            if status["status"] == COMPLETED:
+                return status
+            remaining = deadline - clock() if deadline is not None else interval
+            if remaining <= 0:
+                raise DiffbotJobStatusError(status["status"], status["message"])
+            sleep(min(interval, remaining))
+            interval = min(max_poll_interval, interval * backoff)
 
     def _fetch_job_status(self, job_index):
         job = self._fetch_job(job_index)
@@ -128,24 +457,30 @@ class JobOperator(Client, metaclass=ABCMeta):
         return data["jobs"][job_index]
 
     def _fetch_jobs(self):
-        return self._fetch_raw_data(
-            api_type=self.api_type,
-            query={
-                "name": self.job_name,
-            },
-        )
+        data = self.status_cache.get(self.token, self.api_type, self.job_name)
+        if data is None:
+            data = self._fetch_raw_data(
+                api_type=self.api_type,
+                query={
+                    "name": self.job_name,
+                },
+            )
+            self.status_cache.set(self.token, self.api_type, self.job_name, data)
+        return data
+
+    def _fetch_all_jobs(self):
+        """fetch listing of every job of the token, which also refreshes status of each job in status_cache"""
+        data = self._fetch_raw_data(api_type=self.api_type, query={})
+        self.status_cache.set(self.token, self.api_type, None, data)
+        return data
 
     def fetch_completed_searcher(self, job_index=0):
         """get searcher object"""
-        status = self._fetch_job_status(job_index)
-        # check whether "Job has completed and no repeat is scheduled" or not
-        if status["status"] == 9:
-            return self._get_searcher()
-        else:
-            raise DiffbotJobStatusError(status["status"], status["message"])
+        self._check_job_completed(job_index)
+        return self._get_searcher()
 
     def _get_searcher(self):
-        return diffbot.Searcher(self.token, self.job_name)
+        return diffbot.Searcher(self.token, self.job_name, **self._shared_options())
 
     def _compose_bot_data_query(self, format=None):
         """compose query of https://api.diffbot.com/v3/{}/data.format(self.api_type)
@@ -191,6 +526,7 @@ class JobOperator(Client, metaclass=ABCMeta):
             }
         }
 
+        self.status_cache.invalidate(self.token, self.api_type, self.job_name)
         return self._fetch_raw_data(
             api_type=self.api_type,
             query={
@@ -206,6 +542,8 @@ class JobOperator(Client, metaclass=ABCMeta):
 
 class Extractor():
     """base class of ooExtractor"""
+    __slots__ = ("data",)
+
     def __init__(self, data):
         self.data = data
 
@@ -222,5 +560,97 @@ class Extractor():
         return self.data['title']
 
 
+class CompactExtractor(Extractor):
+    """Extractor keeping raw JSON bytes of an object and decoding each field on access.
+    If fields is given, only these fields are decoded at once and raw bytes are dropped,
+    so get_raw_data() returns the projected dict.
+    """
+    __slots__ = ("_raw", "_index", "_values")
+
+    def __init__(self, raw, fields=None):
+        self._values = {}
+        self._index = None
+        self._raw = raw
+        if fields is not None:
+            index = self._get_index()
+            self._values = {field: jsonlib.loads(raw[slice(*index[field])]) for field in fields if field in index}
+            self._raw = None
+            self._index = None
+
+    @property
+    def data(self):
+        return _FieldView(self)
+
+    def get_raw_data(self):
+        if self._raw is None:
+            return dict(self._values)
+        return jsonlib.loads(self._raw)
+
+    def _get_index(self):
+        if self._index is None:
+            self._index = scan_object(self._raw)
+        return self._index
+
+    def _get_field(self, key):
+        if key in self._values or self._raw is None:
+            return self._values[key]
+        value = jsonlib.loads(self._raw[slice(*self._get_index()[key])])
+        self._values[key] = value
+        return value
+
+    def _keys(self):
+        if self._raw is None:
+            return list(self._values)
+        return list(self._get_index())
+
+
+class _FieldView(collections.abc.Mapping):
+    """read-only dict-like view of fields of CompactExtractor"""
+    __slots__ = ("_extractor",)
+
+    def __init__(self, extractor):
+        self._extractor = extractor
+
+    def __getitem__(self, key):
+        return self._extractor._get_field(key)
+
+    def __iter__(self):
+        return iter(self._extractor._keys())
+
+    def __len__(self):
+        return len(self._extractor._keys())
+
+
+def _closing_also(close, slot):
+    """close of streamed response, which also releases slot (ExitStack) once"""
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            slot.close()
+
+    return close_and_release
+
+
+def _with_token(fields, token):
+    """urlencode fields (dict, or str already urlencoded) with token, None if fields is None.
+    FormBody streamed by chunks gets token as one of its fields.
+    """
+    if fields is None:
+        return None
+    if isinstance(fields, str):
+        return fields + _encode_token(token)
+    if isinstance(fields, FormBody):
+        return fields.with_token(token)
+    # GET and POST body content should be in querystring format (key/value pairs) in diffbot
+    return urllib.parse.urlencode({**fields, "token": token})
+
+
+@functools.lru_cache(maxsize=256)
+def _encode_token(token):
+    return "&" + urllib.parse.urlencode({"token": token})
+
+
 def drop_none_value(dic):
     return {key: value for key, value in dic.items() if value is not None}
@@ -0,0 +1,190 @@
+import bisect
+import collections
+import math
+import threading
+import time
+import requests.adapters
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+"""this file contains instrumentation of Client.
+Client calls each hook with CallEvent after every call. HistogramCollector is a hook
+aggregating events per api type, and to_prometheus renders it in Prometheus text format.
+"""
+
+CallEvent = collections.namedtuple("CallEvent", [
+    "api_type",          # e.g. "article", "bulk/data"
+    "method",            # GET or POST
+    "endpoint",          # URL without query
+    "elapsed",           # seconds of whole call, including retries and rate limit waits
+    "connect",           # seconds to open connection in last attempt, 0 if pooled connection is reused
+    "ttfb",              # seconds from sending request to receiving headers in last attempt, excluding connect
+    "download",          # seconds to read body in last attempt, None if body is streamed to caller
+    "response_bytes",    # size of decoded body, None if body is streamed to caller
+    "wire_bytes",        # size of body on the wire, before content decoding, None if body is streamed to caller
+    "status",            # HTTP status of last attempt, None if no response
+    "error_code",        # errorCode of DiffbotResponseError, None if no error
+    "retries",           # number of retries
+    "error",             # exception raised by the call, None if succeeded
+])
+
+_connect_times = threading.local()
+
+
+class _TimedConnectionMixin():
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _connect_times.value = getattr(_connect_times, "value", 0.0) + time.perf_counter() - start
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(requests.adapters.HTTPAdapter):
+    """HTTPAdapter recording seconds spent on opening connections of current thread"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+
+def reset_connect_time():
+    _connect_times.value = 0.0
+
+
+def get_connect_time():
+    """seconds spent on opening connections in current thread since reset_connect_time"""
+    return getattr(_connect_times, "value", 0.0)
+
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class HistogramCollector():
+    """hook aggregating CallEvent per api type.
+    Percentiles are computed over the latest window events, Prometheus buckets over every event.
+    """
+
+    def __init__(self, *, window=10000, buckets=DEFAULT_BUCKETS):
+        self.window = window
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def __call__(self, event):
+        with self._lock:
+            series = self._series.get(event.api_type)
+            if series is None:
+                series = self._series[event.api_type] = _Series(self.window, len(self.buckets))
+            series.add(event, bisect.bisect_left(self.buckets, event.elapsed))
+
+    def api_types(self):
+        with self._lock:
+            return sorted(self._series)
+
+    def percentiles(self, api_type, qs=(50, 95, 99)):
+        """return {"p50": seconds, ...} of elapsed time of api_type"""
+        with self._lock:
+            samples = sorted(self._series[api_type].samples)
+        return {"p{}".format(q): _percentile(samples, q) for q in qs}
+
+    def summary(self):
+        """return {api_type: {"count", "errors", "retries", "bytes", "wire_bytes", "p50", "p95", "p99"}}"""
+        result = {}
+        for api_type in self.api_types():
+            with self._lock:
+                series = self._series[api_type]
+                result[api_type] = {
+                    "count": series.count,
+                    "errors": sum(series.errors.values()),
+                    "retries": series.retries,
+                    "bytes": series.bytes,
+                    "wire_bytes": series.wire_bytes,
+                }
+            result[api_type].update(self.percentiles(api_type))
+        return result
+
+    def to_prometheus(self, prefix="diffbot"):
+        return to_prometheus(self, prefix=prefix)
+
+
+class _Series():
+
+    def __init__(self, window, n_buckets):
+        self.samples = collections.deque(maxlen=window)
+        self.bucket_counts = [0] * (n_buckets + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.bytes = 0
+        self.wire_bytes = 0
+        self.retries = 0
+        self.errors = collections.Counter()
+
+    def add(self, event, bucket):
+        self.samples.append(event.elapsed)
+        self.bucket_counts[bucket] += 1
+        self.count += 1
+        self.sum += event.elapsed
+        self.bytes += event.response_bytes or 0
+        self.wire_bytes += event.wire_bytes or 0
+        self.retries += event.retries
+        if event.error is not None:
+            self.errors[event.error_code if event.error_code is not None else type(event.error).__name__] += 1
+
+
+def _percentile(samples, q):
+    """nearest-rank percentile of sorted samples"""
+    if not samples:
+        return None
+    return samples[max(0, math.ceil(q / 100 * len(samples)) - 1)]
+
+
+def to_prometheus(collector, prefix="diffbot"):
+    """render HistogramCollector in Prometheus text exposition format"""
+    lines = [
+        "# HELP {}_request_duration_seconds Duration of diffbot API calls.".format(prefix),
+        "# TYPE {}_request_duration_seconds histogram".format(prefix),
+    ]
+    counters = {"response_bytes_total": [], "wire_bytes_total": [], "retries_total": [], "errors_total": []}
+    with collector._lock:
+        for api_type in sorted(collector._series):
+            series = collector._series[api_type]
+            label = 'api_type="{}"'.format(_escape(api_type))
+            cumulative = 0
+            for bound, count in zip(collector.buckets + (math.inf,), series.bucket_counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(float(bound))
+                lines.append('{}_request_duration_seconds_bucket{{{},le="{}"}} {}'.format(prefix, label, le, cumulative))
+            lines.append("{}_request_duration_seconds_sum{{{}}} {}".format(prefix, label, repr(series.sum)))
+            lines.append("{}_request_duration_seconds_count{{{}}} {}".format(prefix, label, series.count))
+            counters["response_bytes_total"].append("{}_response_bytes_total{{{}}} {}".format(prefix, label, series.bytes))
+            counters["wire_bytes_total"].append("{}_wire_bytes_total{{{}}} {}".format(prefix, label, series.wire_bytes))
+            counters["retries_total"].append("{}_retries_total{{{}}} {}".format(prefix, label, series.retries))
+            for code, count in sorted(series.errors.items(), key=str):
+                counters["errors_total"].append('{}_errors_total{{{},code="{}"}} {}'.format(prefix, label, _escape(str(code)), count))
+    for name, samples in counters.items():
+        lines.append("# TYPE {}_{} counter".format(prefix, name))
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,242 @@
+import queue
+import threading
+import time
+from concurrent import futures
+
+"""this file contains pipeline running I/O-bound fetches on threads and CPU-bound post-processing on processes.
+
+    urls --[url queue]--> fetch threads --[raw queue]--> process pool --[results]--> caller
+
+Fetch threads pass raw response bytes to the process pool, so only bytes are pickled to workers.
+Every queue is bounded, so memory does not grow when a stage or the caller is slower than the others.
+"""
+
+_DONE = object()
+_POLL = 0.05    # seconds between checks of abort while blocked on a queue
+
+
+class _StageStats():
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.errors = 0
+        self.busy = 0.0    # seconds spent in the stage, summed over workers
+
+    def add(self, seconds, error=False):
+        with self.lock:
+            self.count += 1
+            self.errors += error
+            self.busy += seconds
+
+
+def _timed(transform, raw):
+    """run in worker process, return (result, seconds)"""
+    start = time.perf_counter()
+    result = transform(raw)
+    return result, time.perf_counter() - start
+
+
+class Pipeline():
+    """fetch raw data of urls on io_workers threads with fetcher (diffbot.SingleFetcher),
+    then call transform(raw_bytes) on cpu_workers processes.
+    transform must be picklable, i.e. a function defined at module level, and so must be its result.
+    queue_size bounds urls waiting for fetch, raw bodies waiting for transform,
+    and transforms submitted but not yet taken by the caller.
+    """
+
+    def __init__(self, fetcher, transform, *, api_type="article", args=None, io_workers=8, cpu_workers=None,
+                 queue_size=64, mp_context=None):
+        self.fetcher = fetcher
+        self.transform = transform
+        self.api_type = api_type
+        self.args = args
+        self.io_workers = io_workers
+        self.cpu_workers = cpu_workers
+        self.queue_size = queue_size
+        self.mp_context = mp_context
+        self._stopping = threading.Event()
+        self._abort = threading.Event()
+        self._urls = self._raws = self._results = None
+        self._slots = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._stats = None
+        self._started = None
+        self._template = None
+        self._feed_error = None
+
+    def run(self, target_urls):
+        """yield (url, result of transform) as each transform completes.
+        A failed fetch or transform is yielded as (url, exception) instead of aborting the pipeline.
+        target_urls is consumed lazily; an exception raised by it is raised here after urls taken before it.
+        Closing the generator stops the pipeline without draining.
+        """
+        self._stopping.clear()
+        self._abort.clear()
+        self._urls = queue.Queue(self.queue_size)
+        self._raws = queue.Queue(self.queue_size)
+        self._results = queue.Queue()
+        self._slots = threading.Semaphore(self.queue_size)
+        self._stats = {"fetch": _StageStats(), "transform": _StageStats()}
+        self._started = time.monotonic()
+        self._pending = set()
+        self._fetchers_left = self.io_workers
+        self._feed_error = None
+        self._template = self.fetcher.prepare(self.api_type, args=self.args)
+
+        executor = futures.ProcessPoolExecutor(max_workers=self.cpu_workers, mp_context=self.mp_context)
+        threads = [threading.Thread(target=self._feed, args=(target_urls,), daemon=True)]
+        threads += [threading.Thread(target=self._fetch, daemon=True) for _ in range(self.io_workers)]
+        threads.append(threading.Thread(target=self._dispatch, args=(executor,), daemon=True))
+        for thread in threads:
+            thread.start()
+        try:
+            while not self._abort.is_set():
+                try:
+                    item = self._results.get(timeout=_POLL)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    if self._feed_error is not None:
+                        raise self._feed_error
+                    break
+                self._slots.release()
+                yield item
+        finally:
+            self._abort.set()
+            for thread in threads:
+                thread.join()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def stop(self, *, drain=True):
+        """stop taking new urls. If drain is True, urls already taken are fetched and transformed
+        and their results are still yielded by run, otherwise run stops at once.
+        """
+        self._stopping.set()
+        if not drain:
+            self._abort.set()
+
+    def stats(self):
+        """return throughput and queue depth of each stage:
+        {"fetch": {"count", "errors", "per_second", "busy", "queue_depth"}, "transform": {..., "in_flight"}, "output": {...}}
+        queue_depth of a stage is the number of items waiting for it, busy is seconds spent in it summed over workers.
+        """
+        if self._stats is None:
+            return {}
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        result = {}
+        for name, stats in self._stats.items():
+            with stats.lock:
+                result[name] = {
+                    "count": stats.count,
+                    "errors": stats.errors,
+                    "per_second": stats.count / elapsed,
+                    "busy": stats.busy,
+                }
+        result["fetch"]["queue_depth"] = self._urls.qsize()
+        result["transform"]["queue_depth"] = self._raws.qsize()
+        with self._lock:
+            result["transform"]["in_flight"] = len(self._pending)
+        result["output"] = {"queue_depth": self._results.qsize()}
+        return result
+
+    def _put(self, q, item):
+        """put item, unless aborted while q is full. return False if aborted"""
+        while not self._abort.is_set():
+            try:
+                q.put(item, timeout=_POLL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, q):
+        """get item, or _DONE if aborted"""
+        while not self._abort.is_set():
+            try:
+                return q.get(timeout=_POLL)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def _acquire_slot(self):
+        while not self._abort.is_set():
+            if self._slots.acquire(timeout=_POLL):
+                return True
+        return False
+
+    def _feed(self, target_urls):
+        try:
+            target_urls = iter(target_urls)
+            while not self._stopping.is_set():
+                target_url = next(target_urls, _DONE)
+                if target_url is _DONE or not self._put(self._urls, target_url):
+                    break
+        except Exception as e:
+            # raised by run() once urls taken before it are drained
+            self._feed_error = e
+        finally:
+            for _ in range(self.io_workers):
+                self._put(self._urls, _DONE)
+
+    def _fetch(self):
+        try:
+            while True:
+                target_url = self._get(self._urls)
+                if target_url is _DONE:
+                    break
+                start = time.monotonic()
+                try:
+                    raw = self._template.fetch_raw_data(target_url, raw=True)
+                except Exception as e:
+                    # any failure, e.g. DiffbotTokenError of a cooling TokenPool, is a result of its url
+                    self._stats["fetch"].add(time.monotonic() - start, error=True)
+                    if self._acquire_slot():
+                        self._results.put((target_url, e))
+                    continue
+                self._stats["fetch"].add(time.monotonic() - start)
+                self._put(self._raws, (target_url, raw))
+        finally:
+            with self._lock:
+                self._fetchers_left -= 1
+                last = self._fetchers_left == 0
+            if last:
+                self._put(self._raws, _DONE)
+
+    def _dispatch(self, executor):
+
+        def done(future, target_url):
+            with self._lock:
+                self._pending.discard(future)
+            try:
+                result, seconds = future.result()
+                self._stats["transform"].add(seconds)
+            except futures.CancelledError:
+                return
+            except Exception as e:
+                result = e
+                self._stats["transform"].add(0.0, error=True)
+            self._results.put((target_url, result))
+
+        try:
+            while True:
+                item = self._get(self._raws)
+                if item is _DONE or not self._acquire_slot():
+                    break
+                target_url, raw = item
+                try:
+                    future = executor.submit(_timed, self.transform, raw)
+                except Exception as e:
+                    # e.g. BrokenProcessPool after a worker died, so each remaining url gets it as its result
+                    self._stats["transform"].add(0.0, error=True)
+                    self._results.put((target_url, e))
+                    continue
+                with self._lock:
+                    self._pending.add(future)
+                future.add_done_callback(lambda future, target_url=target_url: done(future, target_url))
+        finally:
+            with self._lock:
+                pending = list(self._pending)
+            futures.wait(pending)
+            self._results.put(_DONE)
@@ -0,0 +1,134 @@
+import contextlib
+import threading
+import time
+
+"""this file contains client-side rate limiter shared by clients of one token.
+Diffbot limits call rate per token, so every client using the token should go through the same RateLimiter.
+"""
+
+
+class TokenBucket():
+    """token bucket refilled by rate tokens per second up to capacity (default rate, but at least 1 call).
+    reserve() takes one token, even in debt, and returns seconds to wait until the token is actually available.
+    """
+
+    def __init__(self, rate, capacity=None, *, clock=time.monotonic):
+        self.rate = rate
+        # below 1 call per second, capacity of rate could never hold a whole token
+        self.capacity = capacity or max(1.0, rate)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self.rate
+
+
+class RateLimiter():
+    """limit call rate with token buckets and number of requests in flight.
+    rate, burst: default calls per second and bucket capacity
+    per_api_type: {api_type: rate or (rate, burst)} overriding the default, e.g. {"bulk": 0.5, "crawl": 0.5}
+        "bulk/data" falls back to the setting of "bulk".
+    max_in_flight: max number of requests in flight over all api types
+    clock, sleep: replaceable by fake ones for tests
+    """
+
+    _registry = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, rate=None, *, burst=None, per_api_type=None, max_in_flight=None, clock=time.monotonic, sleep=time.sleep):
+        self._clock = clock
+        self._sleep = sleep
+        self._buckets = {}
+        if rate is not None:
+            self._buckets[None] = TokenBucket(rate, burst, clock=clock)
+        for api_type, setting in (per_api_type or {}).items():
+            rate, burst = setting if isinstance(setting, tuple) else (setting, None)
+            self._buckets[api_type] = TokenBucket(rate, burst, clock=clock)
+
+        self.max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._in_flight = 0
+        self._calls = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @classmethod
+    def for_token(cls, token, **kwargs):
+        """get RateLimiter shared by every caller of token, created with kwargs on first call"""
+        with cls._registry_lock:
+            if token not in cls._registry:
+                cls._registry[token] = cls(**kwargs)
+            return cls._registry[token]
+
+    @contextlib.contextmanager
+    def limit(self, api_type):
+        """block until a call of api_type is allowed, and hold an in-flight slot while the block runs"""
+        start = self._clock()
+        with self._lock:
+            self._waiting += 1
+        try:
+            if self._slots is not None:
+                self._slots.acquire()
+            try:
+                bucket = self._select_bucket(api_type)
+                delay = bucket.reserve() if bucket is not None else 0
+                if delay > 0:
+                    self._sleep(delay)
+            except BaseException:
+                if self._slots is not None:
+                    self._slots.release()
+                raise
+        finally:
+            waited = self._clock() - start
+            with self._lock:
+                self._waiting -= 1
+                self._calls += 1
+                self._total_wait += waited
+                self._max_wait = max(self._max_wait, waited)
+
+        with self._lock:
+            self._in_flight += 1
+        try:
+            yield waited
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            if self._slots is not None:
+                self._slots.release()
+
+    def _select_bucket(self, api_type):
+        for key in (api_type, api_type.split("/")[0], None):
+            if key in self._buckets:
+                return self._buckets[key]
+        return None
+
+    @property
+    def queue_depth(self):
+        """number of calls waiting for rate or in-flight slot"""
+        return self._waiting
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self._calls,
+                "queue_depth": self._waiting,
+                "in_flight": self._in_flight,
+                "total_wait": self._total_wait,
+                "max_wait": self._max_wait,
+                "mean_wait": self._total_wait / self._calls if self._calls else 0.0,
+            }
@@ -0,0 +1,91 @@
+import email.utils
+import random
+import threading
+import time
+import requests
+import urllib3
+from .error import DiffbotResponseError, DiffbotUnexpectedBodyError
+
+"""this file contains RetryPolicy, retrying transient failures of diffbot API with exponential backoff"""
+
+
+class RetryPolicy():
+    """retry transient failures with exponential backoff and full jitter.
+    max_attempts: number of attempts including the first one
+    backoff_base, backoff_cap: n-th retry waits random(0, min(backoff_cap, backoff_base * 2 ** n)) seconds
+    retryable_codes: errorCode values of DiffbotResponseError to retry
+    retry_unexpected_body: retry DiffbotUnexpectedBodyError (non-JSON body, e.g. from a proxy in front of diffbot)
+    Connection errors, including resets while reading the body, and timeouts are always retried. Retry-After of the response overrides the backoff.
+    max_retry_after: longest Retry-After to wait, backoff_cap if None. The call gives up on a longer one.
+    """
+
+    def __init__(self, max_attempts=3, *, backoff_base=0.5, backoff_cap=30.0, retryable_codes=(429, 500, 502, 503, 504),
+                 retry_unexpected_body=True, max_retry_after=None, random=random.random, sleep=time.sleep):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.retryable_codes = frozenset(retryable_codes)
+        self.retry_unexpected_body = retry_unexpected_body
+        self.max_retry_after = backoff_cap if max_retry_after is None else max_retry_after
+        self._random = random
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.give_ups = 0
+
+    def call(self, func):
+        """call func until it succeeds, fails with non-retryable error or runs out of attempts"""
+        attempt = 1
+        while True:
+            try:
+                return func()
+            except Exception as e:
+                if not self.is_retryable(e):
+                    raise
+                delay = self.get_delay(attempt, e)
+                if attempt >= self.max_attempts or delay is None:
+                    with self._lock:
+                        self.give_ups += 1
+                    raise
+            with self._lock:
+                self.retries += 1
+            self._sleep(delay)
+            attempt += 1
+
+    def is_retryable(self, error):
+        if isinstance(error, DiffbotResponseError):
+            return error.code in self.retryable_codes
+        if isinstance(error, DiffbotUnexpectedBodyError):
+            return self.retry_unexpected_body
+        # ChunkedEncodingError is a connection reset while reading the body
+        return isinstance(error, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                                  urllib3.exceptions.ProtocolError))
+
+    def get_delay(self, attempt, error=None):
+        """seconds to wait before attempt + 1, None if Retry-After of error exceeds max_retry_after"""
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_retry_after else None
+        return self._random() * min(self.backoff_cap, self.backoff_base * 2 ** (attempt - 1))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "retries": self.retries,
+                "give_ups": self.give_ups,
+            }
+
+
+def parse_retry_after(value):
+    """seconds to wait from Retry-After header, which is either seconds or HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
@@ -0,0 +1,205 @@
+import itertools
+import time
+from concurrent import futures
+import requests
+import diffbot
+from .error import DiffbotJobStatusError, DiffbotResponseError, DiffbotTokenError, DiffbotUnexpectedBodyError
+from .jobs import JobStatusCache, poll_jobs, COMPLETED, NO_URLS, FAILED
+from .meta import Client
+
+"""this file contains submission of a long URL list as several bulk jobs.
+Each shard is one bulk job of at most shard_size URLs. Shards are submitted concurrently,
+polled together by one listing call, and their data is merged into one stream.
+A shard whose job fails is retried alone, under a new job name.
+"""
+
+_ERRORS = (DiffbotResponseError, DiffbotUnexpectedBodyError, DiffbotJobStatusError, DiffbotTokenError,
+           requests.RequestException)
+
+
+class Shard():
+    """one bulk job of ShardedBulkJob.
+    error is the exception of the last failure of its submission, job or data download, None if none.
+    """
+    __slots__ = ("index", "urls", "operator", "attempts", "error", "consumed")
+
+    def __init__(self, index, urls):
+        self.index = index
+        self.urls = urls
+        self.operator = None
+        self.attempts = 0
+        self.error = None
+        self.consumed = False    # whole data has been yielded
+
+    @property
+    def job_name(self):
+        return self.operator.job_name if self.operator is not None else None
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+    def __repr__(self):
+        return "<Shard {} {} urls={} attempts={} error={!r}>".format(
+            self.index, self.job_name, len(self.urls), self.attempts, self.error)
+
+
+class ShardedBulkJob():
+    """wrapper of bulk API splitting a long URL list into several jobs named "{job_name}-{index}".
+    Retried shards are named "{job_name}-{index}-r{retry}".
+    Every BulkJobOperator of shards shares one pooled session and status_cache,
+    with diffbot.TokenPool as token, each shard is pinned to one token of the pool.
+    other keyword arguments (rate_limiter, retry_policy, hooks, ...) are passed to each of them.
+    """
+
+    def __init__(self, token, job_name, *, shard_size=10000, max_workers=4, status_cache=None, session=None,
+                 pool_size=None, **kwargs):
+        self.token = token
+        self.job_name = job_name
+        self.shard_size = shard_size
+        self.max_workers = max_workers
+        self.status_cache = status_cache or JobStatusCache()
+        self._own_session = session is None
+        self.session = session or Client.create_session(pool_size=pool_size or max_workers)
+        self._options = kwargs
+        self.shards = []
+        self._job_args = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """close pooled connections, unless the session was given by caller"""
+        if self._own_session:
+            self.session.close()
+
+    @property
+    def failed_shards(self):
+        return [shard for shard in self.shards if shard.failed]
+
+    def start_jobs(self, target_urls, apiurl, *, args=None, headers=None):
+        """split target_urls into shards and start a bulk job of each on a thread pool, return the shards.
+        target_urls is consumed lazily: at most 2 * max_workers submissions are pending at once.
+        A failed submission is recorded in shard.error instead of aborting the others.
+        URLs of each shard are kept to retry it.
+        """
+        self._job_args = (apiurl, args, headers)
+        urls = iter(target_urls)
+        new_shards = []
+        executor = futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        submitted = []
+        pending = []
+        try:
+            for index in itertools.count(len(self.shards)):
+                chunk = list(itertools.islice(urls, self.shard_size))
+                if not chunk:
+                    break
+                shard = Shard(index, chunk)
+                self.shards.append(shard)
+                new_shards.append(shard)
+                if len(pending) >= 2 * self.max_workers:
+                    done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                    pending = [future for future in pending if future not in done]
+                future = executor.submit(self._submit, shard)
+                submitted.append(future)
+                pending.append(future)
+            for future in submitted:
+                future.result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        return new_shards
+
+    def retry_shard(self, shard, *, delete=True):
+        """start job of shard again under a new job name, deleting its previous job if delete is True"""
+        if delete and shard.operator is not None:
+            try:
+                shard.operator.delete_job()
+            except _ERRORS:
+                pass
+        self._submit(shard)
+        return shard
+
+    def retry_failed(self, *, delete=True):
+        """retry every failed shard on a thread pool, return the retried shards"""
+        shards = self.failed_shards
+        with futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(lambda shard: self.retry_shard(shard, delete=delete), shards))
+        return shards
+
+    def _submit(self, shard):
+        name = "{}-{}".format(self.job_name, shard.index)
+        if shard.attempts:
+            name = "{}-r{}".format(name, shard.attempts)
+        shard.attempts += 1
+        shard.error = None
+        shard.consumed = False
+        shard.operator = diffbot.BulkJobOperator(self.token, name, session=self.session,
+                                                 status_cache=self.status_cache, **self._options)
+        apiurl, args, headers = self._job_args
+        try:
+            shard.operator.start_job(shard.urls, apiurl, args=args, headers=headers)
+        except _ERRORS as e:
+            shard.error = e
+
+    def statuses(self):
+        """return {job name: jobStatus} of every submitted shard, by one listing call per token"""
+        by_token = {}
+        for shard in self.shards:
+            if shard.operator is not None:
+                by_token.setdefault(shard.operator.token, []).append(shard.operator)
+        statuses = {}
+        for operators in by_token.values():
+            names = {operator.job_name for operator in operators}
+            data = operators[0]._fetch_all_jobs()
+            statuses.update((job["name"], job["jobStatus"]) for job in data.get("jobs", []) if job.get("name") in names)
+        return statuses
+
+    def wait(self, timeout=None, poll_interval=5.0, *, max_poll_interval=60.0, backoff=1.5,
+             clock=time.monotonic, sleep=time.sleep):
+        """yield each pending shard as its job finishes, successfully or not (see shard.failed).
+        Pending shards are those neither failed nor consumed.
+        Shards not finished in timeout seconds are yielded as failed with DiffbotJobStatusError.
+        """
+        shards = {shard.job_name: shard for shard in self.shards if not shard.failed and not shard.consumed}
+        try:
+            for job_name, status in poll_jobs([shard.operator for shard in shards.values()],
+                                              final_statuses=(COMPLETED, NO_URLS, FAILED), timeout=timeout,
+                                              poll_interval=poll_interval, max_poll_interval=max_poll_interval,
+                                              backoff=backoff, clock=clock, sleep=sleep):
+                shard = shards.pop(job_name)
+                if status["status"] != COMPLETED:
+                    shard.error = DiffbotJobStatusError(status["status"], status["message"])
+                yield shard
+        except DiffbotJobStatusError as e:
+            for shard in shards.values():
+                shard.error = e
+                yield shard
+
+    def iter_raw_data(self, format=None, *, timeout=None, poll_interval=5.0, **kwargs):
+        """yield objects of every pending shard, streaming data of each shard as its job completes.
+        Data of failed shards is skipped, see failed_shards and retry_failed.
+        Consumed shards are not yielded again, so after retry_failed this yields data of the retried shards only.
+        If download of a shard fails midway, objects already yielded are yielded again after its retry.
+        kwargs are passed to wait.
+        """
+        return self._iter_shards(lambda operator: operator.iter_raw_data(format=format),
+                                 timeout=timeout, poll_interval=poll_interval, **kwargs)
+
+    def lazy_fetch_extractors(self, *, compact=False, fields=None, timeout=None, poll_interval=5.0, **kwargs):
+        """yield Extractor of every object of pending shards, see iter_raw_data"""
+        return self._iter_shards(lambda operator: operator.lazy_fetch_extractors(compact=compact, fields=fields),
+                                 timeout=timeout, poll_interval=poll_interval, **kwargs)
+
+    def _iter_shards(self, fetch, **kwargs):
+        for shard in self.wait(**kwargs):
+            if shard.failed:
+                continue
+            try:
+                yield from fetch(shard.operator)
+            except _ERRORS as e:
+                shard.error = e
+                continue
+            shard.consumed = True
@@ -0,0 +1,44 @@
+import sqlite3
+import threading
+
+"""this file contains per-thread sqlite connections shared by SqliteCache, DeltaIndex and LocalIndex.
+Databases are opened in WAL mode with synchronous=NORMAL, so several threads and worker processes
+can share one file, and a commit does not wait for fsync of the log.
+"""
+
+
+class ThreadConnections():
+    """sqlite connections to database at path, one per thread, since a connection can not be shared between threads.
+    pragmas : PRAGMA statements run on each new connection after the common ones, e.g. "mmap_size=1073741824"
+    """
+
+    def __init__(self, path, *, timeout=30.0, pragmas=()):
+        self.path = path
+        self.timeout = timeout
+        self.pragmas = tuple(pragmas)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._connections = []
+
+    def get(self):
+        """connection of current thread, opened on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # each connection is used by its thread only, check_same_thread=False lets close() close it
+            conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for pragma in self.pragmas:
+                conn.execute("PRAGMA " + pragma)
+            with self._lock:
+                self._connections.append(conn)
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """close connections of every thread, which must not be using them. get() opens a new one afterwards"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for conn in connections:
+            conn.close()
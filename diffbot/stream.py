@@ -0,0 +1,195 @@
+import codecs
+import csv
+import json
+import re
+from .error import DiffbotResponseError, DiffbotUnexpectedBodyError
+
+"""this file contains streaming parsers of {bulk,crawl}/data.
+They read response body chunk by chunk and yield one object at a time,
+so memory does not grow with the size of job output.
+"""
+
+_SPECIAL = re.compile(rb'[\[\]{}",]')
+_OBJECT_SPECIAL = re.compile(rb'[\[\]{}",:]')
+_WHITESPACE = b" \t\r\n"
+
+
+class JsonArrayScanner():
+    """find boundaries of elements of top-level JSON array in chunks of bytes.
+    feed() returns raw bytes of elements completed by the chunk. Elements are not decoded.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._elem_start = 0
+        self.is_array = None    # None until the first non-whitespace byte is read
+        self.finished = False
+
+    def feed(self, chunk):
+        buf = self._buf
+        buf += chunk
+        elements = []
+
+        if self.is_array is None:
+            head = bytes(buf).lstrip(_WHITESPACE)
+            if not head:
+                return elements
+            self.is_array = head[:1] == b"["
+            if not self.is_array:
+                return elements
+
+        pos = self._pos
+        while not self.finished:
+            if self._in_string:
+                end = buf.find(b'"', pos)
+                if end < 0:
+                    pos = len(buf)
+                    break
+                backslashes = 0
+                while buf[end - 1 - backslashes] == 0x5c:
+                    backslashes += 1
+                pos = end + 1
+                self._in_string = backslashes % 2 == 1
+                continue
+
+            match = _SPECIAL.search(buf, pos)
+            if match is None:
+                pos = len(buf)
+                break
+            char = buf[match.start()]
+            pos = match.end()
+            if char == 0x22:    # "
+                self._in_string = True
+            elif char in (0x5b, 0x7b):    # [ {
+                self._depth += 1
+                if self._depth == 1:
+                    self._elem_start = pos
+            elif char in (0x5d, 0x7d) and self._depth > 1:    # ] } closing nested value
+                self._depth -= 1
+            elif self._depth == 1 and char in (0x2c, 0x5d):    # , ] closing element of top-level array
+                element = bytes(buf[self._elem_start:match.start()]).strip(_WHITESPACE)
+                if element:
+                    elements.append(element)
+                self._elem_start = pos
+                if char == 0x5d:
+                    self._depth = 0
+                    self.finished = True
+
+        # drop consumed bytes
+        consumed = self._elem_start if not self.finished else pos
+        del buf[:consumed]
+        self._elem_start -= consumed
+        self._pos = pos - consumed
+        return elements
+
+    def rest(self):
+        """bytes not consumed as elements, e.g. whole body of non-array response"""
+        return bytes(self._buf)
+
+
+def iter_json_array_raw(chunks):
+    """yield raw bytes of each element of JSON array streamed in chunks.
+    If the body is not a JSON array, raise DiffbotResponseError for diffbot error object,
+    otherwise DiffbotUnexpectedBodyError.
+    """
+    chunks = iter(chunks)
+    scanner = JsonArrayScanner()
+    for chunk in chunks:
+        yield from scanner.feed(chunk)
+        if scanner.finished:
+            return
+        if scanner.is_array is False:
+            break
+
+    body = scanner.rest() + b"".join(chunks)
+    if scanner.is_array:
+        raise DiffbotUnexpectedBodyError("truncated JSON array")
+    try:
+        data = json.loads(body)
+    except ValueError as e:
+        raise DiffbotUnexpectedBodyError(body.decode("utf-8", "replace"), raw=e)
+    if isinstance(data, dict) and data.get("error") is not None:
+        raise DiffbotResponseError(data.get("errorCode"), data["error"])
+    raise DiffbotUnexpectedBodyError(body.decode("utf-8", "replace"))
+
+
+def iter_json_array(chunks, loads=json.loads):
+    """yield each decoded element of JSON array streamed in chunks"""
+    for element in iter_json_array_raw(chunks):
+        yield loads(element)
+
+
+def scan_object(raw):
+    """index top-level JSON object in raw bytes without decoding it.
+    return {key: (start, end)} where raw[start:end] is JSON of the value of key.
+    """
+    index = {}
+    depth = 0
+    key = None
+    value_start = None
+    pos = 0
+    while True:
+        match = _OBJECT_SPECIAL.search(raw, pos)
+        if match is None:
+            raise DiffbotUnexpectedBodyError("truncated JSON object")
+        char = raw[match.start()]
+        pos = match.end()
+        if char == 0x22:    # "
+            end = _find_string_end(raw, pos)
+            if depth == 1 and value_start is None:
+                key = json.loads(raw[match.start():end + 1])
+            pos = end + 1
+        elif char == 0x3a:    # :
+            if depth == 1 and value_start is None:
+                value_start = pos
+        elif char in (0x5b, 0x7b):    # [ {
+            depth += 1
+        elif depth == 1 and char in (0x2c, 0x7d):    # , } closing member of top-level object
+            if value_start is not None:
+                index[key] = (value_start, match.start())
+            key = None
+            value_start = None
+            if char == 0x7d:
+                return index
+        elif char in (0x5d, 0x7d):    # ] } closing nested value
+            depth -= 1
+
+
+def _find_string_end(raw, pos):
+    """index of closing quote of JSON string starting before pos"""
+    while True:
+        end = raw.find(b'"', pos)
+        if end < 0:
+            raise DiffbotUnexpectedBodyError("truncated JSON string")
+        backslashes = 0
+        while raw[end - 1 - backslashes] == 0x5c:
+            backslashes += 1
+        if backslashes % 2 == 0:
+            return end
+        pos = end + 1
+
+
+def iter_csv_rows(chunks, encoding="utf-8"):
+    """yield each row of CSV streamed in chunks as dict keyed by header"""
+    return csv.DictReader(_iter_lines(chunks, encoding))
+
+
+def _iter_lines(chunks, encoding):
+    # split only on "\n" and keep it, csv module handles "\r" and newlines quoted in fields
+    decoder = codecs.getincrementaldecoder(encoding)("replace")
+    rest = ""
+    for chunk in chunks:
+        text = rest + decoder.decode(chunk)
+        start = 0
+        end = text.find("\n")
+        while end >= 0:
+            yield text[start:end + 1]
+            start = end + 1
+            end = text.find("\n", start)
+        rest = text[start:]
+    rest += decoder.decode(b"", final=True)
+    if rest:
+        yield rest
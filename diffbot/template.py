@@ -0,0 +1,58 @@
+import types
+import urllib.parse
+
+"""this file contains request templates of SingleFetcher, made by SingleFetcher.prepare.
+Endpoint, headers and query string of api_type and args are built once per template,
+so a call only encodes its url. Token is appended per call, since a TokenPool may switch it.
+"""
+
+
+class RequestTemplate():
+    """api_type, args and headers bound to a SingleFetcher, see SingleFetcher.prepare.
+    The template is immutable and can be shared between threads.
+    """
+    __slots__ = ("fetcher", "api_type", "extractor", "endpoint", "args", "headers", "query_string")
+
+    def __init__(self, fetcher, api_type, extractor, *, args=None, headers=None):
+        set_attr = super().__setattr__
+        set_attr("fetcher", fetcher)
+        set_attr("api_type", api_type)
+        set_attr("extractor", extractor)
+        set_attr("endpoint", fetcher._get_end_point(api_type))
+        set_attr("args", types.MappingProxyType(dict(args or {})))
+        set_attr("headers", types.MappingProxyType(dict(headers or {})))
+        # query string after url, in the order SingleFetcher._compose_query puts args
+        encoded = urllib.parse.urlencode(self.args)
+        set_attr("query_string", "&" + encoded if encoded else "")
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RequestTemplate is immutable")
+
+    def __repr__(self):
+        return "<RequestTemplate {} {}>".format(self.api_type, self.query_string)
+
+    def encode_query(self, target_url):
+        """query string of target_url without token"""
+        return "url=" + urllib.parse.quote_plus(target_url) + self.query_string
+
+    def fetch_raw_data(self, target_url, *, retry_policy=None, raw=False):
+        """fetch raw data of target_url, like SingleFetcher.fetch_raw_data.
+        A fetcher with cache or single_flight needs the query as dict for its keys, so it is called as usual.
+        """
+        fetcher = self.fetcher
+        if fetcher.cache is not None or fetcher.single_flight is not None:
+            return fetcher.fetch_raw_data(self.api_type, target_url, args=dict(self.args), headers=dict(self.headers),
+                                          retry_policy=retry_policy, raw=raw)
+        return fetcher._fetch_raw_data(self.api_type,
+                                       query=self.encode_query(target_url),
+                                       headers=self.headers or None,
+                                       retry_policy=retry_policy,
+                                       raw=raw,
+                                       endpoint=self.endpoint)
+
+    def fetch_extractors(self, target_url):
+        """fetch extractors of target_url, like SingleFetcher.fetch_${api_type}_extractors"""
+        data = self.fetch_raw_data(target_url)
+        if self.api_type == "analyze":
+            return [self.extractor(data)]
+        return [self.extractor(datum) for datum in data["objects"]]
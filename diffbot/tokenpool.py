@@ -0,0 +1,136 @@
+import contextlib
+import itertools
+import threading
+import time
+from .error import DiffbotTokenError
+
+"""this file contains pool of tokens spreading calls of one client over several accounts.
+Pass TokenPool as token of SingleFetcher or Searcher. A token answering a quota error is cooled down
+and the call fails over to another token. Job operators created with a pool are pinned to one token of it,
+since a job belongs to the token which created it.
+"""
+
+ROUND_ROBIN = "round_robin"
+LEAST_IN_FLIGHT = "least_in_flight"
+
+
+class _TokenState():
+    __slots__ = ("in_flight", "calls", "errors", "throttled", "cooling_until")
+
+    def __init__(self):
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.throttled = 0
+        self.cooling_until = 0.0
+
+
+class TokenPool():
+    """tokens selected by strategy, "round_robin" or "least_in_flight".
+    A token is cooled down for Retry-After of the response or cooldown seconds
+    when it answers errorCode in quota_codes (429: too many requests / quota exceeded, 401: not authorized).
+    """
+
+    def __init__(self, tokens, *, strategy=ROUND_ROBIN, cooldown=60.0, quota_codes=(401, 429), clock=time.monotonic):
+        self.tokens = list(dict.fromkeys(tokens))
+        if not self.tokens:
+            raise ValueError("TokenPool needs at least one token")
+        if strategy not in (ROUND_ROBIN, LEAST_IN_FLIGHT):
+            raise ValueError("unknown strategy: {}".format(strategy))
+        self.strategy = strategy
+        self.cooldown = cooldown
+        self.quota_codes = tuple(quota_codes)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._states = {token: _TokenState() for token in self.tokens}
+        self._cycle = itertools.cycle(self.tokens)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __repr__(self):
+        return "<TokenPool of {} tokens, {}>".format(len(self.tokens), self.strategy)
+
+    def available(self):
+        """tokens not cooling down"""
+        now = self._clock()
+        with self._lock:
+            return [token for token in self.tokens if self._states[token].cooling_until <= now]
+
+    def _select(self, exclude=()):
+        # called with self._lock held
+        now = self._clock()
+        candidates = [token for token in self.tokens
+                      if self._states[token].cooling_until <= now and token not in exclude]
+        if not candidates:
+            return None
+        if self.strategy == LEAST_IN_FLIGHT:
+            return min(candidates, key=lambda token: self._states[token].in_flight)
+        for token in self._cycle:
+            if token in candidates:
+                return token
+
+    def acquire(self, exclude=()):
+        """select a token for one call and count it in flight.
+        Raise DiffbotTokenError if every token (but exclude) is cooling down.
+        """
+        with self._lock:
+            token = self._select(exclude)
+            if token is None:
+                raise DiffbotTokenError("every token of the pool is cooling down")
+            state = self._states[token]
+            state.in_flight += 1
+            state.calls += 1
+            return token
+
+    def release(self, token, error=None):
+        """end a call of token, cooling it down if error is a quota error"""
+        with self._lock:
+            state = self._states[token]
+            state.in_flight -= 1
+            if error is not None:
+                state.errors += 1
+        if self.is_quota_error(error):
+            self.cool_down(token, getattr(error, "retry_after", None))
+
+    @contextlib.contextmanager
+    def use(self, exclude=()):
+        """hold a token during the block, see acquire and release"""
+        token = self.acquire(exclude)
+        try:
+            yield token
+        except BaseException as e:
+            self.release(token, e)
+            raise
+        self.release(token)
+
+    def pin(self):
+        """select a token to use for good, e.g. by a job operator"""
+        with self._lock:
+            token = self._select() or self.tokens[0]
+        return token
+
+    def is_quota_error(self, error):
+        return getattr(error, "code", None) in self.quota_codes
+
+    def cool_down(self, token, seconds=None):
+        """stop selecting token for seconds, or cooldown seconds of the pool"""
+        with self._lock:
+            state = self._states[token]
+            state.throttled += 1
+            state.cooling_until = max(state.cooling_until, self._clock() + (seconds if seconds is not None else self.cooldown))
+
+    def stats(self):
+        """return {token: {"in_flight", "calls", "errors", "throttled", "cooling"}}, cooling is remaining seconds"""
+        now = self._clock()
+        with self._lock:
+            return {
+                token: {
+                    "in_flight": state.in_flight,
+                    "calls": state.calls,
+                    "errors": state.errors,
+                    "throttled": state.throttled,
+                    "cooling": max(0.0, state.cooling_until - now),
+                }
+                for token, state in self._states.items()
+            }
@@ -0,0 +1,212 @@
+import threading
+import zlib
+import requests
+import urllib3
+from .error import DiffbotUnexpectedBodyError
+
+try:
+    import brotli
+except ImportError:    # brotli is optional, needed only to accept br
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:    # zstandard is optional, needed only to accept zstd
+    zstandard = None
+
+"""this file contains content encoding negotiation and counters of transferred bytes.
+Bodies are read from the wire undecoded and decompressed here chunk by chunk,
+so streamed job data is decompressed on the fly and its size on the wire is known exactly.
+"""
+
+
+class _IdentityDecoder():
+
+    def decompress(self, data, max_length=0):
+        yield data
+
+    def flush(self):
+        return b""
+
+
+class _ZlibDecoder():
+    """decoder of gzip (wbits 16 + MAX_WBITS), zlib (MAX_WBITS) or raw deflate (-MAX_WBITS) stream"""
+
+    def __init__(self, wbits):
+        self._decoder = zlib.decompressobj(wbits)
+
+    def decompress(self, data, max_length=0):
+        """yield decoded pieces of data, each at most max_length bytes unless max_length is 0"""
+        while data:
+            piece = self._decoder.decompress(data, max_length)
+            if piece:
+                yield piece
+            data = self._decoder.unconsumed_tail
+
+    def flush(self):
+        return self._decoder.flush()
+
+
+class _DeflateDecoder(_ZlibDecoder):
+    """"deflate" is zlib stream by the RFC, but raw deflate stream by some servers"""
+
+    def __init__(self):
+        super().__init__(zlib.MAX_WBITS)
+        self._first = True
+
+    def decompress(self, data, max_length=0):
+        if self._first:
+            self._first = False
+            try:
+                zlib.decompressobj(zlib.MAX_WBITS).decompress(data[:2])
+            except zlib.error:
+                self._decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+        return super().decompress(data, max_length)
+
+
+class _BrotliDecoder():
+
+    def __init__(self):
+        self._decoder = brotli.Decompressor()
+
+    def decompress(self, data, max_length=0):
+        yield self._decoder.process(data)
+
+    def flush(self):
+        return b""
+
+
+class _ZstdDecoder():
+
+    def __init__(self):
+        self._decoder = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data, max_length=0):
+        yield self._decoder.decompress(data)
+
+    def flush(self):
+        return b""
+
+
+DECODERS = {
+    "gzip": lambda: _ZlibDecoder(16 + zlib.MAX_WBITS),
+    "deflate": _DeflateDecoder,
+}
+if brotli is not None:
+    DECODERS["br"] = _BrotliDecoder
+if zstandard is not None:
+    DECODERS["zstd"] = _ZstdDecoder
+
+# value of Accept-Encoding, e.g. "gzip, deflate, br"
+ACCEPT_ENCODING = ", ".join(DECODERS)
+
+
+def get_decoder(content_encoding):
+    """decoder of Content-Encoding header value, applying each encoding in reverse order"""
+    encodings = [encoding.strip().lower() for encoding in (content_encoding or "").split(",")]
+    encodings = [encoding for encoding in encodings if encoding and encoding != "identity"]
+    if not encodings:
+        return _IdentityDecoder()
+    unsupported = [encoding for encoding in encodings if encoding not in DECODERS]
+    if unsupported:
+        raise DiffbotUnexpectedBodyError("unsupported Content-Encoding: {}".format(content_encoding))
+    if len(encodings) == 1:
+        return DECODERS[encodings[0]]()
+    return _ChainDecoder([DECODERS[encoding]() for encoding in reversed(encodings)])
+
+
+class _ChainDecoder():
+
+    def __init__(self, decoders):
+        self._decoders = decoders
+
+    def decompress(self, data, max_length=0):
+        return self._decompress(0, data, max_length)
+
+    def _decompress(self, i, data, max_length):
+        if i == len(self._decoders):
+            yield data
+            return
+        for piece in self._decoders[i].decompress(data, max_length):
+            yield from self._decompress(i + 1, piece, max_length)
+
+    def flush(self):
+        data = b""
+        for decoder in self._decoders:
+            data = b"".join(decoder.decompress(data)) + decoder.flush()
+        return data
+
+
+class TransferCounter():
+    """bytes received on the wire (possibly compressed) and bytes after decoding, summed over responses"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.responses = 0
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+
+    def add(self, wire_bytes, decoded_bytes):
+        with self._lock:
+            self.responses += 1
+            self.wire_bytes += wire_bytes
+            self.decoded_bytes += decoded_bytes
+
+    def stats(self):
+        """return {"responses", "wire_bytes", "decoded_bytes", "ratio"}, ratio is wire / decoded"""
+        with self._lock:
+            return {
+                "responses": self.responses,
+                "wire_bytes": self.wire_bytes,
+                "decoded_bytes": self.decoded_bytes,
+                "ratio": self.wire_bytes / self.decoded_bytes if self.decoded_bytes else None,
+            }
+
+    def read(self, response, chunk_size=64 * 1024):
+        """read and decode whole body of streamed requests.Response, return (body, bytes on the wire)"""
+        counts = [0, 0]
+        body = b"".join(_iter_decoded(response, chunk_size, counts))
+        self.add(*counts)
+        return body, counts[0]
+
+    def iter_content(self, response, chunk_size):
+        """yield decoded chunks of streamed body of requests.Response.
+        Bytes are counted when the body ends or the generator is closed.
+        """
+        counts = [0, 0]
+        try:
+            yield from _iter_decoded(response, chunk_size, counts)
+        finally:
+            self.add(*counts)
+
+
+def _iter_decoded(response, chunk_size, counts):
+    """yield decoded chunks of body of at most chunk_size bytes (unless br or zstd),
+    adding bytes on the wire and decoded bytes to counts
+    """
+    decoder = get_decoder(response.headers.get("Content-Encoding"))
+    for chunk in _iter_raw(response, chunk_size):
+        counts[0] += len(chunk)
+        # a compressed chunk is decoded in pieces of chunk_size, so memory stays bounded
+        for piece in decoder.decompress(chunk, chunk_size):
+            if piece:
+                counts[1] += len(piece)
+                yield piece
+    chunk = decoder.flush()
+    if chunk:
+        counts[1] += len(chunk)
+        yield chunk
+    # whole body is read, so the connection can go back to the pool
+    response.raw.release_conn()
+
+
+def _iter_raw(response, chunk_size):
+    """yield undecoded chunks of body, raising errors of urllib3 as requests does in Response.iter_content"""
+    try:
+        yield from response.raw.stream(chunk_size, decode_content=False)
+    except urllib3.exceptions.ProtocolError as e:
+        raise requests.exceptions.ChunkedEncodingError(e)
+    except urllib3.exceptions.ReadTimeoutError as e:
+        raise requests.exceptions.ReadTimeout(e)
+    except urllib3.exceptions.SSLError as e:
+        raise requests.exceptions.SSLError(e)
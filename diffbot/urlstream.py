@@ -0,0 +1,184 @@
+import hashlib
+import math
+import os
+import urllib.parse
+
+"""this file contains streaming of URL lists into form-encoded bodies of bulk jobs.
+URLs are read lazily from an iterable or a file, optionally normalized and deduplicated,
+and encoded into chunks of the body as they are sent. No joined string of the whole list is built.
+"""
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def iter_urls(source):
+    """yield URLs of source, an iterable of URLs or a path of text file of URLs separated by whitespace.
+    Blank lines and lines starting with # are skipped.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("#"):
+                    continue
+                yield from line.split()
+        return
+    for url in source:
+        url = url.strip()
+        if url:
+            yield url
+
+
+def normalize_url(url):
+    """lowercase scheme and host, drop default port and fragment, and make empty path "/" """
+    parts = urllib.parse.urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc
+    if parts.hostname is not None:
+        host = parts.hostname
+        if ":" in host:    # IPv6
+            host = "[{}]".format(host)
+        try:
+            port = parts.port
+        except ValueError:
+            port = None
+        userinfo, _, _ = parts.netloc.rpartition("@")
+        netloc = (userinfo + "@" if userinfo else "") + host
+        if port is not None and port != _DEFAULT_PORTS.get(scheme):
+            netloc += ":{}".format(port)
+    path = parts.path or ("/" if netloc else "")
+    return urllib.parse.urlunsplit((scheme, netloc, path, parts.query, ""))
+
+
+class BloomFilter():
+    """set of strings in a fixed bit array, whose membership test may be a false positive with probability
+    error_rate once capacity items are added. Never a false negative.
+    1M items at error_rate 1e-4 take 2.4MB, whatever the length of the items.
+    """
+
+    def __init__(self, capacity, error_rate=1e-4):
+        if capacity <= 0 or not 0 < error_rate < 1:
+            raise ValueError("capacity must be positive and error_rate between 0 and 1")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item):
+        # double hashing: i-th position is h1 + i * h2
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        num_bits = self.num_bits
+        return [position % num_bits for position in range(h1, h1 + self.num_hashes * h2, h2)]
+
+    def add(self, item):
+        bits = self._bits
+        for position in self._positions(item):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        bits = self._bits
+        for position in self._positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def clear(self):
+        self._bits = bytearray(len(self._bits))
+
+    def copy(self):
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        bloom._bits = bytearray(self._bits)
+        return bloom
+
+    def update(self, other):
+        """add every item of other, a BloomFilter of the same capacity and error_rate"""
+        if other.num_bits != self.num_bits or other.num_hashes != self.num_hashes:
+            raise ValueError("BloomFilter of different size can not be merged")
+        merged = int.from_bytes(self._bits, "little") | int.from_bytes(other._bits, "little")
+        self._bits = bytearray(merged.to_bytes(len(self._bits), "little"))
+
+
+class FormBody():
+    """application/x-www-form-urlencoded body of fields and urls_field holding URLs of source separated by space,
+    iterated in chunks of about chunk_size bytes, so requests sends it with chunked transfer encoding.
+    dedupe : True to skip repeated URLs, or set-like having add, __contains__, copy and update (set, BloomFilter)
+    to also skip URLs already in it. Each send works on a copy of it, merged into it by remember() once the body is accepted,
+    so a failed send leaves it as it was.
+    The body can be sent again (e.g. retried) if source is a file path or a collection, not an iterator.
+    """
+
+    def __init__(self, fields, urls_field, source, *, normalize=False, dedupe=None, chunk_size=64 * 1024):
+        self.fields = fields
+        self.urls_field = urls_field
+        self.source = source
+        self.normalize = normalize
+        self.dedupe = dedupe
+        self.chunk_size = chunk_size
+        self._one_shot = not isinstance(source, (str, os.PathLike)) and iter(source) is source
+        self._state = {"iterated": False, "count": 0, "seen": None}    # seen: URLs of the last send
+
+    @property
+    def count(self):
+        """number of URLs in the body sent last"""
+        return self._state["count"]
+
+    @property
+    def resendable(self):
+        """False if source is an iterator, which is consumed by the first send"""
+        return not self._one_shot
+
+    def remember(self):
+        """add URLs of the last send to dedupe, to call once the body is accepted"""
+        seen = self._state["seen"]
+        if seen is not None and self.dedupe is not True:
+            self.dedupe.update(seen)
+
+    def with_token(self, token):
+        """copy of this body with token field, sharing its source"""
+        body = FormBody({**self.fields, "token": token}, self.urls_field, self.source, normalize=self.normalize,
+                        dedupe=self.dedupe, chunk_size=self.chunk_size)
+        body._one_shot = self._one_shot
+        body._state = self._state
+        return body
+
+    def __iter__(self):
+        if self._one_shot and self._state["iterated"]:
+            raise ValueError("URLs of an iterator can not be sent again, pass a list or a file path to retry")
+        self._state["iterated"] = True
+        dedupe = self.dedupe
+        if dedupe is True:
+            seen = set()
+        elif dedupe is None or dedupe is False:
+            seen = None
+        else:
+            seen = dedupe.copy()
+        self._state["seen"] = seen
+        quote_plus = urllib.parse.quote_plus
+
+        self._state["count"] = count = 0
+        head = urllib.parse.urlencode(self.fields)
+        buffer = [head + ("&" if head else "") + quote_plus(self.urls_field) + "="]
+        size = len(buffer[0])
+        separator = ""
+        for url in iter_urls(self.source):
+            if self.normalize:
+                url = normalize_url(url)
+            if seen is not None:
+                if url in seen:
+                    continue
+                seen.add(url)
+            encoded = separator + quote_plus(url)
+            separator = "+"    # space between URLs
+            count += 1
+            buffer.append(encoded)
+            size += len(encoded)
+            if size >= self.chunk_size:
+                self._state["count"] = count
+                yield "".join(buffer).encode("ascii")
+                buffer = []
+                size = 0
+        self._state["count"] = count
+        if buffer:
+            yield "".join(buffer).encode("ascii")
@@ -0,0 +1,197 @@
+import asyncio
+import hmac
+import json
+import queue
+import threading
+import urllib.parse
+from concurrent import futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .jobs import COMPLETED
+
+"""this file contains receiver of job notifications of bulk/crawl API (notifyWebhook of JobOperator.generate_args).
+Diffbot POSTs to the webhook with X-Crawl-Name and X-Crawl-Status headers and JSON of the job in the body.
+The receiver maps the job name to its JobOperator and hands the notification to a callback or a queue,
+so data of the job can be streamed as soon as it completes instead of polling job_completed.
+"""
+
+
+class JobNotification():
+    """notification of job_name whose jobStatus.status is status. job is JSON of the job, {} if not sent"""
+    __slots__ = ("job_name", "status", "operator", "job")
+
+    def __init__(self, job_name, status, operator, job):
+        self.job_name = job_name
+        self.status = status
+        self.operator = operator
+        self.job = job
+
+    def __repr__(self):
+        return "<JobNotification {} status={}>".format(self.job_name, self.status)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        status = self.server.receiver._receive(self.path, self.headers, body)
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class WebhookReceiver():
+    """embedded HTTP server receiving job notifications of operators (BulkJobOperator, CrawlJobOperator).
+    A notification whose status is in final_statuses (every status if None) is delivered:
+    callback(JobNotification) is called on one of max_workers threads, or without callback, the notification
+    is put on the queue read by notifications() or `async for`. Exceptions of callback are kept in errors.
+    Other notifications only refresh status cache of the operator.
+    If secret is given, notifyWebhook must carry it as ?secret= query, e.g. the url of webhook_url().
+    The receiver answers 404 to notifications of unknown jobs.
+    """
+
+    def __init__(self, operators=(), *, host="127.0.0.1", port=0, callback=None, final_statuses=(COMPLETED,),
+                 secret=None, max_workers=4):
+        self.callback = callback
+        self.final_statuses = final_statuses
+        self.secret = secret
+        self.errors = []
+        self._operators = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._async_queues = []
+        self._executor = futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="diffbot-webhook")
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.receiver = self
+        self._thread = None
+        for operator in operators:
+            self.register(operator)
+
+    def register(self, operator):
+        """route notifications of job of operator to it"""
+        with self._lock:
+            self._operators[operator.job_name] = operator
+
+    def unregister(self, job_name):
+        with self._lock:
+            self._operators.pop(job_name, None)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}/".format(host, port)
+
+    def webhook_url(self, base_url=None):
+        """url to pass as notify_webhook, with secret if any. base_url is the public url of this receiver"""
+        url = base_url or self.url
+        if self.secret is None:
+            return url
+        return url + ("&" if "?" in url else "?") + urllib.parse.urlencode({"secret": self.secret})
+
+    def start(self):
+        """serve on a background thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """stop serving and wait for running callbacks"""
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    async def __aenter__(self):
+        return self.start()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await asyncio.get_running_loop().run_in_executor(None, self.stop)
+
+    def notifications(self, timeout=None):
+        """yield delivered notifications, stopping after timeout seconds without any"""
+        while True:
+            try:
+                yield self._queue.get(timeout=timeout)
+            except queue.Empty:
+                return
+
+    def __aiter__(self):
+        """iterate delivered notifications in a running event loop, from the time of this call.
+        While some event loop iterates, notifications are not put on the queue of notifications()
+        """
+        async_queue = asyncio.Queue()
+        with self._lock:
+            self._async_queues.append((asyncio.get_running_loop(), async_queue))
+        return self._iter_async(async_queue)
+
+    async def _iter_async(self, async_queue):
+        try:
+            while True:
+                yield await async_queue.get()
+        finally:
+            with self._lock:
+                self._async_queues = [entry for entry in self._async_queues if entry[1] is not async_queue]
+
+    def _receive(self, path, headers, body):
+        """handle POST of notification, return HTTP status"""
+        if self.secret is not None:
+            query = urllib.parse.parse_qs(urllib.parse.urlsplit(path).query)
+            if not hmac.compare_digest(query.get("secret", [""])[0], self.secret):
+                return 403
+        try:
+            job = json.loads(body) if body.strip() else {}
+        except ValueError:
+            return 400
+        # body is either the job or a listing of it
+        if isinstance(job, dict) and isinstance(job.get("jobs"), list) and job["jobs"]:
+            job = job["jobs"][0]
+        if not isinstance(job, dict):
+            return 400
+
+        job_name = headers.get("X-Crawl-Name") or job.get("name")
+        with self._lock:
+            operator = self._operators.get(job_name)
+        if operator is None:
+            return 404
+        status = job.get("jobStatus", {}).get("status")
+        if status is None and headers.get("X-Crawl-Status", "").isdigit():
+            status = int(headers["X-Crawl-Status"])
+
+        if "jobStatus" in job:
+            # status of the job is known, so reading its data needs no status call
+            operator.status_cache.set(operator.token, operator.api_type, job_name, {"jobs": [job]})
+        else:
+            operator.status_cache.invalidate(operator.token, operator.api_type, job_name)
+        if self.final_statuses is None or status in self.final_statuses:
+            self._deliver(JobNotification(job_name, status, operator, job))
+        return 200
+
+    def _deliver(self, notification):
+        if self.callback is not None:
+            future = self._executor.submit(self.callback, notification)
+            future.add_done_callback(lambda future: self._keep_error(notification, future))
+            return
+        with self._lock:
+            async_queues = list(self._async_queues)
+        if not async_queues:
+            self._queue.put(notification)
+        for loop, async_queue in async_queues:
+            loop.call_soon_threadsafe(async_queue.put_nowait, notification)
+
+    def _keep_error(self, notification, future):
+        if not future.cancelled() and future.exception() is not None:
+            with self._lock:
+                self.errors.append((notification, future.exception()))
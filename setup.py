@@ -5,6 +5,13 @@ install_requires = [
       "toml",
 ]
 
+extras_require = {
+      "async": ["aiohttp"],
+      "zstd": ["zstandard"],
+      "fast": ["orjson"],
+      "brotli": ["brotli"],
+}
+
 
 with open("README.md") as f:
     long_description = f.read()
@@ -13,12 +20,13 @@ setup(name='diffbotpy',
       version='0.1',
       description='diffbot client for Python',
       long_description=long_description,
-      packages=find_packages(exclude=["tests"]),
+      packages=find_packages(exclude=["tests", "benchmarks", "benchmarks.*"]),
       include_package_data=True,
       zip_safe=False,
       test_suite="tests",
       license="MIT",
       keywords="diffbot",
       install_requires=install_requires,
+      extras_require=extras_require,
       entry_points="""
 """)
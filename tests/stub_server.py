@@ -0,0 +1,295 @@
+"""local stand-in of api.diffbot.com for offline tests and benchmarks
+serves article/analyze/discussion/image/product/video, bulk, crawl, {bulk,crawl}/data and search of v3
+with configurable latency, payload size, and error and 429 injection.
+
+    python -m tests.stub_server --port 8080 --latency 0.2 --payload-size 20000 --throttle-rate 0.01
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import random
+import threading
+import time
+import urllib.parse
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        parsed = urllib.parse.urlparse(self.path)
+        self._handle(parsed.path, urllib.parse.parse_qs(parsed.query))
+
+    def do_POST(self):
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            body = self._read_chunked()
+        else:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        parsed = urllib.parse.urlparse(self.path)
+        params = urllib.parse.parse_qs(parsed.query)
+        params.update(urllib.parse.parse_qs(body.decode()))
+        self._handle(parsed.path, params)
+
+    def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(b";")[0], 16)
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+            if size == 0:
+                return b"".join(chunks)
+
+    def _handle(self, path, params):
+        server = self.server
+        with server.lock:
+            if server.record_requests:
+                server.requests.append((self.command, path, params))
+            server.last_headers = self.headers
+            fault = server.faults.pop(0) if server.faults else server.random_fault()
+            if fault is None and params.get("token", [None])[0] in server.exhausted_tokens:
+                fault = 429, json.dumps({"error": "Quota exceeded", "errorCode": 429}).encode(), {}
+        latency = server.latency() if callable(server.latency) else server.latency
+        if latency:
+            time.sleep(latency)
+
+        if fault is not None:
+            status, body, headers = fault
+        else:
+            status, body, headers = server.make_response(path.split("/", 2)[-1], params)
+            byte_range = self.headers.get("Range")
+            if byte_range:
+                server.ranges.append(byte_range)
+            if status == 200 and byte_range and server.accept_ranges:
+                start = int(byte_range[len("bytes="):].rstrip("-"))
+                status, body = 206, body[start:]
+                headers = {**headers, "Content-Range": "bytes {}-{}/{}".format(start, start + len(body) - 1, start + len(body))}
+        if server.compress and status == 200 and "gzip" in self.headers.get("Accept-Encoding", ""):
+            headers = {**headers, "Content-Encoding": "gzip"}
+            body = gzip.compress(body) if isinstance(body, bytes) else self._gzip_chunks(body)
+        self.send_response(status)
+        headers = {"Content-Type": "application/json", **headers}
+        for key, value in headers.items():
+            self.send_header(key, value)
+        if isinstance(body, bytes):
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        # generated body of unknown size
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for chunk in body:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        except ConnectionAbortedError:
+            # truncated body, see inject_truncated_body
+            self.close_connection = True
+            return
+        self.wfile.write(b"0\r\n\r\n")
+
+    @staticmethod
+    def _gzip_chunks(chunks):
+        compressor = zlib.compressobj(wbits=31)
+        for chunk in chunks:
+            chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+        yield compressor.flush()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, *, latency=0, payload_size=0, error_rate=0.0, throttle_rate=0.0, retry_after=None,
+                 record_requests=True, seed=0, port=0):
+        """latency : seconds, or function returning seconds, to wait before each response
+        payload_size : length of html and text of each extracted object
+        error_rate, throttle_rate : probability of answering errorCode 500 / 429 at random
+        retry_after : Retry-After of the random 429 responses
+        """
+        super().__init__(("127.0.0.1", port), StubHandler)
+        self.latency = latency
+        self.payload_size = payload_size
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.record_requests = record_requests
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.faults = []
+        self.jobs = {}
+        self.accept_ranges = True
+        self.ranges = []
+        self.search_hits = None
+        self.new_job_status = 9
+        self.exhausted_tokens = set()    # tokens answered with 429 quota error
+        self.compress = False    # gzip successful responses if the client accepts it
+        self.last_headers = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+    def inject_error(self, code, *, times=1, retry_after=None):
+        """answer next requests with diffbot error JSON"""
+        body = json.dumps({"error": "injected error", "errorCode": code}).encode()
+        headers = {"Retry-After": str(retry_after)} if retry_after is not None else {}
+        with self.lock:
+            self.faults.extend([(code, body, headers)] * times)
+
+    def inject_unexpected_body(self, *, times=1):
+        """answer next requests with non-JSON body"""
+        with self.lock:
+            self.faults.extend([(502, b"<html>Bad Gateway</html>", {})] * times)
+
+    def inject_truncated_body(self, *, times=1):
+        """answer next requests with 200 whose chunked body is cut after its first chunk by closing the connection"""
+
+        def truncated():
+            yield b'{"objects": ['
+            raise ConnectionAbortedError("truncated body")
+
+        with self.lock:
+            self.faults.extend((200, truncated(), {}) for _ in range(times))
+
+    def random_fault(self):
+        """pick random fault of error_rate and throttle_rate, called with lock held"""
+        if not self.error_rate and not self.throttle_rate:
+            return None
+        dice = self.random.random()
+        if dice < self.throttle_rate:
+            headers = {"Retry-After": str(self.retry_after)} if self.retry_after is not None else {}
+            return 429, json.dumps({"error": "Too many requests", "errorCode": 429}).encode(), headers
+        if dice < self.throttle_rate + self.error_rate:
+            return 500, json.dumps({"error": "injected error", "errorCode": 500}).encode(), {}
+        return None
+
+    def add_job(self, name, objects, *, status=9):
+        """register bulk/crawl job whose data is objects"""
+        with self.lock:
+            self.jobs[name] = {"status": status, "objects": objects}
+
+    def add_round(self, name, objects, *, last=False):
+        """finish next round of repeating job, whose data becomes objects.
+        The job waits for its next round, or has completed if last is True.
+        """
+        with self.lock:
+            rounds = self.jobs[name].get("rounds", 0) + 1 if name in self.jobs else 1
+        self.add_job(name, objects, status=9 if last else 4)
+        self.jobs[name]["rounds"] = rounds
+
+    def add_generated_job(self, name, count, *, status=9):
+        """register bulk/crawl job of count article objects, generated while responding"""
+        with self.lock:
+            self.jobs[name] = {"status": status, "count": count}
+
+    def make_object(self, api_type, page_url, title):
+        obj = {"type": api_type, "title": title, "pageUrl": page_url}
+        if self.payload_size:
+            obj["html"] = ("<p>" + "x" * self.payload_size)[:self.payload_size]
+            obj["text"] = "x" * self.payload_size
+        return obj
+
+    def _generate_objects(self, count):
+        yield b"["
+        for i in range(count):
+            obj = self.make_object("article", "http://example.com/{}".format(i), "title {}".format(i))
+            yield (b"," if i else b"") + json.dumps(obj).encode()
+        yield b"]"
+
+    def set_job_status(self, name, status):
+        with self.lock:
+            self.jobs[name]["status"] = status
+
+    def make_response(self, api_type, params):
+        if api_type.endswith("/data"):
+            job = self.jobs[params["name"][0]]
+            if "count" in job:
+                return 200, self._generate_objects(job["count"]), {}
+            if params.get("format", ["json"])[0] == "csv":
+                return 200, self._to_csv(job["objects"]), {"Content-Type": "text/csv"}
+            return 200, json.dumps(job["objects"]).encode(), {}
+        return 200, json.dumps(self.make_body(api_type, params)).encode(), {}
+
+    @staticmethod
+    def _to_csv(objects):
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=sorted({key for obj in objects for key in obj}))
+        writer.writeheader()
+        writer.writerows(objects)
+        return out.getvalue().encode()
+
+    def make_body(self, api_type, params):
+        if api_type in ("bulk", "crawl"):
+            urls = params.get("urls" if api_type == "bulk" else "seeds")
+            if urls:
+                # starting a job, whose data is one article of each url
+                objects = [self.make_object("article", url, "title of " + url) for url in urls[0].split()]
+                self.add_job(params["name"][0], objects, status=self.new_job_status)
+            if params.get("delete") == ["1"]:
+                with self.lock:
+                    self.jobs.pop(params["name"][0], None)
+            names = params["name"] if "name" in params else sorted(self.jobs)
+            with self.lock:
+                return {"jobs": [
+                    dict({"name": name, "type": api_type, "jobStatus": {"status": self.jobs[name]["status"], "message": "status"}},
+                         **({"roundsCompleted": self.jobs[name]["rounds"]} if "rounds" in self.jobs[name] else {}))
+                    for name in names if name in self.jobs
+                ]}
+        if api_type == "search" and self.search_hits is not None:
+            start, num = int(params.get("start", [0])[0]), int(params.get("num", [20])[0])
+            objects = [
+                self.make_object("article", "http://example.com/{}".format(i), "result {}".format(i))
+                for i in range(start, min(start + num, self.search_hits))
+            ]
+            return {"hits": self.search_hits, "objects": objects}
+        if api_type == "search":
+            return {"objects": [{"type": "article", "title": params["query"][0], "pageUrl": "http://example.com/"}]}
+        page_url = params.get("url", [""])[0]
+        if "error" in page_url:
+            return {"error": "Could not download page", "errorCode": 500}
+        return {"objects": [self.make_object(api_type, page_url, "title of " + page_url)]}
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--payload-size", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--search-hits", type=int, default=1000)
+    parser.add_argument("--compress", action="store_true", help="gzip responses")
+    args = parser.parse_args()
+
+    server = StubServer(latency=args.latency, payload_size=args.payload_size, error_rate=args.error_rate,
+                        throttle_rate=args.throttle_rate, record_requests=False, port=args.port)
+    server.search_hits = args.search_hits
+    server.compress = args.compress
+    server.add_generated_job("stub", 10000)
+    print("serving on {} (set diffbot.const.diffbot_url to it)".format(server.url))
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
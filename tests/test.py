@@ -1,13 +1,17 @@
+import os
 import unittest
 import diffbot
 
+# these tests call the live API, offline tests run against tests/stub_server.py
+TOKEN = os.environ.get("DIFFBOT_TOKEN")
 
+
+@unittest.skipUnless(TOKEN, "DIFFBOT_TOKEN is not set")
 class DiffbotClientTests(unittest.TestCase):
 
     def test_article(self):
-        user_name = "sample"
         fetcher = diffbot.SingleFetcher(
-            user_name=user_name,
+            token=TOKEN,
         )
 
         extractors = fetcher.fetch_article_extractors(
@@ -24,7 +28,7 @@ class DiffbotClientTests(unittest.TestCase):
 
     def test_article_with_generate_args(self):
         fetcher = diffbot.SingleFetcher(
-            user_name="sample",
+            token=TOKEN,
         )
 
         # use generate_article_args
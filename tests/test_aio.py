@@ -0,0 +1,65 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import diffbot
+from diffbot import const
+from tests.stub_server import StubServer
+
+
+class StubServerTestCase(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.server = StubServer(latency=0.05).__enter__()
+        patcher = mock.patch.object(const, "diffbot_url", self.server.url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.server.__exit__)
+
+
+class AsyncSingleFetcherTests(StubServerTestCase):
+
+    async def test_fetch_article_extractors(self):
+        async with diffbot.AsyncSingleFetcher("token") as fetcher:
+            extractors = await fetcher.fetch_article_extractors(
+                "http://example.com/",
+                args=fetcher.generate_article_args(fields="meta"),
+            )
+
+        self.assertEqual(extractors[0].get_page_url(), "http://example.com/")
+        self.assertIsInstance(extractors[0], diffbot.ArticleExtractor)
+        method, path, params = self.server.requests[0]
+        self.assertEqual(path, "/v3/article")
+        self.assertEqual(params["fields"], ["meta"])
+        self.assertEqual(params["token"], ["token"])
+
+    async def test_many_requests_in_flight(self):
+        urls = ["http://example.com/{}".format(i) for i in range(40)]
+        async with diffbot.AsyncSingleFetcher("token", max_concurrency=20) as fetcher:
+            results = await asyncio.gather(*[fetcher.fetch_article_extractors(url) for url in urls])
+
+        self.assertEqual([res[0].get_page_url() for res in results], urls)
+
+    async def test_search(self):
+        async with diffbot.AsyncSearcher("token", "job") as searcher:
+            extractors = await searcher.fetch_search_extractors(query="type:article")
+
+        self.assertEqual(extractors[0].get_title(), "type:article")
+        self.assertEqual(self.server.requests[0][2]["col"], ["job"])
+
+
+
+class AsyncSingleFlightTests(StubServerTestCase):
+
+    async def test_coalesce(self):
+        single_flight = diffbot.AsyncSingleFlight()
+        async with diffbot.AsyncSingleFetcher("token", single_flight=single_flight) as fetcher:
+            results = await asyncio.gather(*[fetcher.fetch_raw_data("article", "http://example.com/") for _ in range(10)])
+
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(single_flight.coalesced, 9)
+        self.assertTrue(all(result == results[0] for result in results))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+from unittest import mock
+
+import diffbot
+
+
+class ClientSessionTests(unittest.TestCase):
+
+    def test_subclasses_share_given_session(self):
+        session = diffbot.Client.create_session(pool_size=2)
+        fetcher = diffbot.SingleFetcher("token", session=session)
+        operator = diffbot.BulkJobOperator("token", "job", session=session)
+
+        self.assertIs(fetcher.session, session)
+        self.assertIs(operator.session, session)
+        self.assertIs(operator._get_searcher().session, session)
+
+    def test_request_goes_through_session(self):
+        fetcher = diffbot.SingleFetcher("token", connect_timeout=1, read_timeout=5)
+        response = mock.Mock()
+        response.headers = {}
+        response.status_code = 200
+        response.content = b'{"objects": []}'
+        response.raw.stream.return_value = [response.content]
+
+        with mock.patch.object(fetcher.session, "request", return_value=response) as request:
+            fetcher.fetch_raw_data("article", "http://example.com/")
+
+        self.assertEqual(request.call_args[0][0], "GET")
+        self.assertEqual(request.call_args[1]["timeout"], (1, 5))
+
+    def test_context_manager_closes_own_session_only(self):
+        shared = diffbot.Client.create_session()
+        with mock.patch.object(shared, "close") as close_shared:
+            with diffbot.Searcher("token", "job", session=shared):
+                pass
+        close_shared.assert_not_called()
+
+        searcher = diffbot.Searcher("token", "job")
+        with mock.patch.object(searcher.session, "close") as close_own:
+            with searcher:
+                pass
+        close_own.assert_called_once_with()
+
+
+if __name__ == "__main__":
+    unittest.main()
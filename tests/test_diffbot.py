@@ -0,0 +1,831 @@
+import json
+import os
+import sqlite3
+from concurrent import futures
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+import diffbot
+from diffbot import const
+from diffbot.cache import Cache, make_cache_key
+from diffbot.error import DiffbotJobStatusError, DiffbotResponseError, DiffbotTokenError, DiffbotUnexpectedBodyError
+from tests.stub_server import StubServer
+
+
+class StubServerTestCase(unittest.TestCase):
+    latency = 0
+
+    def setUp(self):
+        self.server = StubServer(latency=self.latency).__enter__()
+        patcher = mock.patch.object(const, "diffbot_url", self.server.url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.server.__exit__)
+
+
+class FetchManyTests(StubServerTestCase):
+    latency = 0.01
+
+    def test_ordered(self):
+        urls = ["http://example.com/{}".format(i) for i in range(30)]
+        with diffbot.SingleFetcher("token") as fetcher:
+            results = list(fetcher.fetch_many("article", iter(urls), max_workers=4, ordered=True))
+
+        self.assertEqual([url for url, _ in results], urls)
+        self.assertEqual([exts[0].get_page_url() for _, exts in results], urls)
+
+    def test_unordered_returns_failures_as_results(self):
+        urls = ["http://example.com/{}".format(i) for i in range(10)] + ["http://example.com/error"]
+        with diffbot.SingleFetcher("token") as fetcher:
+            results = dict(fetcher.fetch_many("article", urls, max_workers=4))
+
+        self.assertEqual(set(results), set(urls))
+        self.assertIsInstance(results["http://example.com/error"], DiffbotResponseError)
+
+    def test_truncated_body_is_a_result(self):
+        self.server.inject_truncated_body()
+        with diffbot.SingleFetcher("token") as fetcher:
+            results = list(fetcher.fetch_many("article", ["http://example.com/0", "http://example.com/1"], max_workers=1))
+
+        errors = [result for _, result in results if isinstance(result, Exception)]
+        self.assertEqual(len(results), 2)
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], requests.exceptions.ChunkedEncodingError)
+
+    def test_urls_consumed_lazily(self):
+        consumed = []
+
+        def urls():
+            for i in range(100):
+                consumed.append(i)
+                yield "http://example.com/{}".format(i)
+
+        with diffbot.SingleFetcher("token") as fetcher:
+            results = fetcher.fetch_many("article", urls(), max_workers=2)
+            next(results)
+            self.assertLessEqual(len(consumed), 6)
+            results.close()
+
+
+class RequestTemplateTests(StubServerTestCase):
+
+    def test_same_request_as_fetch_raw_data(self):
+        args = {"fields": "title,links", "timeout": 3000}
+        headers = {"X-Forward-User-Agent": "bot"}
+        with diffbot.SingleFetcher("to ken") as fetcher:
+            expected = fetcher.fetch_raw_data("article", "http://example.com/?a=1&b=2", args=args, headers=headers)
+            template = fetcher.prepare("article", args=args, headers=headers)
+            self.assertEqual(template.fetch_raw_data("http://example.com/?a=1&b=2"), expected)
+            extractors = template.fetch_extractors("http://example.com/3")
+
+        self.assertEqual(self.server.requests[0], self.server.requests[1])
+        self.assertEqual(self.server.requests[1][2]["token"], ["to ken"])
+        self.assertEqual(self.server.requests[1][2]["url"], ["http://example.com/?a=1&b=2"])
+        self.assertEqual(extractors[0].get_page_url(), "http://example.com/3")
+        with self.assertRaises(AttributeError):
+            template.api_type = "product"
+        with self.assertRaises(TypeError):
+            template.args["fields"] = "title"
+
+    def test_token_pool_failover(self):
+        self.server.exhausted_tokens.add("a")
+        pool = diffbot.TokenPool(["a", "b"])
+        with diffbot.SingleFetcher(pool) as fetcher:
+            template = fetcher.prepare("article")
+            for i in range(3):
+                self.assertEqual(template.fetch_extractors("http://example.com/{}".format(i))[0].get_page_url(),
+                                 "http://example.com/{}".format(i))
+        self.assertEqual(pool.stats()["b"]["calls"], 3)
+
+    def test_query_default_is_not_shared(self):
+        with diffbot.SingleFetcher("token") as fetcher:
+            fetcher._fetch_raw_data("article", query={"url": "http://example.com/"})
+            fetcher._fetch_raw_data("article")
+        self.assertNotIn("url", self.server.requests[1][2])
+
+
+class RetryTests(StubServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.sleeps = []
+        self.policy = diffbot.RetryPolicy(3, random=lambda: 1.0, sleep=self.sleeps.append)
+
+    def test_retry_transient_errors(self):
+        self.server.inject_error(500)
+        self.server.inject_unexpected_body()
+        with diffbot.SingleFetcher("token", retry_policy=self.policy) as fetcher:
+            extractors = fetcher.fetch_article_extractors("http://example.com/")
+
+        self.assertEqual(extractors[0].get_page_url(), "http://example.com/")
+        self.assertEqual(self.sleeps, [0.5, 1.0])
+        self.assertEqual(self.policy.stats(), {"retries": 2, "give_ups": 0})
+
+    def test_retry_reset_while_reading_body(self):
+        self.server.inject_truncated_body()
+        with diffbot.SingleFetcher("token", retry_policy=self.policy) as fetcher:
+            data = fetcher.fetch_raw_data("article", "http://example.com/")
+
+        self.assertEqual(data["objects"][0]["pageUrl"], "http://example.com/")
+        self.assertEqual(self.policy.stats(), {"retries": 1, "give_ups": 0})
+
+    def test_honor_retry_after_and_give_up(self):
+        self.server.inject_error(429, times=3, retry_after=7)
+        with diffbot.SingleFetcher("token", retry_policy=self.policy) as fetcher:
+            with self.assertRaises(DiffbotResponseError) as cm:
+                fetcher.fetch_raw_data("article", "http://example.com/")
+
+        self.assertEqual(cm.exception.code, 429)
+        self.assertEqual(self.sleeps, [7.0, 7.0])
+        self.assertEqual(self.policy.stats(), {"retries": 2, "give_ups": 1})
+
+    def test_give_up_on_long_retry_after(self):
+        self.server.inject_error(503, retry_after=3600)
+        with diffbot.SingleFetcher("token", retry_policy=self.policy) as fetcher:
+            with self.assertRaises(DiffbotResponseError):
+                fetcher.fetch_raw_data("article", "http://example.com/")
+
+        self.assertEqual(self.sleeps, [])
+        self.assertEqual(self.policy.stats(), {"retries": 0, "give_ups": 1})
+
+    def test_override_per_call(self):
+        self.server.inject_error(404)
+        self.server.inject_error(404)
+        with diffbot.SingleFetcher("token", retry_policy=self.policy) as fetcher:
+            with self.assertRaises(DiffbotResponseError):
+                fetcher.fetch_raw_data("article", "http://example.com/")
+            retry_not_found = diffbot.RetryPolicy(2, retryable_codes=[404], sleep=self.sleeps.append)
+            data = fetcher.fetch_raw_data("article", "http://example.com/", retry_policy=retry_not_found)
+
+        self.assertEqual(data["objects"][0]["pageUrl"], "http://example.com/")
+        self.assertEqual(retry_not_found.retries, 1)
+
+
+class HedgeTests(StubServerTestCase):
+
+    def slow_requests(self, *slow):
+        """latency of stub server: 1s for n-th request in slow, none for others"""
+        count = iter(range(1000))
+        self.server.latency = lambda: 1.0 if next(count) in slow else 0
+
+    def test_hedge_wins_over_straggler(self):
+        self.slow_requests(0)
+        policy = diffbot.HedgePolicy(budget=1.0, initial_delay=0.05)
+        self.addCleanup(policy.close)
+        with diffbot.SingleFetcher("token", hedge_policy=policy) as fetcher:
+            start = time.monotonic()
+            extractors = fetcher.prepare("article").fetch_extractors("http://example.com/")
+            self.assertLess(time.monotonic() - start, 0.9)
+            fetcher.fetch_article_extractors("http://example.com/")
+
+        self.assertEqual(extractors[0].get_page_url(), "http://example.com/")
+        self.assertEqual(policy.stats(), {"calls": 2, "hedged": 1, "won": 1, "over_budget": 0, "delay": 0.05})
+
+    def test_budget(self):
+        self.slow_requests(0, 1)
+        policy = diffbot.HedgePolicy(budget=0.5, initial_delay=0.05)
+        self.addCleanup(policy.close)
+        with diffbot.SingleFetcher("token", hedge_policy=policy) as fetcher:
+            fetcher.fetch_raw_data("article", "http://example.com/")
+
+        # half a hedge is earned by the first call, so the straggler is awaited
+        self.assertEqual(policy.stats()["hedged"], 0)
+        self.assertEqual(policy.stats()["over_budget"], 1)
+
+    def test_no_hedge_without_free_worker(self):
+        self.slow_requests(0, 1)
+        policy = diffbot.HedgePolicy(budget=1.0, initial_delay=0.05, max_workers=2)
+        self.addCleanup(policy.close)
+        with diffbot.SingleFetcher("token", hedge_policy=policy) as fetcher:
+            with futures.ThreadPoolExecutor(2) as executor:
+                calls = [executor.submit(fetcher.fetch_raw_data, "article", "http://example.com/") for _ in range(2)]
+                for call in calls:
+                    call.result()
+
+        # both workers run the stragglers, so neither call is hedged nor queued behind a hedge
+        self.assertEqual(policy.stats()["hedged"], 0)
+        self.assertEqual(policy.stats()["over_budget"], 0)
+
+    def test_errors_are_raised_once_both_fail(self):
+        self.server.inject_error(404, times=2)
+        policy = diffbot.HedgePolicy(budget=1.0, initial_delay=0.0)
+        self.addCleanup(policy.close)
+        with diffbot.SingleFetcher("token", hedge_policy=policy) as fetcher:
+            with self.assertRaises(DiffbotResponseError):
+                fetcher.fetch_raw_data("article", "http://example.com/")
+
+    def test_percentile_delay(self):
+        policy = diffbot.HedgePolicy(0.9, min_samples=10, min_delay=0.01, max_delay=0.5)
+        self.addCleanup(policy.close)
+        self.assertEqual(policy.delay(), 1.0)
+        for i in range(10):
+            policy.observe(i / 100)
+        self.assertEqual(policy.delay(), 0.09)
+        for _ in range(16):
+            policy.observe(10.0)
+        self.assertEqual(policy.delay(), 0.5)
+
+
+class CacheTests(StubServerTestCase):
+
+    def fetch_twice(self, cache, **kwargs):
+        with diffbot.SingleFetcher("token", cache=cache) as fetcher:
+            first = fetcher.fetch_raw_data("article", "http://example.com/", args={"fields": "meta"})
+            second = fetcher.fetch_raw_data("article", "http://example.com/", args={"fields": "meta"}, **kwargs)
+        self.assertEqual(first, second)
+        return len(self.server.requests)
+
+    def test_memory_cache(self):
+        cache = diffbot.MemoryCache(10)
+        self.assertEqual(self.fetch_twice(cache), 1)
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "evictions": 0})
+
+    def test_sqlite_cache_shared_between_fetchers(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cache.sqlite")
+            self.assertEqual(self.fetch_twice(diffbot.SqliteCache(path)), 1)
+            self.assertEqual(self.fetch_twice(diffbot.SqliteCache(path)), 1)
+
+    def test_sqlite_cache_closes_connections_of_every_thread(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with diffbot.SqliteCache(os.path.join(tmpdir, "cache.sqlite")) as cache:
+                cache.set("key", {"a": 1})
+                with futures.ThreadPoolExecutor(1) as executor:
+                    conn = executor.submit(cache._connect).result()
+                cache.close()
+                with self.assertRaises(sqlite3.ProgrammingError):
+                    conn.execute("SELECT 1")
+                # reopened on next use
+                self.assertEqual(cache.get("key"), {"a": 1})
+
+    def test_bypass_and_refresh(self):
+        cache = diffbot.MemoryCache(10)
+        self.assertEqual(self.fetch_twice(cache, bypass_cache=True), 2)
+        self.assertEqual(self.fetch_twice(cache, refresh_cache=True), 3)
+
+    def test_memory_cache_expiry_and_lru(self):
+        now = [0]
+        cache = diffbot.MemoryCache(2, ttl=10, clock=lambda: now[0])
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("a"))
+        now[0] = 10
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats(), {"hits": 0, "misses": 2, "evictions": 2})
+
+    def test_key_ignores_token_and_order(self):
+        self.assertEqual(
+            make_cache_key("article", {"url": "u", "fields": "meta", "token": "a"}),
+            make_cache_key("article", {"fields": "meta", "url": "u"}),
+        )
+
+    def test_memory_cache_returns_copy(self):
+        cache = diffbot.MemoryCache(10)
+        cache.set("a", {"objects": [{"title": "t"}]})
+        cache.get("a")["objects"].clear()
+        self.assertEqual(cache.get("a"), {"objects": [{"title": "t"}]})
+
+    def test_cache_is_abstract(self):
+        with self.assertRaises(TypeError):
+            Cache()
+
+    def test_headers_are_part_of_key(self):
+        cache = diffbot.MemoryCache(10)
+        with diffbot.SingleFetcher("token", cache=cache) as fetcher:
+            for headers in [{"X-Forward-User-Agent": "a"}, {"x-forward-user-agent": "a"}, {"X-Forward-User-Agent": "b"}, None]:
+                fetcher.fetch_raw_data("article", "http://example.com/", headers=headers)
+
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(make_cache_key("article", {"url": "u"}), make_cache_key("article", {"url": "u"}, {}))
+
+
+class SingleFlightTests(StubServerTestCase):
+    latency = 0.2
+
+    def test_coalesce_concurrent_identical_calls(self):
+        single_flight = diffbot.SingleFlight()
+        with diffbot.SingleFetcher("token", single_flight=single_flight) as fetcher:
+            with futures.ThreadPoolExecutor(8) as executor:
+                results = list(executor.map(lambda _: fetcher.fetch_raw_data("article", "http://example.com/"), range(8)))
+
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(single_flight.coalesced, 7)
+        self.assertTrue(all(result is results[0] for result in results))
+
+    def test_share_exception(self):
+        self.server.inject_error(500)
+        single_flight = diffbot.SingleFlight()
+        with diffbot.SingleFetcher("token", single_flight=single_flight) as fetcher:
+            with futures.ThreadPoolExecutor(4) as executor:
+                tasks = [executor.submit(fetcher.fetch_raw_data, "article", "http://example.com/") for _ in range(4)]
+                errors = [task.exception() for task in tasks]
+
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertTrue(all(isinstance(error, DiffbotResponseError) for error in errors))
+
+
+class JobDataTests(StubServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.objects = [
+            {"type": "article", "title": "title {}".format(i), "pageUrl": "http://example.com/{}".format(i), "text": "a, \"b\"\n" * i}
+            for i in range(100)
+        ]
+        self.server.add_job("job", self.objects)
+
+    def test_lazy_fetch_extractors(self):
+        with diffbot.BulkJobOperator("token", "job") as operator:
+            extractors = operator.lazy_fetch_extractors()
+            first = next(extractors)
+            rest = list(extractors)
+
+        self.assertIsInstance(first, diffbot.ArticleExtractor)
+        self.assertEqual([ext.get_raw_data() for ext in [first] + rest], self.objects)
+
+    def test_iter_raw_data_csv(self):
+        with diffbot.CrawlJobOperator("token", "job") as operator:
+            rows = list(operator.iter_raw_data(format="csv", chunk_size=7))
+
+        self.assertEqual([row["text"] for row in rows], [obj["text"] for obj in self.objects])
+
+    def test_iter_raw_data_csv_error(self):
+        error = json.dumps({"error": "Job data is not ready", "errorCode": 500}).encode()
+        make_response = self.server.make_response
+
+        def respond(api_type, params):
+            if api_type.endswith("/data"):
+                return 200, error, {"Content-Type": "application/json"}
+            return make_response(api_type, params)
+
+        with mock.patch.object(self.server, "make_response", respond):
+            with diffbot.CrawlJobOperator("token", "job") as operator:
+                with self.assertRaises(DiffbotResponseError):
+                    list(operator.iter_raw_data(format="csv", chunk_size=7))
+
+    def test_job_not_completed(self):
+        self.server.add_job("running", [], status=1)
+        with diffbot.BulkJobOperator("token", "running") as operator:
+            with self.assertRaises(DiffbotJobStatusError):
+                list(operator.iter_raw_data())
+
+
+class JobStatusTests(StubServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.sleeps = []
+        self.now = [0.0]
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now[0] += seconds
+        if len(self.sleeps) == 3:
+            for name in list(self.server.jobs):
+                self.server.set_job_status(name, 9)
+
+    def test_status_reads_share_cache(self):
+        self.server.add_job("job", [])
+        with diffbot.BulkJobOperator("token", "job") as operator:
+            self.assertTrue(operator.job_completed())
+            operator.fetch_raw_data()
+            operator.fetch_completed_searcher()
+            operator.pause_job()
+            operator.job_completed()
+
+        paths = [path for _, path, _ in self.server.requests]
+        self.assertEqual(paths, ["/v3/bulk", "/v3/bulk/data", "/v3/bulk", "/v3/bulk"])
+
+    def test_wait_until_complete(self):
+        self.server.add_job("job", [], status=1)
+        cache = diffbot.JobStatusCache(ttl=0)
+        with diffbot.CrawlJobOperator("token", "job", status_cache=cache) as operator:
+            status = operator.wait_until_complete(poll_interval=1, backoff=2, clock=lambda: self.now[0], sleep=self.sleep)
+
+        self.assertEqual(status["status"], 9)
+        self.assertEqual(self.sleeps, [1, 2, 4])
+
+    def test_wait_until_complete_timeout(self):
+        self.server.add_job("job", [], status=1)
+        cache = diffbot.JobStatusCache(ttl=0)
+        with diffbot.CrawlJobOperator("token", "job", status_cache=cache) as operator:
+            with self.assertRaises(DiffbotJobStatusError):
+                operator.wait_until_complete(timeout=2.5, poll_interval=1, backoff=2, clock=lambda: self.now[0], sleep=self.sleep)
+        self.assertEqual(self.sleeps, [1, 1.5])
+
+    def test_wait_for_jobs_polls_one_listing(self):
+        self.server.add_job("done", [])
+        self.server.add_job("running", [], status=1)
+        cache = diffbot.JobStatusCache(ttl=0)
+        operators = [diffbot.BulkJobOperator("token", name, status_cache=cache) for name in ["running", "done"]]
+
+        names = list(diffbot.wait_for_jobs(operators, poll_interval=1, clock=lambda: self.now[0], sleep=self.sleep))
+
+        self.assertEqual(names, ["done", "running"])
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertTrue(all("name" not in params for _, _, params in self.server.requests))
+
+
+class BulkSubmitTests(StubServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.operator = diffbot.BulkJobOperator("token", "bulk", status_cache=diffbot.JobStatusCache(ttl=0))
+        self.addCleanup(self.operator.close)
+
+    def submitted(self):
+        return [obj["pageUrl"] for obj in self.server.jobs["bulk"]["objects"]]
+
+    def test_stream_generator_with_dedupe(self):
+        urls = ("HTTP://Example.com:80/{}#top".format(i % 5000) for i in range(10000))
+        self.operator.start_job(urls, "http://api", args={"maxRounds": 1}, normalize=True, dedupe=True)
+
+        self.assertEqual(self.submitted(), ["http://example.com/{}".format(i) for i in range(5000)])
+        self.assertEqual(self.server.last_headers["Transfer-Encoding"], "chunked")
+        method, _, params = self.server.requests[-1]
+        self.assertEqual((method, params["token"], params["apiUrl"], params["maxRounds"]),
+                         ("POST", ["token"], ["http://api"], ["1"]))
+
+    def test_file_and_retry(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, "urls.txt")
+        with open(path, "w") as f:
+            f.write("# seeds\nhttp://a.com/ http://b.com/?q=a b\n\nhttp://a.com/\n")
+        self.operator.retry_policy = diffbot.RetryPolicy(2, sleep=lambda seconds: None)
+        self.server.inject_error(500)
+        self.operator.start_job(path, "http://api", dedupe=diffbot.BloomFilter(100))
+
+        self.assertEqual(self.submitted(), ["http://a.com/", "http://b.com/?q=a", "b"])
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_iterator_is_not_resent(self):
+        self.operator.retry_policy = diffbot.RetryPolicy(2, sleep=lambda seconds: None)
+        self.server.inject_error(500)
+        with self.assertRaises(DiffbotResponseError):
+            self.operator.start_job(iter(["http://a.com/"]), "http://api")
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_dedupe_set_is_kept(self):
+        seen = {"http://a.com/"}
+        self.operator.retry_policy = diffbot.RetryPolicy(2, sleep=lambda seconds: None)
+        self.server.inject_error(500)
+        self.operator.start_job(["http://a.com/", "http://b.com/", "http://b.com/"], "http://api", dedupe=seen)
+
+        self.assertEqual(self.submitted(), ["http://b.com/"])
+        self.assertEqual(seen, {"http://a.com/", "http://b.com/"})
+
+    def test_failed_submit_is_not_remembered(self):
+        seen = {"http://a.com/"}
+        urls = ["http://a.com/", "http://b.com/", "http://c.com/"]
+        self.server.inject_error(500)
+        with self.assertRaises(DiffbotResponseError):
+            self.operator.start_job(urls, "http://api", dedupe=seen)
+        self.assertEqual(seen, {"http://a.com/"})
+
+        self.operator.start_job(urls, "http://api", dedupe=seen)
+        self.assertEqual(self.submitted(), ["http://b.com/", "http://c.com/"])
+        self.assertEqual(seen, {"http://a.com/", "http://b.com/", "http://c.com/"})
+
+    def test_bloom_filter_update(self):
+        bloom, other = diffbot.BloomFilter(100), diffbot.BloomFilter(100)
+        bloom.add("http://a.com/")
+        other.add("http://b.com/")
+        bloom.update(other)
+        self.assertTrue("http://a.com/" in bloom and "http://b.com/" in bloom)
+        with self.assertRaises(ValueError):
+            bloom.update(diffbot.BloomFilter(1000))
+
+    def test_normalize_url_and_bloom_filter(self):
+        self.assertEqual(diffbot.normalize_url(" HTTPS://User@Example.COM:443?b=1#x "), "https://User@example.com/?b=1")
+        self.assertEqual(diffbot.normalize_url("http://[::1]:8080/A"), "http://[::1]:8080/A")
+        bloom = diffbot.BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add("http://example.com/{}".format(i))
+        self.assertTrue(all("http://example.com/{}".format(i) in bloom for i in range(1000)))
+        false_positives = sum("http://example.org/{}".format(i) in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class ShardedBulkJobTests(StubServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.urls = ["http://example.com/{}".format(i) for i in range(10)]
+        self.job = diffbot.ShardedBulkJob("token", "big", shard_size=4, max_workers=2,
+                                          status_cache=diffbot.JobStatusCache(ttl=0))
+        self.addCleanup(self.job.close)
+
+    def test_split_and_merge(self):
+        shards = self.job.start_jobs(iter(self.urls), "http://api")
+
+        self.assertEqual([len(shard.urls) for shard in shards], [4, 4, 2])
+        self.assertEqual(sorted(self.server.jobs), ["big-0", "big-1", "big-2"])
+        self.assertEqual(set(self.job.statuses()), {"big-0", "big-1", "big-2"})
+        page_urls = [extractor.get_page_url() for extractor in self.job.lazy_fetch_extractors(poll_interval=0)]
+        self.assertEqual(sorted(page_urls), sorted(self.urls))
+        # consumed shards are not yielded again
+        self.assertEqual(list(self.job.iter_raw_data(poll_interval=0)), [])
+
+    def test_retry_failed_shard_alone(self):
+        self.server.inject_error(500)
+        self.job.start_jobs(self.urls, "http://api")
+        failed = self.job.failed_shards
+        self.assertEqual(len(failed), 1)
+        self.assertIsInstance(failed[0].error, DiffbotResponseError)
+
+        objects = list(self.job.iter_raw_data(poll_interval=0))
+        self.assertEqual(len(objects), 10 - len(failed[0].urls))
+
+        self.job.retry_failed()
+        self.assertEqual(failed[0].job_name, "big-{}-r1".format(failed[0].index))
+        objects = list(self.job.iter_raw_data(poll_interval=0))
+        self.assertEqual(sorted(obj["pageUrl"] for obj in objects), sorted(failed[0].urls))
+        self.assertEqual(self.job.failed_shards, [])
+
+    def test_failed_job_status_and_timeout(self):
+        self.server.new_job_status = 1
+        self.job.start_jobs(self.urls, "http://api")
+        self.server.set_job_status("big-0", 10)
+        self.server.set_job_status("big-1", 9)
+        now = [0.0]
+
+        def sleep(seconds):
+            now[0] += seconds
+
+        objects = list(self.job.iter_raw_data(timeout=3, poll_interval=1, clock=lambda: now[0], sleep=sleep))
+
+        self.assertEqual(len(objects), 4)
+        self.assertEqual([shard.error.status for shard in self.job.failed_shards], [10, None])
+
+        self.server.new_job_status = 9
+        self.job.retry_failed()
+        self.assertNotIn("big-0", self.server.jobs)
+        self.assertEqual(len(list(self.job.iter_raw_data(poll_interval=0))), 6)
+
+
+class DeltaIndexTests(StubServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.index = diffbot.DeltaIndex(os.path.join(tmpdir.name, "delta.db"), hash_fields=["title", "text"])
+        self.addCleanup(self.index.close)
+        self.operator = diffbot.CrawlJobOperator("token", "crawl", status_cache=diffbot.JobStatusCache(ttl=0))
+        self.addCleanup(self.operator.close)
+
+    def finish_round(self, titles, *, last=False):
+        objects = [{"type": "article", "pageUrl": "http://example.com/{}".format(i), "title": title}
+                   for i, title in enumerate(titles)]
+        self.server.add_round("crawl", objects, last=last)
+
+    def changed_titles(self):
+        return [datum["title"] for datum in self.operator.iter_changed_data(self.index)]
+
+    def test_yield_new_and_changed_only(self):
+        # status is "next round to start" between rounds, and "completed" after the last one
+        self.finish_round(["a", "b", "c"])
+        self.assertEqual(self.changed_titles(), ["a", "b", "c"])
+        self.finish_round(["a", "B", "c", "d"])
+        self.assertEqual(self.changed_titles(), ["B", "d"])
+        self.finish_round(["a", "B", "C", "d"], last=True)
+        self.assertEqual(self.changed_titles(), ["C"])
+        self.assertEqual(self.index.count("crawl/crawl"), 4)
+        self.assertEqual(self.index.last_round("crawl/crawl"), 3)
+
+    def test_round_in_progress(self):
+        # first round is running
+        self.server.add_job("crawl", [], status=7)
+        self.server.jobs["crawl"]["rounds"] = 0
+        with self.assertRaises(DiffbotJobStatusError):
+            self.changed_titles()
+        self.finish_round(["a"])
+        self.assertEqual(self.changed_titles(), ["a"])
+        # next round is running, and no round has finished since the last read
+        self.server.set_job_status("crawl", 7)
+        self.assertEqual(self.changed_titles(), [])
+        # a round has finished since the last read, while another one runs
+        self.finish_round(["b"])
+        self.server.set_job_status("crawl", 7)
+        self.assertEqual(self.changed_titles(), ["b"])
+
+    def test_skip_download_of_same_round(self):
+        self.finish_round(["a"])
+        self.assertEqual(self.changed_titles(), ["a"])
+        self.server.jobs["crawl"]["objects"] = [{"type": "article", "pageUrl": "http://example.com/0", "title": "b"}]
+        self.assertEqual(self.changed_titles(), [])
+        self.assertEqual([path for _, path, _ in self.server.requests].count("/v3/crawl/data"), 1)
+
+    def test_interrupted_round_resumes(self):
+        self.finish_round(["a", "b", "c"])
+        changes = self.operator.iter_changed_data(self.index, compact=True)
+        self.assertEqual(next(changes).get_title(), "a")
+        changes.close()
+        self.assertEqual(self.index.last_round("crawl/crawl"), 0)
+        self.assertEqual(self.changed_titles(), ["b", "c"])
+
+    def test_fingerprint(self):
+        raw = b'{"title": "t", "pageUrl": "http://example.com/", "html": "<p>"}'
+        same = b'{"pageUrl":"http://example.com/","html":"<p>","title":"t","timestamp":1}'
+        self.assertEqual(self.index.fingerprint(raw), self.index.fingerprint(same))
+        self.assertNotEqual(self.index.fingerprint(raw)[1], self.index.fingerprint(raw.replace(b'"t"', b'"u"'))[1])
+        # without hash_fields, raw bytes are hashed
+        index = diffbot.DeltaIndex(":memory:")
+        self.assertEqual(index.fingerprint(raw)[0], index.fingerprint(same)[0])
+        self.assertNotEqual(index.fingerprint(raw)[1], index.fingerprint(same)[1])
+
+
+class LocalIndexTests(StubServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.index = diffbot.LocalIndex(os.path.join(tmpdir.name, "index.db"))
+        self.addCleanup(self.index.close)
+        self.server.add_job("crawl", [
+            {"type": "article", "pageUrl": "http://a.com/1", "siteName": "A", "title": "Python asyncio", "text": "event loops"},
+            {"type": "article", "pageUrl": "http://b.com/1", "siteName": "B", "title": "Rust", "text": "no python here"},
+            {"type": "product", "pageUrl": "http://a.com/2", "siteName": "A", "title": "Snake", "text": "a python toy"},
+        ])
+        operator = diffbot.CrawlJobOperator("token", "crawl")
+        self.addCleanup(operator.close)
+        self.assertEqual(self.index.add_job(operator), 3)
+
+    def page_urls(self, *args, **kwargs):
+        return [extractor.get_page_url() for extractor in self.index.search(*args, **kwargs)]
+
+    def test_full_text_and_fields(self):
+        self.assertEqual(len(self.index), 3)
+        # match in title ranks first
+        self.assertEqual(self.page_urls("python")[0], "http://a.com/1")
+        self.assertEqual(sorted(self.page_urls("python")), ["http://a.com/1", "http://a.com/2", "http://b.com/1"])
+        self.assertEqual(self.page_urls("title:python"), ["http://a.com/1"])
+        self.assertEqual(self.page_urls("python", site_name="A", type="product"), ["http://a.com/2"])
+        self.assertEqual(self.page_urls(site_name="A"), ["http://a.com/1", "http://a.com/2"])
+        self.assertEqual(self.index.count("python", site_name="A"), 2)
+
+    def test_extractor_types(self):
+        self.assertIsInstance(self.index.get("http://a.com/1"), diffbot.ArticleExtractor)
+        self.assertIsInstance(self.index.get("http://a.com/2"), diffbot.ProductExtractor)
+        self.assertEqual(self.index.get("http://a.com/2").get_title(), "Snake")
+        self.assertIsNone(self.index.get("http://c.com/"))
+
+    def test_replace_same_page_url(self):
+        self.index.add([{"type": "article", "pageUrl": "http://b.com/1", "title": "Go", "text": "goroutines"}])
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.page_urls("rust"), [])
+        self.assertEqual(self.page_urls("goroutines"), ["http://b.com/1"])
+        self.index.optimize()
+        self.assertEqual(sorted(self.page_urls("python")), ["http://a.com/1", "http://a.com/2"])
+
+
+class TokenPoolTests(StubServerTestCase):
+
+    def tokens_of_requests(self):
+        return [params["token"][0] for _, _, params in self.server.requests]
+
+    def test_round_robin(self):
+        pool = diffbot.TokenPool(["a", "b", "c"])
+        with diffbot.SingleFetcher(pool) as fetcher:
+            for i in range(6):
+                fetcher.fetch_article_extractors("http://example.com/{}".format(i))
+        self.assertEqual(self.tokens_of_requests(), ["a", "b", "c", "a", "b", "c"])
+        self.assertEqual(pool.stats()["a"]["calls"], 2)
+
+    def test_least_in_flight(self):
+        pool = diffbot.TokenPool(["a", "b"], strategy="least_in_flight")
+        with pool.use() as first:
+            self.assertEqual(pool.acquire(), "b" if first == "a" else "a")
+
+    def test_fail_over_and_cool_down(self):
+        now = [0.0]
+        pool = diffbot.TokenPool(["a", "b"], cooldown=30, clock=lambda: now[0])
+        self.server.exhausted_tokens.add("a")
+        with diffbot.Searcher(pool, "col") as searcher:
+            for _ in range(3):
+                searcher.fetch_raw_data("type:article")
+            self.assertEqual(self.tokens_of_requests(), ["a", "b", "b", "b"])
+            self.assertEqual(pool.stats()["a"]["throttled"], 1)
+            self.assertEqual(pool.available(), ["b"])
+
+            self.server.exhausted_tokens.add("b")
+            with self.assertRaises(DiffbotResponseError):
+                searcher.fetch_raw_data("type:article")
+            with self.assertRaises(DiffbotTokenError):
+                searcher.fetch_raw_data("type:article")
+
+            now[0] = 31
+            self.server.exhausted_tokens.clear()
+            searcher.fetch_raw_data("type:article")
+
+    def test_job_operator_pinned(self):
+        pool = diffbot.TokenPool(["a", "b"])
+        self.server.add_job("job", [])
+        with diffbot.BulkJobOperator(pool, "job") as operator:
+            self.assertEqual(operator.token, "a")
+            self.server.exhausted_tokens.add("a")
+            with self.assertRaises(DiffbotResponseError):
+                operator.job_completed()
+        self.assertEqual(self.tokens_of_requests(), ["a"])
+
+
+    def test_fetch_many_yields_token_error_per_url(self):
+        pool = diffbot.TokenPool(["a"])
+        pool.cool_down("a", 60)
+        urls = ["http://example.com/{}".format(i) for i in range(3)]
+        with diffbot.SingleFetcher(pool) as fetcher:
+            results = dict(fetcher.fetch_many("article", urls, max_workers=2))
+        self.assertEqual(set(results), set(urls))
+        self.assertTrue(all(isinstance(result, DiffbotTokenError) for result in results.values()))
+
+class CompressionTests(StubServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server.compress = True
+        self.server.payload_size = 5000
+
+    def test_negotiate_and_count_savings(self):
+        events = []
+        with diffbot.SingleFetcher("token", hooks=[events.append]) as fetcher:
+            fetcher.fetch_article_extractors("http://example.com/")
+            stats = fetcher.transfer_stats()
+        self.assertIn("gzip", self.server.last_headers["Accept-Encoding"])
+        self.assertEqual(stats["responses"], 1)
+        self.assertLess(stats["wire_bytes"] * 10, stats["decoded_bytes"])
+        self.assertEqual((events[0].wire_bytes, events[0].response_bytes), (stats["wire_bytes"], stats["decoded_bytes"]))
+
+    def test_stream_job_data_decompressed(self):
+        self.server.add_generated_job("job", 200)
+        with diffbot.BulkJobOperator("token", "job") as operator:
+            self.assertEqual(sum(1 for _ in operator.iter_raw_data(chunk_size=4096)), 200)
+            stats = operator.transfer_stats()
+        self.assertGreater(stats["decoded_bytes"], 200 * 10000)
+        self.assertLess(stats["ratio"], 0.1)
+
+    def test_compress_disabled(self):
+        with diffbot.SingleFetcher("token", compress=False) as fetcher:
+            fetcher.fetch_article_extractors("http://example.com/")
+            stats = fetcher.transfer_stats()
+        self.assertEqual(self.server.last_headers["Accept-Encoding"], "identity")
+        self.assertEqual(stats["wire_bytes"], stats["decoded_bytes"])
+
+
+class IterSearchTests(StubServerTestCase):
+    latency = 0.01
+
+    def test_walk_every_page(self):
+        self.server.search_hits = 95
+        with diffbot.Searcher("token", "job") as searcher:
+            titles = [ext.get_title() for ext in searcher.iter_search("type:article", 10, prefetch=3)]
+
+        self.assertEqual(titles, ["result {}".format(i) for i in range(95)])
+        starts = sorted(int(params["start"][0]) for _, _, params in self.server.requests)
+        self.assertEqual(starts, list(range(0, 100, 10)))
+
+    def test_no_prefetch_past_hits(self):
+        self.server.search_hits = 10
+        with diffbot.Searcher("token", "job") as searcher:
+            extractors = list(searcher.iter_search("type:article", 50, prefetch=4))
+
+        self.assertEqual(len(extractors), 10)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_stop_on_short_page_without_hits(self):
+        with diffbot.Searcher("token", "job") as searcher:
+            extractors = list(searcher.iter_search("type:article", 10, prefetch=0))
+
+        self.assertEqual(len(extractors), 1)
+        self.assertEqual(len(self.server.requests), 1)
+
+
+class JsonDecoderTests(StubServerTestCase):
+
+    def test_raw_bytes(self):
+        with diffbot.SingleFetcher("token") as fetcher:
+            body = fetcher.fetch_raw_data("article", "http://example.com/", raw=True)
+            self.assertIsInstance(body, bytes)
+            self.assertEqual(json.loads(body), fetcher.fetch_raw_data("article", "http://example.com/"))
+
+            with self.assertRaises(DiffbotResponseError):
+                fetcher.fetch_raw_data("article", "http://example.com/error", raw=True)
+
+    def test_pluggable_decoder_keeps_error_mapping(self):
+        for name in diffbot.jsonlib.DECODERS:
+            self.server.inject_unexpected_body()
+            with diffbot.SingleFetcher("token", json_decoder=name) as fetcher:
+                with self.assertRaises(DiffbotUnexpectedBodyError):
+                    fetcher.fetch_raw_data("article", "http://example.com/")
+                data = fetcher.fetch_raw_data("article", "http://example.com/")
+            self.assertEqual(data["objects"][0]["pageUrl"], "http://example.com/")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+import diffbot
+from tests.test_diffbot import StubServerTestCase
+
+
+class ExportTests(StubServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.objects = [
+            {"type": "article", "title": "title {}".format(i), "pageUrl": "http://example.com/{}".format(i), "text": "é" * i, "html": "<p/>"}
+            for i in range(50)
+        ]
+        self.server.add_job("job", self.objects)
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, "job.jsonl")
+
+    def test_jsonl_gzip(self):
+        with diffbot.BulkJobOperator("token", "job") as operator:
+            count = operator.export_data(self.path, compression="gzip")
+
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            self.assertEqual([json.loads(line) for line in f], self.objects)
+        self.assertEqual(count, 50)
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ["job.jsonl"])
+
+    def test_columnar(self):
+        with diffbot.CrawlJobOperator("token", "job") as operator:
+            operator.export_data(self.path, format="columnar", fields=["pageUrl", "text"])
+
+        with open(os.path.join(self.path, "_schema.json")) as f:
+            self.assertEqual(json.load(f)["rows"], 50)
+        with open(os.path.join(self.path, "text.jsonl"), encoding="utf-8") as f:
+            self.assertEqual([json.loads(line) for line in f], [obj["text"] for obj in self.objects])
+
+    def test_resume_interrupted_download(self):
+        body = json.dumps(self.objects).encode()
+        with open(self.path + ".download.part", "wb") as f:
+            f.write(body[:1000])
+        with open(self.path + ".download.part.json", "w") as f:
+            json.dump({"validator": None}, f)
+
+        with diffbot.BulkJobOperator("token", "job") as operator:
+            operator.export_data(self.path)
+
+        with open(self.path, encoding="utf-8") as f:
+            self.assertEqual([json.loads(line) for line in f], self.objects)
+        self.assertEqual(self.server.ranges, ["bytes=1000-"])
+
+    def test_restart_when_range_is_ignored(self):
+        self.server.accept_ranges = False
+        with open(self.path + ".download.part", "wb") as f:
+            f.write(b"[garbage")
+        with open(self.path + ".download.part.json", "w") as f:
+            json.dump({"validator": None}, f)
+
+        with diffbot.BulkJobOperator("token", "job") as operator:
+            self.assertEqual(operator.export_data(self.path), 50)
+
+    def test_compressed_download_is_not_resumed(self):
+        self.server.compress = True
+        with open(self.path + ".download.part", "wb") as f:
+            f.write(b"[garbage")
+        with open(self.path + ".download.part.json", "w") as f:
+            json.dump({"validator": None}, f)
+
+        with diffbot.BulkJobOperator("token", "job") as operator:
+            self.assertEqual(operator.export_data(self.path, resumable=False), 50)
+            stats = operator.transfer_stats()
+        self.assertEqual(self.server.ranges, [])
+        self.assertLess(stats["wire_bytes"], stats["decoded_bytes"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import json
+import unittest
+
+import diffbot
+from tests.test_diffbot import StubServerTestCase
+
+
+class CompactExtractorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.datum = {
+            "type": "article", "title": "title", "pageUrl": "http://example.com/", "siteName": "example",
+            "html": "<p class=\"a\">{[,:]}</p>" * 100, "text": "text", "tags": [{"label": "x"}],
+        }
+        self.raw = json.dumps(self.datum).encode()
+
+    def test_decode_on_access(self):
+        extractor = diffbot.make_compact_extractor(self.raw)
+
+        self.assertIsInstance(extractor, diffbot.ArticleExtractor)
+        self.assertEqual(extractor.get_title(), "title")
+        self.assertEqual(extractor.get_html(), self.datum["html"])
+        self.assertEqual(extractor.get_resolved_url(), None)
+        self.assertEqual(dict(extractor.data), self.datum)
+        self.assertEqual(extractor.get_raw_data(), self.datum)
+        self.assertFalse(hasattr(extractor, "__dict__"))
+
+    def test_projection(self):
+        extractor = diffbot.make_compact_extractor(self.raw, fields=["title", "pageUrl"])
+
+        self.assertEqual(extractor.get_page_url(), "http://example.com/")
+        self.assertEqual(extractor.get_raw_data(), {"title": "title", "pageUrl": "http://example.com/", "type": "article"})
+        with self.assertRaises(KeyError):
+            extractor.get_html()
+
+    def test_extractors_have_no_dict(self):
+        self.assertFalse(hasattr(diffbot.ArticleExtractor(self.datum), "__dict__"))
+
+
+class CompactResultsTests(StubServerTestCase):
+
+    def test_job_data(self):
+        objects = [{"type": "article", "title": str(i), "pageUrl": "http://example.com/", "html": "<p/>"} for i in range(10)]
+        self.server.add_job("job", objects)
+        with diffbot.BulkJobOperator("token", "job") as operator:
+            extractors = list(operator.lazy_fetch_extractors(compact=True, fields=["title"]))
+
+        self.assertEqual([ext.get_title() for ext in extractors], [str(i) for i in range(10)])
+
+    def test_search(self):
+        self.server.search_hits = 25
+        with diffbot.Searcher("token", "job") as searcher:
+            extractors = list(searcher.iter_search("type:article", 10, compact=True))
+
+        self.assertEqual([ext.get_title() for ext in extractors], ["result {}".format(i) for i in range(25)])
+        self.assertIsInstance(extractors[0], diffbot.CompactArticleExtractor)
+
+
+if __name__ == "__main__":
+    unittest.main()
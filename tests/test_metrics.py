@@ -0,0 +1,61 @@
+import unittest
+
+import diffbot
+from diffbot.error import DiffbotResponseError
+from tests.test_diffbot import StubServerTestCase
+
+
+def make_event(api_type, elapsed, **kwargs):
+    fields = dict.fromkeys(diffbot.CallEvent._fields)
+    fields.update(api_type=api_type, method="GET", elapsed=elapsed, retries=0, **kwargs)
+    return diffbot.CallEvent(**fields)
+
+
+class HookTests(StubServerTestCase):
+    latency = 0.02
+
+    def test_event_per_call(self):
+        events = []
+        policy = diffbot.RetryPolicy(2, sleep=lambda _: None)
+        with diffbot.SingleFetcher("token", hooks=[events.append], retry_policy=policy) as fetcher:
+            fetcher.fetch_raw_data("article", "http://example.com/")
+            self.server.inject_error(502)
+            with self.assertRaises(DiffbotResponseError):
+                fetcher.fetch_raw_data("article", "http://example.com/error")
+
+        first, second = events
+        self.assertEqual((first.api_type, first.status, first.retries, first.error), ("article", 200, 0, None))
+        self.assertGreater(first.connect, 0)
+        self.assertGreaterEqual(first.ttfb, 0.02)
+        self.assertGreater(first.response_bytes, 0)
+        self.assertGreaterEqual(first.elapsed, first.connect + first.ttfb + first.download)
+        self.assertEqual((second.error_code, second.retries), (500, 1))
+        self.assertEqual(second.connect, 0)
+
+    def test_no_hook_no_trace(self):
+        with diffbot.SingleFetcher("token") as fetcher:
+            fetcher.fetch_raw_data("article", "http://example.com/")
+        self.assertEqual(fetcher.hooks, [])
+
+
+class HistogramCollectorTests(unittest.TestCase):
+
+    def test_percentiles_and_prometheus(self):
+        collector = diffbot.HistogramCollector(buckets=(0.1, 1.0))
+        for i in range(1, 101):
+            collector(make_event("article", i / 100, response_bytes=10))
+        collector(make_event("bulk", 2.0, error=DiffbotResponseError(429, "Too many requests"), error_code=429))
+
+        self.assertEqual(collector.percentiles("article"), {"p50": 0.5, "p95": 0.95, "p99": 0.99})
+        self.assertEqual(collector.summary()["bulk"]["errors"], 1)
+
+        text = collector.to_prometheus()
+        self.assertIn('diffbot_request_duration_seconds_bucket{api_type="article",le="0.1"} 10', text)
+        self.assertIn('diffbot_request_duration_seconds_bucket{api_type="article",le="+Inf"} 100', text)
+        self.assertIn('diffbot_request_duration_seconds_count{api_type="bulk"} 1', text)
+        self.assertIn('diffbot_response_bytes_total{api_type="article"} 1000', text)
+        self.assertIn('diffbot_errors_total{api_type="bulk",code="429"} 1', text)
+
+
+if __name__ == "__main__":
+    unittest.main()
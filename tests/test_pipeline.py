@@ -0,0 +1,105 @@
+import json
+import os
+import unittest
+from concurrent import futures
+
+import diffbot
+from diffbot.error import DiffbotResponseError, DiffbotTokenError
+from tests.test_diffbot import StubServerTestCase
+
+
+def title_length(raw):
+    if b"fail" in raw:
+        raise ValueError("transform failed")
+    return len(json.loads(raw)["objects"][0]["title"])
+
+
+def exit_process(raw):
+    os._exit(1)
+
+
+class PipelineTests(StubServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.fetcher = diffbot.SingleFetcher("token")
+        self.addCleanup(self.fetcher.close)
+
+    def test_results_and_failures(self):
+        urls = ["http://example.com/{}".format(i) for i in range(20)] + ["http://example.com/error", "http://example.com/fail"]
+        pipeline = diffbot.Pipeline(self.fetcher, title_length, io_workers=4, cpu_workers=2, queue_size=4)
+
+        results = dict(pipeline.run(iter(urls)))
+
+        self.assertEqual(len(results), 22)
+        self.assertEqual(results["http://example.com/3"], len("title of http://example.com/3"))
+        self.assertIsInstance(results["http://example.com/error"], DiffbotResponseError)
+        self.assertIsInstance(results["http://example.com/fail"], ValueError)
+        stats = pipeline.stats()
+        self.assertEqual((stats["fetch"]["count"], stats["fetch"]["errors"]), (22, 1))
+        self.assertEqual((stats["transform"]["count"], stats["transform"]["errors"]), (21, 1))
+        self.assertEqual(stats["transform"]["in_flight"], 0)
+        self.assertGreater(stats["transform"]["per_second"], 0)
+
+    def test_stop_drains_taken_urls(self):
+        taken = []
+
+        def urls():
+            for i in range(1000):
+                taken.append(i)
+                yield "http://example.com/{}".format(i)
+
+        pipeline = diffbot.Pipeline(self.fetcher, title_length, io_workers=2, cpu_workers=1, queue_size=2)
+        results = []
+        for url, result in pipeline.run(urls()):
+            results.append(url)
+            if len(results) == 3:
+                pipeline.stop()
+
+        self.assertLess(len(taken), 1000)
+        # every url taken before stop is yielded
+        self.assertEqual(len(results), len(taken))
+
+    def test_close_without_drain(self):
+        pipeline = diffbot.Pipeline(self.fetcher, title_length, io_workers=2, cpu_workers=1, queue_size=2)
+        run = pipeline.run("http://example.com/{}".format(i) for i in range(1000))
+        next(run)
+        run.close()
+        self.assertLess(pipeline.stats()["fetch"]["count"], 1000)
+
+    def test_unexpected_fetch_error_is_a_result(self):
+        pool = diffbot.TokenPool(["a"])
+        pool.cool_down("a", 60)
+        fetcher = diffbot.SingleFetcher(pool)
+        self.addCleanup(fetcher.close)
+        pipeline = diffbot.Pipeline(fetcher, title_length, io_workers=2, cpu_workers=1, queue_size=2)
+
+        results = dict(pipeline.run("http://example.com/{}".format(i) for i in range(5)))
+
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(isinstance(result, DiffbotTokenError) for result in results.values()))
+
+    def test_error_of_urls_is_raised(self):
+
+        def urls():
+            yield "http://example.com/0"
+            raise OSError("broken url file")
+
+        pipeline = diffbot.Pipeline(self.fetcher, title_length, io_workers=2, cpu_workers=1)
+        results = []
+        with self.assertRaises(OSError):
+            for url, _ in pipeline.run(urls()):
+                results.append(url)
+        self.assertEqual(results, ["http://example.com/0"])
+
+    def test_dead_worker_process(self):
+        pipeline = diffbot.Pipeline(self.fetcher, exit_process, io_workers=2, cpu_workers=1, queue_size=2)
+
+        results = dict(pipeline.run("http://example.com/{}".format(i) for i in range(10)))
+
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(isinstance(result, futures.process.BrokenProcessPool) for result in results.values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import threading
+import unittest
+from unittest import mock
+
+import diffbot
+from tests.test_diffbot import StubServerTestCase
+
+
+class FakeClock():
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class RateLimiterTests(unittest.TestCase):
+
+    def test_burst_then_rate(self):
+        clock = FakeClock()
+        limiter = diffbot.RateLimiter(2, burst=3, clock=clock, sleep=clock.sleep)
+
+        for _ in range(5):
+            with limiter.limit("article"):
+                pass
+
+        self.assertEqual(clock.sleeps, [0.5, 0.5])
+        self.assertEqual(limiter.stats()["calls"], 5)
+        self.assertEqual(limiter.stats()["max_wait"], 0.5)
+
+    def test_per_api_type(self):
+        clock = FakeClock()
+        limiter = diffbot.RateLimiter(100, per_api_type={"bulk": (0.5, 1)}, clock=clock, sleep=clock.sleep)
+
+        for api_type in ["bulk", "article", "bulk/data", "article"]:
+            with limiter.limit(api_type):
+                pass
+
+        self.assertEqual(clock.sleeps, [2.0])
+
+    def test_fractional_rate(self):
+        clock = FakeClock()
+        limiter = diffbot.RateLimiter(per_api_type={"bulk": 0.5}, clock=clock, sleep=clock.sleep)
+        with limiter.limit("bulk"):
+            pass
+        with limiter.limit("bulk"):
+            pass
+        self.assertEqual(clock.sleeps, [2.0])
+        # after idling, a call goes at once
+        clock.now += 3600
+        with limiter.limit("bulk"):
+            pass
+        self.assertEqual(clock.sleeps, [2.0])
+
+    def test_max_in_flight(self):
+        limiter = diffbot.RateLimiter(max_in_flight=1)
+        entered = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with limiter.limit("article"):
+                entered.set()
+                release.wait()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        entered.wait()
+        waiter = threading.Thread(target=lambda: limiter.limit("article").__enter__())
+        waiter.start()
+        while limiter.queue_depth == 0:
+            pass
+        self.assertEqual(limiter.in_flight, 1)
+        release.set()
+        thread.join()
+        waiter.join()
+        self.assertEqual(limiter.queue_depth, 0)
+
+    def test_for_token_is_shared(self):
+        self.assertIs(diffbot.RateLimiter.for_token("token-a", rate=1), diffbot.RateLimiter.for_token("token-a"))
+        self.assertIsNot(diffbot.RateLimiter.for_token("token-a"), diffbot.RateLimiter.for_token("token-b"))
+
+
+class ClientSlotTests(StubServerTestCase):
+
+    def test_slot_held_while_reading_body(self):
+        limiter = diffbot.RateLimiter(max_in_flight=1)
+        in_flight = []
+        with diffbot.SingleFetcher("token", rate_limiter=limiter) as fetcher:
+            read = fetcher.transfer.read
+
+            def recording_read(response, *args):
+                in_flight.append(limiter.in_flight)
+                return read(response, *args)
+
+            with mock.patch.object(fetcher.transfer, "read", recording_read):
+                fetcher.fetch_raw_data("article", "http://example.com/")
+        self.assertEqual(in_flight, [1])
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_slot_held_until_stream_is_closed(self):
+        self.server.add_generated_job("bulk", 10)
+        limiter = diffbot.RateLimiter(max_in_flight=1)
+        with diffbot.BulkJobOperator("token", "bulk", rate_limiter=limiter) as operator:
+            objects = operator.iter_raw_data()
+            next(objects)
+            self.assertEqual(limiter.in_flight, 1)
+            objects.close()
+            self.assertEqual(limiter.in_flight, 0)
+            self.assertEqual(len(list(operator.iter_raw_data())), 10)
+            self.assertEqual(limiter.in_flight, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import gzip
+import json
+import unittest
+import zlib
+
+from diffbot.error import DiffbotResponseError, DiffbotUnexpectedBodyError
+from diffbot.stream import iter_csv_rows, iter_json_array
+from diffbot.transfer import get_decoder
+
+
+def split(body, size):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+class StreamTests(unittest.TestCase):
+
+    def test_json_array_in_any_chunk_size(self):
+        objects = [{"i": i, "s": 'x"\\\\"y],[{}' * i, "n": [1, {"b": []}]} for i in range(20)] + [1, "str,]", None]
+        body = json.dumps(objects).encode()
+        for size in (1, 2, 5, 64, len(body)):
+            self.assertEqual(list(iter_json_array(split(body, size))), objects)
+
+    def test_empty_array(self):
+        self.assertEqual(list(iter_json_array([b" [", b" ] "])), [])
+
+    def test_error_object(self):
+        with self.assertRaises(DiffbotResponseError):
+            list(iter_json_array(split(b'{"error": "Not authorized", "errorCode": 401}', 3)))
+
+    def test_truncated_array(self):
+        with self.assertRaises(DiffbotUnexpectedBodyError):
+            list(iter_json_array([b'[{"a": 1}, {"b"']))
+
+    def test_csv_rows(self):
+        body = 'a,b\r\n1,"x\ny"\r\n2,é\r\n'.encode()
+        self.assertEqual(list(iter_csv_rows(split(body, 3))), [{"a": "1", "b": "x\ny"}, {"a": "2", "b": "é"}])
+
+
+class DecoderTests(unittest.TestCase):
+    body = b"".join(b'{"i": %d, "text": "%s"}' % (i, b"x" * i) for i in range(300))
+
+    def decode(self, encoding, data, max_length=0):
+        decoder = get_decoder(encoding)
+        pieces = [piece for chunk in split(data, 100) for piece in decoder.decompress(chunk, max_length)]
+        pieces.append(decoder.flush())
+        return pieces
+
+    def test_encodings(self):
+        raw_deflate = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        cases = {
+            None: self.body,
+            "gzip": gzip.compress(self.body),
+            "deflate": zlib.compress(self.body),
+            "identity": self.body,
+            "gzip, gzip": gzip.compress(gzip.compress(self.body)),
+        }
+        for encoding, data in cases.items():
+            self.assertEqual(b"".join(self.decode(encoding, data)), self.body, encoding)
+        data = raw_deflate.compress(self.body) + raw_deflate.flush()
+        self.assertEqual(b"".join(self.decode("deflate", data)), self.body)
+
+    def test_bounded_pieces(self):
+        pieces = self.decode("gzip", gzip.compress(self.body), max_length=64)
+        self.assertEqual(b"".join(pieces), self.body)
+        self.assertLessEqual(max(map(len, pieces)), 64)
+
+    def test_unsupported(self):
+        with self.assertRaises(DiffbotUnexpectedBodyError):
+            get_decoder("compress")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import threading
+import unittest
+
+import requests
+
+import diffbot
+from tests.test_diffbot import StubServerTestCase
+
+
+class WebhookReceiverTests(StubServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server.add_job("bulk", [{"type": "article", "pageUrl": "http://example.com/{}".format(i), "title": str(i)}
+                                     for i in range(3)])
+        self.operator = diffbot.BulkJobOperator("token", "bulk")
+        self.addCleanup(self.operator.close)
+
+    def notify(self, url, job_name="bulk", status=9, **kwargs):
+        body = {"jobs": [{"name": job_name, "type": "bulk", "jobStatus": {"status": status, "message": "done"}}]}
+        return requests.post(url, data=json.dumps(body), headers={"X-Crawl-Name": job_name}, **kwargs).status_code
+
+    def test_queue_streams_data_without_status_call(self):
+        with diffbot.WebhookReceiver([self.operator]) as receiver:
+            self.assertEqual(self.notify(receiver.url, status=1), 200)
+            self.assertEqual(self.notify(receiver.url), 200)
+            self.assertEqual(self.notify(receiver.url, job_name="other"), 404)
+            notifications = list(receiver.notifications(timeout=0.2))
+
+        self.assertEqual([(n.job_name, n.status) for n in notifications], [("bulk", 9)])
+        titles = [ext.get_title() for ext in notifications[0].operator.lazy_fetch_extractors()]
+        self.assertEqual(titles, ["0", "1", "2"])
+        self.assertEqual([path for _, path, _ in self.server.requests], ["/v3/bulk/data"])
+
+    def test_callback_and_secret(self):
+        received = threading.Event()
+        titles = []
+
+        def callback(notification):
+            titles.extend(ext.get_title() for ext in notification.operator.lazy_fetch_extractors())
+            received.set()
+            raise ValueError("failed callback")
+
+        with diffbot.WebhookReceiver([self.operator], callback=callback, secret="s3cret") as receiver:
+            self.assertEqual(self.notify(receiver.url), 403)
+            self.assertEqual(self.notify(receiver.webhook_url()), 200)
+            self.assertTrue(received.wait(2))
+        self.assertEqual(titles, ["0", "1", "2"])
+        self.assertIsInstance(receiver.errors[0][1], ValueError)
+
+    def test_async_iteration(self):
+
+        async def receive():
+            async with diffbot.WebhookReceiver([self.operator]) as receiver:
+                notifications = receiver.__aiter__()
+                loop = asyncio.get_running_loop()
+                status = await loop.run_in_executor(None, self.notify, receiver.url)
+                notification = await asyncio.wait_for(notifications.__anext__(), 2)
+                await notifications.aclose()
+            return status, notification
+
+        status, notification = asyncio.run(receive())
+        self.assertEqual((status, notification.job_name, notification.operator), (200, "bulk", self.operator))
+
+
+if __name__ == "__main__":
+    unittest.main()